@@ -0,0 +1,193 @@
+"""
+BRISK Red-Flag Scoring Benchmark
+---------------------------------
+Times red-flag scoring over a whole conversation replayed the way
+/triage sees it, and checks every scorer produces the SAME score as the
+original nested keyword loop for every pathway before timing anything --
+a faster scorer that disagrees with the clinical rules is worthless.
+
+Two comparisons are timed.
+
+1. Scoring ONE answer, by answer length:
+  loop         answer_red_flag_weight -- the tier loop of `kw in text`
+               checks /triage uses
+  compiled     each pathway's trigger tiers compiled into one
+               KeywordMatcher (keyword_matcher.py, plain substrings), the
+               weight taken from the first tier among its labels -- the
+               single-pass engine the red-flag rules could use instead
+  The tier lists are short (7-22 phrases per pathway), and CPython's
+  substring search is fast, so the compiled matcher doesn't pay: it is
+  roughly even (0.9-1.2x) on answers up to a couple of hundred
+  characters, and about half the loop's speed on 400+ character ones.
+  That is why main.py keeps the loop.
+
+2. Scoring turn N of a conversation:
+  re-post      calculate_red_flag_score over all N answers, as a client
+               that re-posts all_answers on every call makes /triage do
+  incremental  TriageHistory (incremental=true sessions), which keeps a
+               running score and only scores the newest answer
+
+Every answer is new text, so nothing is helped by memoisation.
+
+Run from the repo root:
+    python bench_red_flags.py > bench_output.txt
+
+main.py imports emergency_call.py, which reads its Twilio settings at
+import time; placeholder values are filled in here (only if unset) so the
+benchmark runs without real credentials. Importing main opens no files
+and starts nothing (the dispatcher and the event writer's spool only
+start with the app's lifespan), and no calls are ever placed.
+"""
+
+import os
+import random
+import time
+
+for _var, _value in {
+    "TWILIO_ACCOUNT_SID": "AC" + "0" * 32,
+    "TWILIO_AUTH_TOKEN": "benchmark",
+    "TWILIO_PHONE_NUMBER": "+10000000000",
+    "CLINICAL_CONTACT_NUMBER": "+10000000000",
+    "PUBLIC_BASE_URL": "http://localhost",
+}.items():
+    os.environ.setdefault(_var, _value)
+
+from keyword_matcher import KeywordMatcher  # noqa: E402
+from main import (  # noqa: E402
+    AnswerEntry, QUESTION_MAP, TriageHistory, answer_red_flag_weight, calculate_red_flag_score, red_flag_rules,
+)
+
+ANSWER_SNIPPETS = [
+    "yes it started this morning and it has been getting worse since",
+    "no, not really, I don't think so",
+    "I feel a bit drowsy and there is some nausea but no vomiting",
+    "the pain is like pressure and it goes to my left arm sometimes",
+    "I have had a fever of about 38 and a cough for two days",
+    "I'm alone at home right now, no one with me",
+    "it came on suddenly while I was sitting watching television",
+    "I took my usual medication this morning, nothing different",
+]
+CONVERSATION_LENGTHS = [5, 15, 30, 60]
+SESSIONS = 5
+ANSWER_LENGTHS = [1, 2, 4, 8, 16]  # snippets per answer
+ANSWERS_PER_LENGTH = 300
+
+# Tier index -> weight lookups for the compiled scorer, one matcher per pathway.
+COMPILED_TIERS = {
+    pathway: KeywordMatcher({i: keywords for i, (_, keywords) in enumerate(rules["triggers"])}, word_start=False)
+    for pathway, rules in red_flag_rules.items()
+}
+
+
+def compiled_red_flag_weight(answer, pathway):
+    """answer_red_flag_weight() as one pass of a compiled matcher."""
+    tiers = COMPILED_TIERS.get(pathway, COMPILED_TIERS["other"]).labels(answer)
+    if not tiers:
+        return 0
+    rules = red_flag_rules.get(pathway, red_flag_rules["other"])
+    return rules["triggers"][min(tiers)][0]
+
+
+def legacy_calculate_red_flag_score(all_answers, pathway):
+    """The original nested loop, kept verbatim for comparison."""
+    rules = red_flag_rules.get(pathway, red_flag_rules["other"])
+    score = 0
+    for entry in all_answers:
+        answer_lower = entry.answer.lower()
+        for weight, keywords in rules["triggers"]:
+            if any(kw in answer_lower for kw in keywords):
+                score += weight
+                break
+    return max(score, 0)
+
+
+def build_conversation(length, rng, salt=0):
+    """Answers are made unique (turn number + salt) so every one is new text."""
+    questions = [q for qs in QUESTION_MAP.values() for q in qs]
+    return [
+        AnswerEntry(
+            question=rng.choice(questions),
+            answer=f"{' '.join(rng.sample(ANSWER_SNIPPETS, 2))} ({salt}.{turn})",
+        )
+        for turn in range(length)
+    ]
+
+
+def replay_reposted(conversation, pathway):
+    return [calculate_red_flag_score(conversation[:turn], pathway) for turn in range(1, len(conversation) + 1)]
+
+
+def replay_incremental(conversation, pathway):
+    history = TriageHistory()
+    scores = []
+    for entry in conversation:
+        history.append(entry.question, entry.answer)
+        scores.append(history.red_flag_score(pathway))
+    return scores
+
+
+def build_answers(snippets, count, rng):
+    return [f"{' '.join(rng.choice(ANSWER_SNIPPETS) for _ in range(snippets))} ({i})" for i in range(count)]
+
+
+def main():
+    rng = random.Random(0)
+    pathways = list(red_flag_rules)
+
+    for snippets in ANSWER_LENGTHS:
+        for answer in build_answers(snippets, ANSWERS_PER_LENGTH, rng):
+            for pathway in pathways:
+                expected = legacy_calculate_red_flag_score([AnswerEntry(question="", answer=answer)], pathway)
+                assert answer_red_flag_weight(answer, pathway) == expected
+                assert compiled_red_flag_weight(answer, pathway) == expected, (pathway, answer)
+
+    print("one answer, all pathways")
+    print(f"{'chars':>8} {'loop us':>12} {'compiled us':>15} {'speedup':>8}")
+    for snippets in ANSWER_LENGTHS:
+        answers = build_answers(snippets, ANSWERS_PER_LENGTH, rng)
+        loop = _time_answers(answer_red_flag_weight, answers, pathways)
+        compiled = _time_answers(compiled_red_flag_weight, answers, pathways)
+        calls = len(answers) * len(pathways)
+        chars = sum(map(len, answers)) // len(answers)
+        print(f"{chars:>8} {loop / calls * 1e6:>12.2f} {compiled / calls * 1e6:>15.2f} {loop / compiled:>7.2f}x")
+    print()
+
+    for length in CONVERSATION_LENGTHS:
+        conversation = build_conversation(length, rng)
+        for pathway in pathways:
+            expected = [legacy_calculate_red_flag_score(conversation[:turn], pathway) for turn in range(1, length + 1)]
+            for replay in (replay_reposted, replay_incremental):
+                actual = replay(conversation, pathway)
+                assert actual == expected, f"{replay.__name__}: {pathway} @ {length} answers: {actual} != {expected}"
+
+    print("whole conversation, per pathway")
+    print(f"{'answers':>8} {'re-post us':>12} {'incremental us':>15} {'speedup':>8}")
+    for length in CONVERSATION_LENGTHS:
+        conversations = [build_conversation(length, rng, salt=i) for i in range(SESSIONS)]
+        reposted = _time(replay_reposted, conversations, pathways)
+        incremental = _time(replay_incremental, conversations, pathways)
+        calls = SESSIONS * len(pathways)
+        print(
+            f"{length:>8} {reposted / calls * 1e6:>12.1f} {incremental / calls * 1e6:>15.1f} "
+            f"{reposted / incremental:>7.1f}x"
+        )
+
+
+def _time_answers(score, answers, pathways):
+    start = time.perf_counter()
+    for pathway in pathways:
+        for answer in answers:
+            score(answer, pathway)
+    return time.perf_counter() - start
+
+
+def _time(replay, conversations, pathways):
+    start = time.perf_counter()
+    for conversation in conversations:
+        for pathway in pathways:
+            replay(conversation, pathway)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+BRISK Circuit Breaker Module
+-----------------------------
+Stops us waiting out a full timeout on every call to an upstream that is
+plainly down. Without it, each Geoapify failure costs its whole timeout
+(10 s for clinic search, 6 s for reverse geocoding) -- for every patient,
+all through an outage.
+
+One breaker per upstream, three states:
+  - closed: calls go through. failure_threshold consecutive failures
+    open it. A call slower than slow_call_seconds counts as a failure
+    even if it succeeded -- an upstream answering in 9 s is as good as
+    down for a patient waiting on it.
+  - open: calls are refused instantly (allow() is False), so callers
+    fall straight to their degraded answer -- stale cache, local data,
+    raw coordinates. After reset_seconds the breaker goes half-open.
+  - half_open: exactly one probe call is let through. Success closes
+    the breaker; failure re-opens it for another reset_seconds.
+
+Callers use it around their own call (they report errors as status
+dicts rather than raising, so a wrapping decorator wouldn't see them):
+
+    if not breaker.allow():
+        return degraded_answer
+    started = time.perf_counter()
+    try:
+        ... call upstream ...
+        breaker.record_success(time.perf_counter() - started)
+    except Exception:
+        breaker.record_failure()
+
+A call that allow() let through but that the caller then doesn't make
+after all (e.g. the quota refused it) must call release(), or a
+half-open breaker's one probe slot stays taken until reset_seconds.
+
+Every state transition increments
+circuit_breaker_<name>_<from>_to_<to> in /metrics, and each breaker's
+current state is reported under stats.circuit_breakers.
+
+Optional environment variables (e.g. in Railway), read by from_env():
+    <PREFIX>_FAILURES         (default 5 consecutive failures)
+    <PREFIX>_RESET_SECONDS    (default 30)
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_breakers: Dict[str, "CircuitBreaker"] = {}
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0,
+                 slow_call_seconds: Optional[float] = None):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = reset_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+        _breakers[name] = self
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if now - self._opened_at < self.reset_seconds:
+                    self.rejected += 1
+                    return False
+                self._transition(HALF_OPEN)
+            # Half-open: one probe at a time. A probe that never reported
+            # back (its caller died) stops blocking after reset_seconds.
+            if self._probe_started is not None and now - self._probe_started < self.reset_seconds:
+                self.rejected += 1
+                return False
+            self._probe_started = now
+            return True
+
+    def record_success(self, elapsed_seconds: Optional[float] = None):
+        if self.slow_call_seconds is not None and elapsed_seconds is not None \
+                and elapsed_seconds > self.slow_call_seconds:
+            self.record_failure()
+            return
+        with self._lock:
+            self.consecutive_failures = 0
+            self._probe_started = None
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def release(self):
+        """Gives back an allow() that wasn't used: no call was made, so no
+        verdict either way. Frees the half-open probe slot for the next caller."""
+        with self._lock:
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_started = None
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED and self.consecutive_failures >= self.failure_threshold
+            ):
+                self._opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    def _transition(self, new_state: str):
+        metrics.counter(f"circuit_breaker_{self.name}_{self.state}_to_{new_state}").inc()
+        print(f"[circuit_breaker] {self.name}: {self.state} -> {new_state}")
+        self.state = new_state
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected": self.rejected,
+            "failure_threshold": self.failure_threshold,
+            "reset_seconds": self.reset_seconds,
+            "slow_call_seconds": self.slow_call_seconds,
+        }
+
+
+def from_env(name: str, prefix: str, slow_call_seconds: Optional[float] = None) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        failure_threshold=int(os.environ.get(f"{prefix}_FAILURES", "5")),
+        reset_seconds=float(os.environ.get(f"{prefix}_RESET_SECONDS", "30")),
+        slow_call_seconds=slow_call_seconds,
+    )
+
+
+def stats() -> dict:
+    return {name: breaker.stats() for name, breaker in sorted(_breakers.items())}
+
+
+metrics.register_stats("circuit_breakers", stats)
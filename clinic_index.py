@@ -0,0 +1,317 @@
+"""
+BRISK Clinic Index Module
+--------------------------
+Serves /find-walkin-clinics from memory instead of asking Geoapify per
+patient (or per tile, see walkin_clinics.py).
+
+SNAPSHOT: a background job pages through every healthcare.clinic_or_praxis
+place in a box around Saskatchewan (padded past the borders, so a patient
+in Lloydminster or Creighton still sees clinics on the other side) and
+writes them to CLINIC_SNAPSHOT_PATH as JSON, atomically (write + rename).
+The box is split into SNAPSHOT_STEP_DEGREES squares and each square is
+paged SNAPSHOT_PAGE_SIZE at a time, so a full snapshot costs on the order
+of a hundred or so Geoapify requests -- once a day, against the 3,000/day
+free tier. If another worker already wrote a fresh enough snapshot, it is
+loaded instead of fetched again.
+
+INDEX: the snapshot is held as parallel arrays (latitude, longitude in
+radians) bucketed into a grid of GRID_DEGREES cells. A query gathers the
+cells that can hold anything within SEARCH_RADIUS_KM and computes the
+haversine distance to every candidate in one vectorized NumPy expression;
+the ranking is microseconds and touches no network. Without NumPy the
+same thing runs as a plain Python loop (slower, same answers).
+
+The existing Geoapify path (find_nearby_walkin_clinics) stays as the
+refresh source and the fallback: used when no snapshot is loaded, the
+snapshot is older than CLINIC_SNAPSHOT_MAX_AGE_SECONDS, the patient is
+outside Saskatchewan, or a widened search ring (100 or 200 km near the
+border) reaches past the snapshot box. Once the day's Geoapify budget runs short
+(geoapify_quota.py) an over-age snapshot is served anyway -- old clinic
+data beats none -- and the refresh job skips its run.
+
+A snapshot is all or nothing: if any page request fails, the pages
+fetched so far are discarded. So after a failed refresh the job backs
+off exponentially (CLINIC_SNAPSHOT_RETRY_SECONDS, doubling per
+consecutive failure, up to CLINIC_SNAPSHOT_REFRESH_SECONDS) instead of
+retrying hourly -- one persistently failing square would otherwise spend
+~100 bulk requests an hour until clinic search degrades.
+
+Optional environment variables (e.g. in Railway):
+    CLINIC_SNAPSHOT_PATH               JSON file (unset: feature off)
+    CLINIC_SNAPSHOT_REFRESH_SECONDS    (default 86400, i.e. daily)
+    CLINIC_SNAPSHOT_MAX_AGE_SECONDS    (default 259200, i.e. 3 days --
+                                        past this the index isn't used)
+    CLINIC_SNAPSHOT_RETRY_SECONDS      (default 3600; first retry after a
+                                        failed refresh, then doubling)
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional -- the index falls back to pure Python
+    np = None
+
+import geoapify_quota
+import metrics
+from walkin_clinics import (
+    RESULT_LIMIT,
+    SEARCH_RADIUS_KM,
+    clinic_entry,
+    fetch_places_in_rect,
+    haversine_km,
+)
+
+# Saskatchewan's borders are (almost exactly) lines of latitude/longitude.
+SASKATCHEWAN_BOUNDS = (49.0, -110.0, 60.0, -101.36)  # lat_min, lng_min, lat_max, lng_max
+# Padding so the snapshot also covers clinics within SEARCH_RADIUS_KM
+# across the border (~0.25 deg latitude, ~0.4 deg longitude at 49-60 N).
+SNAPSHOT_PADDING = (0.3, 0.5)
+SNAPSHOT_STEP_DEGREES = 1.0
+SNAPSHOT_PAGE_SIZE = 500
+GRID_DEGREES = 0.25
+_EARTH_RADIUS_KM = 6371.0
+
+_lookup_latency = metrics.histogram("clinic_index_lookup_seconds")
+
+
+class ClinicIndex:
+    def __init__(self, places: List[dict], generated_at: float):
+        self.generated_at = generated_at
+        self.places = places
+        self._lat_deg = [p["lat"] for p in places]
+        self._lng_deg = [p["lng"] for p in places]
+        grid: Dict[Tuple[int, int], List[int]] = {}
+        for i, place in enumerate(places):
+            grid.setdefault(_cell(place["lat"], place["lng"]), []).append(i)
+        if np is not None:
+            self._lat = np.radians(np.asarray(self._lat_deg, dtype=np.float64))
+            self._lng = np.radians(np.asarray(self._lng_deg, dtype=np.float64))
+            self._grid = {cell: np.asarray(rows, dtype=np.int64) for cell, rows in grid.items()}
+        else:
+            self._grid = grid
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    def age_seconds(self) -> float:
+        return time.time() - self.generated_at
+
+    def covers(self, lat: float, lng: float, radius_km: float) -> bool:
+        """Whether the whole radius_km circle is inside the snapshot box --
+        past its edge are clinics the snapshot never fetched."""
+        lat_min, lng_min, lat_max, lng_max = SASKATCHEWAN_BOUNDS
+        pad_lat, pad_lng = SNAPSHOT_PADDING
+        d_lat = radius_km / 111.0
+        d_lng = radius_km / (111.0 * max(math.cos(math.radians(lat + d_lat)), 0.01))
+        return (lat_min - pad_lat <= lat - d_lat and lat + d_lat <= lat_max + pad_lat
+                and lng_min - pad_lng <= lng - d_lng and lng + d_lng <= lng_max + pad_lng)
+
+    def nearest(self, lat: float, lng: float, radius_km: float = SEARCH_RADIUS_KM,
+                limit: int = RESULT_LIMIT) -> List[dict]:
+        """Clinics within radius_km, nearest first, in find_nearby_walkin_clinics' format."""
+        started = time.perf_counter()
+        candidates = self._candidates(lat, lng, radius_km)
+        if np is not None:
+            ranked = self._rank_numpy(candidates, lat, lng, radius_km, limit)
+        else:
+            ranked = self._rank_python(candidates, lat, lng, radius_km, limit)
+        _lookup_latency.observe(time.perf_counter() - started)
+        return [clinic_entry(self.places[i], distance) for i, distance in ranked]
+
+    def _candidates(self, lat: float, lng: float, radius_km: float):
+        d_lat = radius_km / 111.0
+        d_lng = radius_km / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+        lat_lo, lng_lo = _cell(lat - d_lat, lng - d_lng)
+        lat_hi, lng_hi = _cell(lat + d_lat, lng + d_lng)
+        buckets = [
+            self._grid[cell]
+            for cell in ((i, j) for i in range(lat_lo, lat_hi + 1) for j in range(lng_lo, lng_hi + 1))
+            if cell in self._grid
+        ]
+        if np is not None:
+            return np.concatenate(buckets) if buckets else np.empty(0, dtype=np.int64)
+        return [row for bucket in buckets for row in bucket]
+
+    def _rank_numpy(self, rows, lat: float, lng: float, radius_km: float, limit: int):
+        if not len(rows):
+            return []
+        lat1, lng1 = math.radians(lat), math.radians(lng)
+        lat2, lng2 = self._lat[rows], self._lng[rows]
+        a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+        distances = 2 * _EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+        inside = np.nonzero(distances <= radius_km)[0]
+        order = inside[np.argsort(distances[inside], kind="stable")][:limit]
+        return [(int(rows[k]), float(distances[k])) for k in order]
+
+    def _rank_python(self, rows, lat: float, lng: float, radius_km: float, limit: int):
+        scored = []
+        for row in rows:
+            distance = haversine_km(lat, lng, self._lat_deg[row], self._lng_deg[row])
+            if distance <= radius_km:
+                scored.append((distance, row))
+        scored.sort()
+        return [(row, distance) for distance, row in scored[:limit]]
+
+
+def _cell(lat: float, lng: float) -> Tuple[int, int]:
+    return int(math.floor(lat / GRID_DEGREES)), int(math.floor(lng / GRID_DEGREES))
+
+
+def in_saskatchewan(lat: float, lng: float) -> bool:
+    lat_min, lng_min, lat_max, lng_max = SASKATCHEWAN_BOUNDS
+    return lat_min <= lat <= lat_max and lng_min <= lng <= lng_max
+
+
+# ── snapshot ────────────────────────────────────────────────────────────
+def fetch_snapshot() -> dict:
+    """
+    Pages every clinic in the padded Saskatchewan box out of Geoapify.
+    Returns {"status": "success", "places": [...], "requests": n} or the
+    first error status (a partial snapshot is never returned -- it would
+    silently hide clinics).
+    """
+    lat_min, lng_min, lat_max, lng_max = SASKATCHEWAN_BOUNDS
+    pad_lat, pad_lng = SNAPSHOT_PADDING
+    lat_min, lat_max = lat_min - pad_lat, lat_max + pad_lat
+    lng_min, lng_max = lng_min - pad_lng, lng_max + pad_lng
+
+    places: Dict[str, dict] = {}
+    requests = 0
+    lat = lat_min
+    while lat < lat_max:
+        lng = lng_min
+        while lng < lng_max:
+            offset = 0
+            while True:
+                page = fetch_places_in_rect(
+                    lat, lng,
+                    min(lat + SNAPSHOT_STEP_DEGREES, lat_max), min(lng + SNAPSHOT_STEP_DEGREES, lng_max),
+                    SNAPSHOT_PAGE_SIZE, offset,
+                )
+                requests += 1
+                if page["status"] != "success":
+                    return page
+                for place in page["places"]:
+                    # Squares share their edges -- keep each place once.
+                    places[place["id"] or f"{place['lat']},{place['lng']}"] = place
+                if len(page["places"]) < SNAPSHOT_PAGE_SIZE:
+                    break
+                offset += SNAPSHOT_PAGE_SIZE
+            lng += SNAPSHOT_STEP_DEGREES
+        lat += SNAPSHOT_STEP_DEGREES
+    return {"status": "success", "places": list(places.values()), "requests": requests}
+
+
+def write_snapshot(path: str, places: List[dict], generated_at: float):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"generated_at": generated_at, "places": places}, f)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str) -> Optional[ClinicIndex]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return ClinicIndex(data["places"], float(data["generated_at"]))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[clinic_index] could not read snapshot {path}: {e}")
+        return None
+
+
+# ── process-wide index + refresh job ────────────────────────────────────
+_index: Optional[ClinicIndex] = None
+_refresh_failures = 0
+
+
+def get_clinic_index(any_age: bool = False) -> Optional[ClinicIndex]:
+    """The loaded index if it's recent enough to serve from (or at all, with
+    any_age -- used once the Geoapify quota is running out), else None."""
+    index = _index
+    if index is None or any_age:
+        return index
+    max_age = float(os.environ.get("CLINIC_SNAPSHOT_MAX_AGE_SECONDS", "259200"))
+    return index if index.age_seconds() <= max_age else None
+
+
+def refresh_snapshot(path: str, refresh_seconds: float) -> dict:
+    """
+    Loads the snapshot file, and fetches + writes a new one first if the
+    file is missing or older than refresh_seconds. Blocking; never raises.
+    """
+    global _index
+    try:
+        index = read_snapshot(path)
+        if index is None or index.age_seconds() > refresh_seconds:
+            if geoapify_quota.clinic_search_degraded():
+                if index is not None:
+                    _index = index
+                return {"status": "skipped", "reason": "Geoapify daily quota running short"}
+            fetched = fetch_snapshot()
+            if fetched["status"] != "success":
+                print(f"[clinic_index] snapshot refresh failed: {fetched.get('reason')}")
+                if index is not None:
+                    _index = index
+                return fetched
+            generated_at = time.time()
+            write_snapshot(path, fetched["places"], generated_at)
+            index = ClinicIndex(fetched["places"], generated_at)
+            print(f"[clinic_index] snapshot of {len(index)} clinics written to {path} "
+                  f"({fetched['requests']} Geoapify requests)")
+        _index = index
+        return {"status": "success", "clinics": len(index), "generated_at": index.generated_at}
+    except Exception as e:
+        print(f"[clinic_index] refresh_snapshot failed: {e}")
+        return {"status": "error", "reason": str(e)}
+
+
+async def run_snapshot_job():
+    """Refreshes the snapshot now and then every CLINIC_SNAPSHOT_REFRESH_SECONDS.
+    Started from the app lifespan; returns at once if the feature is off."""
+    path = os.environ.get("CLINIC_SNAPSHOT_PATH")
+    if not path:
+        return
+    global _refresh_failures
+    refresh_seconds = float(os.environ.get("CLINIC_SNAPSHOT_REFRESH_SECONDS", "86400"))
+    while True:
+        result = await asyncio.to_thread(refresh_snapshot, path, refresh_seconds)
+        if result["status"] in ("success", "skipped"):
+            _refresh_failures = 0
+        else:
+            _refresh_failures += 1
+        delay = snapshot_retry_delay(_refresh_failures, refresh_seconds)
+        if _refresh_failures:
+            print(f"[clinic_index] {_refresh_failures} failed refresh(es) in a row -- next try in {delay:.0f}s")
+        await asyncio.sleep(delay)
+
+
+def snapshot_retry_delay(failures: int, refresh_seconds: float) -> float:
+    """Seconds until the job's next run: the hourly check normally, or an
+    exponential backoff after consecutive failed refreshes."""
+    check = min(refresh_seconds, 3600)
+    if not failures:
+        return check
+    retry = float(os.environ.get("CLINIC_SNAPSHOT_RETRY_SECONDS", "3600"))
+    return min(retry * 2 ** (failures - 1), max(refresh_seconds, check))
+
+
+def snapshot_stats() -> dict:
+    index = _index
+    return {
+        "loaded": index is not None,
+        "clinics": len(index) if index else 0,
+        "age_seconds": round(index.age_seconds()) if index else None,
+        "refresh_failures": _refresh_failures,
+        "numpy": np is not None,
+    }
+
+
+metrics.register_stats("clinic_index", snapshot_stats)
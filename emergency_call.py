@@ -24,6 +24,10 @@ Requires these environment variables to be set (e.g. in Railway):
                                   https://triage-backend-production.up.railway.app)
     ENABLE_911_AUTODIAL          ("true" to enable the parallel 911 call;
                                   any other value, or unset, keeps it OFF)
+Optional:
+    TWILIO_HTTP_TIMEOUT_SECONDS  (default 10; per-request timeout on the
+                                  Twilio REST API, so a hung connection
+                                  can't hold a dispatch worker forever)
 
 HONEST LIMITATION (confirmed via research, see conversation): since the
 Twilio number isn't registered to one single fixed address (it can't be,
@@ -37,10 +41,17 @@ the way a patient's own phone/carrier does automatically.
 """
 
 import os
+from functools import partial
+from typing import Callable, Dict, Optional
 from urllib.parse import quote
+from requests.exceptions import ConnectTimeout
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
 from twilio.twiml.voice_response import VoiceResponse
 
+from emergency_dedup import create_emergency_dedup
+
 # --- Twilio client setup -----------------------------------------------
 TWILIO_ACCOUNT_SID = os.environ["TWILIO_ACCOUNT_SID"]
 TWILIO_AUTH_TOKEN = os.environ["TWILIO_AUTH_TOKEN"]
@@ -52,19 +63,25 @@ PUBLIC_BASE_URL = os.environ["PUBLIC_BASE_URL"]
 # set to the string "true" in Railway to activate. See module docstring.
 ENABLE_911_AUTODIAL = os.environ.get("ENABLE_911_AUTODIAL", "").lower() == "true"
 
-client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+client = Client(
+    TWILIO_ACCOUNT_SID,
+    TWILIO_AUTH_TOKEN,
+    http_client=TwilioHttpClient(timeout=float(os.environ.get("TWILIO_HTTP_TIMEOUT_SECONDS", "10"))),
+)
+
+CALL_911_DISABLED = {"status": "disabled", "reason": "ENABLE_911_AUTODIAL not set to true"}
 
-# Simple in-memory guard so the same patient session doesn't trigger
-# multiple calls for the SAME symptom if severity is re-submitted (e.g. a
-# duplicate render, a double-tap). Tracks (session_id, symptom) pairs, NOT
+# Guard so the same patient session doesn't trigger multiple calls for
+# the SAME symptom if severity is re-submitted (e.g. a duplicate render, a
+# double-tap). Tracks (session_id, symptom) pairs, NOT
 # session_id alone -- an earlier version only tracked session_id, which
 # caused a real bug: after the first auto-10 symptom fired a call, EVERY
 # subsequent symptom in that same browsing session was silently blocked,
 # even genuinely different ones (e.g. selecting "Seizure or fitting" after
-# already having triggered a call for "Worst headache of my life"). For
-# production, replace this with a database-backed check (e.g. a
-# "call_triggered" flag on the patient session record in Supabase/Postgres).
-_already_called_session_symptoms = set()
+# already having triggered a call for "Worst headache of my life"). Claims
+# expire after a TTL and can be shared across workers/replicas -- see
+# emergency_dedup.py for the backends.
+_dedup = create_emergency_dedup()
 
 
 def trigger_emergency_call(session_id: str, severity: int, symptom: str,
@@ -87,27 +104,89 @@ def trigger_emergency_call(session_id: str, severity: int, symptom: str,
     Returns:
         dict with call status info for both calls attempted.
     """
+    skipped = claim_emergency_call(session_id, severity, symptom)
+    if skipped:
+        return skipped
+
+    results = {name: place() for name, place in emergency_call_legs(severity, symptom, location).items()}
+    return summarize_call_results(results)
+
+
+ALREADY_CALLED = {"status": "skipped", "reason": "call already placed for this symptom in this session"}
+
+
+def claim_emergency_call(session_id: str, severity: int, symptom: str, shared: bool = True) -> Optional[dict]:
+    """
+    The threshold + dedup check on its own, for callers that place the
+    calls themselves (see emergency_dispatch.py). Returns a "skipped"
+    status dict if no call should be placed; otherwise claims the
+    (session_id, symptom) pair and returns None.
+
+    The pair is claimed BEFORE the calls are placed, so a duplicate
+    submission that arrives while the first calls are still ringing out
+    is skipped too, rather than dialling everyone a second time.
+
+    shared=False only checks this process (no I/O) -- the caller must
+    then call claim_shared_emergency_call() before dialling.
+    """
     if severity < 9:
         return {"status": "skipped", "reason": "severity below threshold"}
 
-    dedup_key = (session_id, symptom)
-    if dedup_key in _already_called_session_symptoms:
-        return {"status": "skipped", "reason": "call already placed for this symptom in this session"}
+    dedup_key = _dedup.key(session_id, symptom)
+    if not _dedup.claim_local(dedup_key):
+        return ALREADY_CALLED
+    if shared and not _dedup.claim_shared(dedup_key):
+        return ALREADY_CALLED
+    return None
+
+
+def release_emergency_call(session_id: str, symptom: str):
+    """
+    Undoes claim_emergency_call(..., shared=False) for a caller that took
+    the claim but then couldn't place or queue the calls -- otherwise its
+    own fallback (trigger_emergency_call) would be skipped as a duplicate
+    and the emergency call lost.
+    """
+    _dedup.release_local(_dedup.key(session_id, symptom))
 
+
+def claim_shared_emergency_call(session_id: str, symptom: str) -> bool:
+    """
+    The cross-worker half of claim_emergency_call(..., shared=False). May
+    do network I/O (Supabase, bounded by EMERGENCY_DEDUP_SHARED_TIMEOUT_MS),
+    so run it off the event loop. True means this worker owns the call
+    and should dial.
+    """
+    return _dedup.claim_shared(_dedup.key(session_id, symptom))
+
+
+def emergency_dedup_stats() -> dict:
+    return _dedup.stats()
+
+
+def emergency_call_legs(severity: int, symptom: str, location: str) -> Dict[str, Callable[[], dict]]:
+    """
+    The independent calls to place for one emergency, keyed by their name
+    in the result dict: always "clinical_contact_call", plus "call_911"
+    only if ENABLE_911_AUTODIAL is on. Each value is a zero-argument
+    function that places that one call and never raises, so the legs can
+    be run one after another or concurrently. A failed leg's result says
+    whether it is safe to try again ("retryable", see _call_failed).
+    """
     safe_symptom = quote(str(symptom))
     safe_location = quote(str(location))
-
-    clinical_result = _place_clinical_contact_call(severity, safe_symptom, safe_location)
-    call_911_result = None
+    legs = {"clinical_contact_call": partial(_place_clinical_contact_call, severity, safe_symptom, safe_location)}
     if ENABLE_911_AUTODIAL:
-        call_911_result = _place_911_call(severity, safe_symptom, safe_location)
+        legs["call_911"] = partial(_place_911_call, severity, safe_symptom, safe_location)
+    return legs
 
-    _already_called_session_symptoms.add(dedup_key)
 
+def summarize_call_results(results: Dict[str, dict]) -> dict:
+    """Shapes per-leg results into trigger_emergency_call()'s return value."""
     return {
         "status": "call_placed",
-        "clinical_contact_call": clinical_result,
-        "call_911": call_911_result if call_911_result else {"status": "disabled", "reason": "ENABLE_911_AUTODIAL not set to true"},
+        "clinical_contact_call": results.get("clinical_contact_call"),
+        "call_911": results.get("call_911") or CALL_911_DISABLED,
     }
 
 
@@ -128,7 +207,7 @@ def _place_clinical_contact_call(severity: int, safe_symptom: str, safe_location
         return {"status": "placed", "call_sid": call.sid}
     except Exception as e:
         print(f"[emergency_call] Clinical contact call failed: {e}")
-        return {"status": "error", "reason": str(e)}
+        return _call_failed(e)
 
 
 def _place_911_call(severity: int, safe_symptom: str, safe_location: str) -> dict:
@@ -150,7 +229,21 @@ def _place_911_call(severity: int, safe_symptom: str, safe_location: str) -> dic
         return {"status": "placed", "call_sid": call.sid}
     except Exception as e:
         print(f"[emergency_call] 911 call failed: {e}")
-        return {"status": "error", "reason": str(e)}
+        return _call_failed(e)
+
+
+def _call_failed(e: Exception) -> dict:
+    """
+    The error status for a failed calls.create. "retryable" is True only
+    when the call was certainly NOT created: Twilio answered with an error
+    (TwilioRestException, a 4xx/5xx), or the connection to it was never
+    made. A read timeout (TWILIO_HTTP_TIMEOUT_SECONDS), a dropped
+    connection or anything else may have come AFTER Twilio accepted the
+    request -- dialling again could ring the same person, or 911, twice.
+    """
+    if isinstance(e, TwilioRestException):
+        return {"status": "error", "reason": str(e), "http_status": e.status, "retryable": True}
+    return {"status": "error", "reason": str(e), "retryable": isinstance(e, ConnectTimeout)}
 
 
 def build_emergency_twiml(severity: str, symptom: str, location: str) -> str:
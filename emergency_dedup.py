@@ -0,0 +1,210 @@
+"""
+BRISK Emergency Call Dedup Module
+----------------------------------
+Decides whether an emergency call for a (session_id, symptom) pair has
+already been placed, replacing the module-level set that emergency_call.py
+used to keep. That set had two problems:
+  - it never forgot anything, so it grew with every red-flag session for
+    the life of the process;
+  - each uvicorn worker/replica had its own copy, so with more than one
+    of them a re-submitted emergency could dial the clinical contact (and
+    911) twice.
+
+Every claim now has a TTL, and the check-and-set is a single atomic
+operation ("claim"): of two concurrent claims for the same key, exactly
+one wins and places the calls.
+
+Two layers:
+  - local: a bounded TTLCache in this process. Always on, and consulted
+    first, so a double-tap landing on the same worker is skipped without
+    any I/O.
+  - shared (optional): a store every worker can see --
+      "sqlite"   -- a local SQLite file; shared by the workers on ONE
+                    machine, NOT across Railway replicas.
+      "supabase" -- the emergency_call_claims table (see
+                    triage_db.claim_emergency_call_key), whose primary key
+                    makes the claim atomic across every replica. This is
+                    the one to use once railway.json numReplicas > 1.
+
+FAILS OPEN: if the shared store can't be reached, the local answer
+stands and the call goes out. A rare duplicate call is acceptable; a
+missed emergency call is not. "Can't be reached" includes "too slow": the
+shared claim gets EMERGENCY_DEDUP_SHARED_TIMEOUT_MS to answer, and past
+that the call goes out anyway -- a Supabase request can otherwise hang
+for the HTTP client's full timeout (two minutes) while a patient waits
+for their emergency call. The claim itself keeps running in its thread
+and is still recorded when the store answers, so later repeats are
+still caught.
+
+Optional environment variables (e.g. in Railway):
+    EMERGENCY_DEDUP_BACKEND      "auto" (default: supabase if SUPABASE_URL
+                                 is set, otherwise memory only), "memory",
+                                 "sqlite" or "supabase"
+    EMERGENCY_DEDUP_TTL_SECONDS  how long a claim blocks repeats
+                                 (default 43200, i.e. 12 hours)
+    EMERGENCY_DEDUP_MAX_ENTRIES  cap on the local layer (default 10000)
+    EMERGENCY_DEDUP_DB_PATH      SQLite file (default emergency_dedup.db)
+    EMERGENCY_DEDUP_SHARED_TIMEOUT_MS  how long to wait for the shared
+                                 claim before failing open (default 300)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional
+
+from ttl_cache import TTLCache
+from triage_db import claim_emergency_call_key
+
+
+class SQLiteClaimBackend:
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS emergency_call_claims ("
+            " dedup_key TEXT PRIMARY KEY,"
+            " claimed_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS emergency_call_claims_expires_at ON emergency_call_claims (expires_at)"
+        )
+
+    def claim(self, dedup_key: str, ttl_seconds: float) -> Optional[bool]:
+        """True if claimed, False if already claimed. Atomic across processes
+        (BEGIN IMMEDIATE takes the database write lock)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM emergency_call_claims WHERE expires_at <= ?", (now,))
+                inserted = self._conn.execute(
+                    "INSERT OR IGNORE INTO emergency_call_claims (dedup_key, claimed_at, expires_at) VALUES (?, ?, ?)",
+                    (dedup_key, now, now + ttl_seconds),
+                ).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return inserted == 1
+
+
+class SupabaseClaimBackend:
+    name = "supabase"
+
+    def claim(self, dedup_key: str, ttl_seconds: float) -> Optional[bool]:
+        """True/False like the SQLite backend, or None if Supabase is unavailable."""
+        result = claim_emergency_call_key(dedup_key, ttl_seconds)
+        if result["status"] == "claimed":
+            return True
+        if result["status"] == "duplicate":
+            return False
+        return None
+
+
+class EmergencyCallDedup:
+    def __init__(self, ttl_seconds: float = 43200, max_entries: int = 10000, shared=None,
+                 shared_timeout_seconds: float = 0.3):
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self.shared_timeout_seconds = shared_timeout_seconds
+        self._local = TTLCache(max_entries, ttl_seconds)
+        # Shared claims run here, so that waiting on a slow store can be
+        # cut short (the thread itself can't be cancelled, only left to finish).
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="emergency-dedup") if shared else None
+        self.duplicates = 0
+        self.shared_errors = 0
+        self.shared_timeouts = 0
+
+    @staticmethod
+    def key(session_id: str, symptom: str) -> str:
+        return json.dumps([session_id, symptom], ensure_ascii=False)
+
+    def claim_local(self, dedup_key: str) -> bool:
+        """The in-process half of claim(): no I/O, safe on the request path."""
+        if self._local.add(dedup_key, True):
+            return True
+        self.duplicates += 1
+        return False
+
+    def release_local(self, dedup_key: str):
+        """Gives a local claim back (the calls were never queued)."""
+        self._local.pop(dedup_key)
+
+    def claim_shared(self, dedup_key: str) -> bool:
+        """
+        The cross-worker half of claim(). Call it after claim_local()
+        succeeded. Returns True (place the calls) if this worker won the
+        claim -- or if there is no shared store, or it failed or didn't
+        answer within shared_timeout_seconds (fail open).
+        """
+        if self.shared is None:
+            return True
+        try:
+            future = self._executor.submit(self.shared.claim, dedup_key, self.ttl_seconds)
+            claimed = future.result(timeout=self.shared_timeout_seconds)
+        except FutureTimeoutError:
+            print(f"[emergency_dedup] shared claim took over {self.shared_timeout_seconds}s -- failing open")
+            self.shared_timeouts += 1
+            claimed = None
+        except Exception as e:
+            print(f"[emergency_dedup] shared claim failed: {e}")
+            claimed = None
+        if claimed is None:
+            self.shared_errors += 1
+            return True
+        if not claimed:
+            self.duplicates += 1
+        return claimed
+
+    def claim(self, dedup_key: str) -> bool:
+        return self.claim_local(dedup_key) and self.claim_shared(dedup_key)
+
+    def stats(self) -> dict:
+        local = self._local.stats()
+        return {
+            "shared_backend": self.shared.name if self.shared else None,
+            "ttl_seconds": self.ttl_seconds,
+            "local_size": local["size"],
+            "local_max_entries": local["max_entries"],
+            "local_evictions": local["evictions"],
+            "duplicates": self.duplicates,
+            "shared_errors": self.shared_errors,
+            "shared_timeouts": self.shared_timeouts,
+        }
+
+
+def create_emergency_dedup() -> EmergencyCallDedup:
+    """
+    Builds the dedup service selected by EMERGENCY_DEDUP_BACKEND. Never
+    raises -- an unknown name or an unopenable SQLite file falls back to
+    the local layer alone (with a log line).
+    """
+    backend = os.environ.get("EMERGENCY_DEDUP_BACKEND", "auto").lower()
+    ttl_seconds = float(os.environ.get("EMERGENCY_DEDUP_TTL_SECONDS", "43200"))
+    max_entries = int(os.environ.get("EMERGENCY_DEDUP_MAX_ENTRIES", "10000"))
+    shared_timeout_seconds = float(os.environ.get("EMERGENCY_DEDUP_SHARED_TIMEOUT_MS", "300")) / 1000
+    if backend == "auto":
+        backend = "supabase" if os.environ.get("SUPABASE_URL") else "memory"
+
+    shared = None
+    if backend == "supabase":
+        shared = SupabaseClaimBackend()
+    elif backend == "sqlite":
+        path = os.environ.get("EMERGENCY_DEDUP_DB_PATH", "emergency_dedup.db")
+        try:
+            shared = SQLiteClaimBackend(path)
+        except Exception as e:
+            print(f"[emergency_dedup] could not open SQLite dedup store at {path}: {e} -- using memory only")
+    elif backend != "memory":
+        print(f"[emergency_dedup] unknown EMERGENCY_DEDUP_BACKEND {backend!r} -- using memory only")
+
+    return EmergencyCallDedup(ttl_seconds, max_entries, shared, shared_timeout_seconds)
@@ -0,0 +1,220 @@
+"""
+BRISK Emergency Dispatch Module
+--------------------------------
+Takes the Twilio calls for a high-risk /triage result OFF the request
+path. /triage used to call trigger_emergency_call() inline: one or two
+blocking calls.create HTTP requests to Twilio, one after the other, all
+before the patient's screen could update -- so the patients at the
+highest risk waited the longest for a response.
+
+Now /triage only submits a job (the in-process dedup check included, so
+a double-tap is still skipped immediately) and returns a dispatch_id at
+once. A small pool of asyncio worker tasks, started with the app, picks
+jobs off a queue, makes the cross-replica dedup claim (emergency_dedup.py
+-- its network round trip stays off the request path too) and places the
+clinical contact call and the (optional) 911 call CONCURRENTLY. Each call
+leg gets:
+  - a deadline: the leg gives up once EMERGENCY_CALL_DEADLINE_SECONDS
+    have passed since the job started, however many attempts that took;
+  - bounded retries with exponential backoff, but ONLY when the call
+    certainly wasn't created: Twilio rejected it (a 4xx/5xx) or the
+    connection was never made -- the leg marks its result "retryable"
+    (emergency_call._call_failed). A leg that hit its deadline, or whose
+    request timed out or lost its connection after being sent (the Twilio
+    client's own TWILIO_HTTP_TIMEOUT_SECONDS included), is NOT retried --
+    the request may well have reached Twilio, and a duplicate live call
+    (especially to 911) is worse than a missing retry.
+
+The client polls GET /emergency-dispatch/{dispatch_id} for the outcome.
+Status records are kept in a bounded TTLCache, so they disappear on their
+own. They live in this process only, so with several uvicorn workers a
+poll can land on a worker that never saw the job (and gets a 404).
+
+Blocking Twilio calls run in threads (asyncio.to_thread): a thread can't
+be cancelled, so the deadline stops us WAITING for it, while the Twilio
+HTTP client's own timeout (TWILIO_HTTP_TIMEOUT_SECONDS, emergency_call.py)
+is what eventually frees the thread.
+
+Optional environment variables (e.g. in Railway):
+    EMERGENCY_DISPATCH_WORKERS          (default 4)
+    EMERGENCY_CALL_DEADLINE_SECONDS     (default 20, per call leg)
+    EMERGENCY_CALL_MAX_ATTEMPTS         (default 3, per call leg)
+    EMERGENCY_CALL_BACKOFF_SECONDS      (default 0.5; doubles per retry)
+    EMERGENCY_DISPATCH_STATUS_TTL_SECONDS  (default 21600, i.e. 6 hours)
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+from emergency_call import (
+    ALREADY_CALLED,
+    claim_emergency_call,
+    claim_shared_emergency_call,
+    emergency_call_legs,
+    release_emergency_call,
+    summarize_call_results,
+)
+from ttl_cache import TTLCache
+
+
+class EmergencyDispatcher:
+    def __init__(
+        self,
+        workers: int = 4,
+        call_deadline_seconds: float = 20.0,
+        max_attempts: int = 3,
+        backoff_seconds: float = 0.5,
+        status_ttl_seconds: float = 21600,
+        max_tracked: int = 5000,
+    ):
+        self.workers = max(1, int(workers))
+        self.call_deadline_seconds = call_deadline_seconds
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff_seconds = backoff_seconds
+        self._statuses = TTLCache(max_tracked, status_ttl_seconds)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None and bool(self._tasks) and not self._loop.is_closed()
+
+    async def start(self):
+        """Starts the worker tasks on the running event loop (app startup)."""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain_seconds: float = 10.0):
+        """
+        Stops the workers (app shutdown), first giving already-queued jobs
+        up to drain_seconds to go out -- a deploy shouldn't drop a pending
+        emergency call if it can help it.
+        """
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), drain_seconds)
+        except asyncio.TimeoutError:
+            print(f"[emergency_dispatch] shutdown with {self._queue.qsize()} job(s) still queued")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def submit(self, session_id: str, severity: int, symptom: str,
+               location: str = "location unavailable") -> Optional[dict]:
+        """
+        Queues the emergency calls and returns immediately. Safe to call
+        from any thread (sync FastAPI endpoints run in a threadpool).
+
+        Returns a "skipped" dict (below threshold / already called), a
+        {"status": "dispatched", "dispatch_id": ...} dict, or None if the
+        dispatcher isn't running -- the caller should then fall back to
+        trigger_emergency_call() so the call is still placed.
+        """
+        loop, queue = self._loop, self._queue
+        if not self.running:
+            return None
+        skipped = claim_emergency_call(session_id, severity, symptom, shared=False)
+        if skipped:
+            return skipped
+
+        dispatch_id = uuid.uuid4().hex
+        self._statuses.set(dispatch_id, {
+            "dispatch_id": dispatch_id,
+            "status": "queued",
+            "queued_at": time.time(),
+            "session_id": session_id,
+            "symptom": symptom,
+        })
+        legs = emergency_call_legs(severity, symptom, location)
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (dispatch_id, session_id, symptom, legs))
+        except RuntimeError as e:
+            # Loop already closed (shutting down) -- let the caller place
+            # the calls inline instead of losing them. The claim taken
+            # above must go too, or that fallback is skipped as a duplicate.
+            print(f"[emergency_dispatch] submit failed: {e}")
+            self._statuses.pop(dispatch_id)
+            release_emergency_call(session_id, symptom)
+            return None
+        return {"status": "dispatched", "dispatch_id": dispatch_id}
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "tracked_dispatches": len(self._statuses),
+        }
+
+    def status(self, dispatch_id: str) -> Optional[dict]:
+        record = self._statuses.get(dispatch_id)
+        return dict(record) if record else None
+
+    async def _worker(self):
+        while True:
+            dispatch_id, session_id, symptom, legs = await self._queue.get()
+            try:
+                await self._dispatch(dispatch_id, session_id, symptom, legs)
+            except Exception as e:
+                # Legs never raise, so this is a bug -- but one job must
+                # never take a worker down with it.
+                print(f"[emergency_dispatch] dispatch {dispatch_id} failed: {e}")
+                self._update(dispatch_id, status="error", reason=str(e))
+            finally:
+                self._queue.task_done()
+
+    async def _dispatch(self, dispatch_id: str, session_id: str, symptom: str,
+                        legs: Dict[str, Callable[[], dict]]):
+        if not await asyncio.to_thread(claim_shared_emergency_call, session_id, symptom):
+            # Another worker/replica already placed these calls.
+            self._update(dispatch_id, **ALREADY_CALLED, finished_at=time.time())
+            return
+        self._update(dispatch_id, status="calling", started_at=time.time())
+        names = list(legs)
+        outcomes = await asyncio.gather(*(self._place_with_retries(legs[name]) for name in names))
+        result = summarize_call_results(dict(zip(names, outcomes)))
+        self._update(dispatch_id, **result, finished_at=time.time())
+
+    async def _place_with_retries(self, place: Callable[[], dict]) -> dict:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.call_deadline_seconds
+        result = {"status": "error", "reason": "deadline exceeded before first attempt"}
+        for attempt in range(1, self.max_attempts + 1):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                result = await asyncio.wait_for(asyncio.to_thread(place), remaining)
+            except asyncio.TimeoutError:
+                return {"status": "timeout", "reason": "no answer from Twilio before the deadline", "attempts": attempt}
+            result = dict(result, attempts=attempt)
+            if result.get("status") == "placed" or not result.get("retryable"):
+                return result
+            if attempt < self.max_attempts:
+                await asyncio.sleep(min(self.backoff_seconds * 2 ** (attempt - 1), max(deadline - loop.time(), 0)))
+        return result
+
+    def _update(self, dispatch_id: str, **fields):
+        record = self._statuses.get(dispatch_id)
+        if record is not None:
+            self._statuses.set(dispatch_id, {**record, **fields})
+
+
+def create_emergency_dispatcher() -> EmergencyDispatcher:
+    return EmergencyDispatcher(
+        workers=int(os.environ.get("EMERGENCY_DISPATCH_WORKERS", "4")),
+        call_deadline_seconds=float(os.environ.get("EMERGENCY_CALL_DEADLINE_SECONDS", "20")),
+        max_attempts=int(os.environ.get("EMERGENCY_CALL_MAX_ATTEMPTS", "3")),
+        backoff_seconds=float(os.environ.get("EMERGENCY_CALL_BACKOFF_SECONDS", "0.5")),
+        status_ttl_seconds=float(os.environ.get("EMERGENCY_DISPATCH_STATUS_TTL_SECONDS", "21600")),
+    )
@@ -0,0 +1,413 @@
+"""
+BRISK Event Spool Module
+-------------------------
+A local, durable write-ahead spool for triage_events. Before this, an
+event whose Supabase insert failed was printed and gone -- including the
+audit trail of 911 routing decisions, during exactly the outages we'd
+most want to reconstruct afterwards.
+
+Now the event writer (event_writer.py) appends every batch HERE first,
+then a replayer task drains the spool into triage_events:
+
+  - SEGMENTS: events are appended as JSON lines to events-<seq>.jsonl
+    files. A segment is closed and a new one started once it reaches
+    EVENT_SPOOL_SEGMENT_BYTES; fully replayed segments are deleted.
+  - FSYNC BATCHING: one write + one fsync per appended batch (the writer
+    hands over up to EVENT_WRITER_BATCH_SIZE rows at a time), not one
+    per event.
+  - OFFSETS: offsets.json records, per segment, how many bytes have been
+    replayed. It is updated only after a bulk insert succeeds, so a
+    crash can replay a batch twice but never skip one (at-least-once).
+    Only complete lines are read: a torn last line from a crash is
+    skipped.
+  - REPLAY: the replayer inserts up to EVENT_SPOOL_REPLAY_BATCH rows per
+    request. When Supabase fails it backs off exponentially (up to
+    EVENT_SPOOL_MAX_BACKOFF_SECONDS) and the spool simply grows; the
+    patient path doesn't notice either way. "not_configured" is not a
+    failure to retry, though -- no amount of waiting sets the env vars --
+    so the replayer stops and leaves the spool on disk for a process that
+    has them.
+  - BOUNDED: past EVENT_SPOOL_MAX_BYTES the oldest segment is dropped
+    (and counted) rather than filling the disk during a long outage.
+
+Each uvicorn worker process spools into its own worker-<n> directory
+under EVENT_SPOOL_DIR, held with an exclusive file lock. Directories
+left behind by workers that are gone (a restart, fewer workers) are
+adopted and drained by whichever process finds them unlocked. On
+platforms without fcntl (local development on Windows) locking is
+skipped and a single worker is assumed.
+
+On Railway, put EVENT_SPOOL_DIR on a volume for the spool to survive
+redeploys; without one it still survives process restarts and Supabase
+outages, just not a new container.
+
+Optional environment variables (e.g. in Railway):
+    EVENT_SPOOL_DIR                  (default event_spool; "" turns the
+                                      spool off -- the writer then
+                                      inserts directly)
+    EVENT_SPOOL_SEGMENT_BYTES        (default 4194304, i.e. 4 MB)
+    EVENT_SPOOL_MAX_BYTES            (default 268435456, i.e. 256 MB)
+    EVENT_SPOOL_REPLAY_BATCH         (default 500 rows per insert)
+    EVENT_SPOOL_MAX_BACKOFF_SECONDS  (default 60)
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import metrics
+
+_SEGMENT_NAME = re.compile(r"^events-(\d{8})\.jsonl$")
+MAX_SLOTS = 64
+
+_rows_spooled = metrics.counter("event_spool_rows_spooled")
+_rows_replayed = metrics.counter("event_spool_rows_replayed")
+_replay_failures = metrics.counter("event_spool_replay_failures")
+_bytes_dropped = metrics.counter("event_spool_bytes_dropped")
+_bad_lines = metrics.counter("event_spool_bad_lines")
+_replay_latency = metrics.histogram("event_spool_replay_seconds")
+
+
+class EventSpool:
+    def __init__(self, directory: str, lock_file=None, segment_max_bytes: int = 4 * 1024 * 1024,
+                 max_total_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.max_total_bytes = max_total_bytes
+        self._lock_file = lock_file  # held for as long as this spool is ours
+        self._lock = threading.Lock()
+        self._offsets: Dict[str, int] = self._load_offsets()
+        self._segment = None
+        self._segment_name: Optional[str] = None
+        self._segment_size = 0
+
+    # ── writing ─────────────────────────────────────────────────────────
+    def append(self, rows: List[Dict[str, Any]]) -> bool:
+        """Appends rows durably (one write, one fsync). False (never raises) on a disk error."""
+        if not rows:
+            return True
+        data = "".join(json.dumps(row, separators=(",", ":"), default=str) + "\n" for row in rows).encode("utf-8")
+        try:
+            with self._lock:
+                if self._segment is None or self._segment_size >= self.segment_max_bytes:
+                    self._rotate()
+                self._segment.write(data)
+                self._segment.flush()
+                os.fsync(self._segment.fileno())
+                self._segment_size += len(data)
+                self._enforce_cap()
+            _rows_spooled.inc(len(rows))
+            return True
+        except Exception as e:
+            print(f"[event_spool] append to {self.directory} failed: {e}")
+            return False
+
+    def _rotate(self):
+        if self._segment is not None:
+            self._segment.close()
+        names = self.segments()
+        seq = int(_SEGMENT_NAME.match(names[-1]).group(1)) + 1 if names else 1
+        self._segment_name = f"events-{seq:08d}.jsonl"
+        self._segment = open(os.path.join(self.directory, self._segment_name), "ab")
+        self._segment_size = 0
+
+    def _enforce_cap(self):
+        names = self.segments()
+        sizes = {name: self._size(name) for name in names}
+        total = sum(sizes.values())
+        for name in names:
+            if total <= self.max_total_bytes or name == self._segment_name:
+                break
+            lost = sizes[name] - self._offsets.get(name, 0)
+            print(f"[event_spool] spool over {self.max_total_bytes} bytes -- dropping {name} "
+                  f"({lost} unreplayed bytes)")
+            _bytes_dropped.inc(max(lost, 0))
+            self._remove(name)
+            total -= sizes[name]
+
+    # ── replaying ───────────────────────────────────────────────────────
+    def read_batch(self, max_rows: int) -> Tuple[List[Dict[str, Any]], Optional[Tuple[str, int]]]:
+        """
+        Up to max_rows unreplayed rows from the oldest segment, and the
+        position to commit() once they're safely inserted. ([], None) when
+        there's nothing to replay.
+        """
+        while True:
+            with self._lock:
+                names = self.segments()
+                current = self._segment_name
+            if not names:
+                return [], None
+            name = names[0]
+            offset = self._offsets.get(name, 0)
+            rows, position = [], offset
+            with open(os.path.join(self.directory, name), "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # still being written, or torn by a crash
+                    position += len(line)
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        _bad_lines.inc()
+                        print(f"[event_spool] skipping unreadable line in {name}")
+                    if len(rows) >= max_rows:
+                        break
+            if rows:
+                return rows, (name, position)
+            if name == current:
+                if position > offset:
+                    self.commit((name, position))
+                return [], None
+            # A closed segment with nothing left (but maybe a torn tail): done with it.
+            with self._lock:
+                self._remove(name)
+
+    def commit(self, position: Tuple[str, int]):
+        name, offset = position
+        with self._lock:
+            if name in self._offsets or os.path.exists(os.path.join(self.directory, name)):
+                self._offsets[name] = offset
+                self._save_offsets()
+
+    def pending_bytes(self) -> int:
+        with self._lock:
+            return sum(max(self._size(name) - self._offsets.get(name, 0), 0) for name in self.segments())
+
+    def release(self):
+        """Closes the segment and gives up the directory lock (adopted spools, once drained)."""
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    # ── files ───────────────────────────────────────────────────────────
+    def segments(self) -> List[str]:
+        try:
+            return sorted(name for name in os.listdir(self.directory) if _SEGMENT_NAME.match(name))
+        except FileNotFoundError:
+            return []
+
+    def _size(self, name: str) -> int:
+        try:
+            return os.path.getsize(os.path.join(self.directory, name))
+        except OSError:
+            return 0
+
+    def _remove(self, name: str):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+        if self._offsets.pop(name, None) is not None:
+            self._save_offsets()
+
+    def _load_offsets(self) -> Dict[str, int]:
+        try:
+            with open(os.path.join(self.directory, "offsets.json"), encoding="utf-8") as f:
+                return {name: int(offset) for name, offset in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"[event_spool] unreadable offsets in {self.directory}, replaying from the start: {e}")
+            return {}
+
+    def _save_offsets(self):
+        path = os.path.join(self.directory, "offsets.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self._offsets, f)
+        os.replace(f"{path}.tmp", path)
+
+    def stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "segments": len(self.segments()),
+            "pending_bytes": self.pending_bytes(),
+        }
+
+
+def _try_lock(directory: str):
+    """An open, exclusively locked lock file for the directory, or None if another process holds it."""
+    os.makedirs(directory, exist_ok=True)
+    f = open(os.path.join(directory, "lock"), "a+")
+    if fcntl is None:
+        return f
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return f
+    except OSError:
+        f.close()
+        return None
+
+
+def open_spools(root: str, **options) -> Tuple[EventSpool, List[EventSpool]]:
+    """
+    Claims a worker-<n> directory under root for this process, and adopts
+    any other unlocked worker directory that still holds segments. Returns
+    (own spool, adopted spools). Raises OSError if root isn't usable.
+    """
+    own = None
+    adopted = []
+    slots = range(1) if fcntl is None else range(MAX_SLOTS)
+    for n in slots:
+        directory = os.path.join(root, f"worker-{n}")
+        if own is not None and not os.path.isdir(directory):
+            continue
+        lock_file = _try_lock(directory)
+        if lock_file is None:
+            continue
+        spool = EventSpool(directory, lock_file, **options)
+        if own is None:
+            own = spool
+        elif spool.segments():
+            adopted.append(spool)
+        else:
+            spool.release()
+    if own is None:
+        raise OSError(f"all {MAX_SLOTS} spool directories under {root} are locked")
+    return own, adopted
+
+
+class SpoolReplayer:
+    """Background task draining spools into triage_events via insert(rows)."""
+
+    def __init__(self, spool: EventSpool, adopted: List[EventSpool],
+                 insert: Callable[[List[Dict[str, Any]]], dict],
+                 batch_size: int = 500, idle_seconds: float = 1.0, max_backoff_seconds: float = 60.0):
+        self.spool = spool
+        self._spools = adopted + [spool]  # leftovers first: they're the oldest events
+        self._insert = insert
+        self.batch_size = max(1, int(batch_size))
+        self.idle_seconds = idle_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.backoff_seconds = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._draining = False
+        self.stopped_reason: Optional[str] = None
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._draining = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, drain_seconds: float = 10.0):
+        """Gives the replayer up to drain_seconds to empty the spool, then stops it
+        and releases every spool it holds. Whatever is left stays on disk for
+        the next start (or another worker) to pick up."""
+        if self._task is None:
+            return
+        self._draining = True
+        self.wake()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), drain_seconds)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            print(f"[event_spool] shutdown with {self.spool.pending_bytes()} byte(s) left to replay")
+        self._task = None
+        for spool in self._spools:
+            spool.release()
+
+    def wake(self):
+        if self._loop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            pass  # loop closing
+
+    async def _run(self):
+        while True:
+            progressed = False
+            failed = False
+            for spool in list(self._spools):
+                rows, position = await asyncio.to_thread(spool.read_batch, self.batch_size)
+                if not rows:
+                    if spool is not self.spool:
+                        spool.release()  # adopted leftovers fully drained
+                        self._spools.remove(spool)
+                    continue
+                started = self._loop.time()
+                try:
+                    result = await asyncio.to_thread(self._insert, rows)
+                except Exception as e:
+                    # insert never raises, so this is a bug -- keep the rows.
+                    result = {"status": "error", "reason": str(e)}
+                _replay_latency.observe(self._loop.time() - started)
+                if result.get("status") == "logged":
+                    await asyncio.to_thread(spool.commit, position)
+                    _rows_replayed.inc(len(rows))
+                    self.backoff_seconds = 0.0
+                    progressed = True
+                elif result.get("status") == "not_configured":
+                    self.stopped_reason = result.get("reason") or "not_configured"
+                    print(f"[event_spool] replay stopped, nowhere to replay to: {self.stopped_reason}")
+                    return
+                else:
+                    _replay_failures.inc()
+                    print(f"[event_spool] replay of {len(rows)} event(s) failed: {result.get('reason')}")
+                    failed = True
+                    break
+
+            if failed:
+                if self._draining:
+                    return  # shutting down: it stays spooled for next time
+                self.backoff_seconds = min(max(self.backoff_seconds * 2, 0.5), self.max_backoff_seconds)
+                await asyncio.sleep(self.backoff_seconds)
+            elif not progressed:
+                if self._draining:
+                    return
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.idle_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "stopped_reason": self.stopped_reason,
+            "backoff_seconds": self.backoff_seconds,
+            "spool": self.spool.stats(),
+            "adopted": [spool.stats() for spool in self._spools if spool is not self.spool],
+        }
+
+
+def create_spool_replayer(insert: Callable[[List[Dict[str, Any]]], dict]) -> Optional[SpoolReplayer]:
+    """The spool + replayer configured from the environment, or None if it's
+    turned off or the directory can't be used (the writer then inserts directly)."""
+    root = os.environ.get("EVENT_SPOOL_DIR", "event_spool")
+    if not root:
+        return None
+    try:
+        spool, adopted = open_spools(
+            root,
+            segment_max_bytes=int(os.environ.get("EVENT_SPOOL_SEGMENT_BYTES", str(4 * 1024 * 1024))),
+            max_total_bytes=int(os.environ.get("EVENT_SPOOL_MAX_BYTES", str(256 * 1024 * 1024))),
+        )
+    except Exception as e:
+        print(f"[event_spool] spool disabled, could not open {root}: {e}")
+        return None
+    if adopted:
+        print(f"[event_spool] adopted {len(adopted)} leftover spool(s) under {root}")
+    return SpoolReplayer(
+        spool, adopted, insert,
+        batch_size=int(os.environ.get("EVENT_SPOOL_REPLAY_BATCH", "500")),
+        max_backoff_seconds=float(os.environ.get("EVENT_SPOOL_MAX_BACKOFF_SECONDS", "60")),
+    )
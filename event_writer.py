@@ -0,0 +1,269 @@
+"""
+BRISK Event Writer Module
+--------------------------
+Takes triage_events writes OFF the request path. /log-event used to run
+log_event() inline -- one synchronous Supabase insert per event, holding
+a threadpool worker for the whole round trip -- and the frontend fires
+an event at every card pick, rating, routing and location step.
+
+Now /log-event (and /log-events, for many at once) only appends rows to
+an in-memory buffer and returns. A background task started with the app
+flushes the buffer as ONE multi-row insert (triage_db.insert_events,
+with patient_id stamped on by session_patient.py)
+whenever EVENT_WRITER_BATCH_SIZE rows are waiting, or every
+EVENT_WRITER_FLUSH_MS otherwise -- so a busy minute costs a handful of
+Supabase requests instead of hundreds.
+
+  - The buffer is bounded (EVENT_WRITER_MAX_QUEUE rows). When it's full,
+    or the writer isn't running (app served without its lifespan events),
+    submit() returns None and the caller writes the event inline as
+    before -- slower, but nothing is silently dropped.
+  - With the spool on (the default, see event_spool.py), a flush is an
+    fsync'd append to the local spool and the spool's replayer does the
+    inserting -- so a Supabase outage delays events instead of losing
+    them. Without it (or if the disk write fails), a flush inserts
+    directly, and a failed insert is logged and counted, not retried.
+  - The spool is opened (and its directory locked) by start(), not when
+    the writer is created -- importing main touches no files -- and
+    closed again by stop(). On shutdown, what's still buffered is
+    flushed first, then the replayer gets what's left of drain_seconds
+    to empty the spool.
+  - With Supabase not configured there is nothing to replay into, so no
+    spool is opened at all: the events would only pile up on disk.
+
+DUPLICATES: clients may send an event_id with each event and retry
+freely. The writer remembers the ids of the last EVENT_DEDUP_MAX_IDS
+stored events (for EVENT_DEDUP_TTL_SECONDS), so a retry storm is
+answered "duplicate" from memory without touching the buffer or
+Supabase. An id is only remembered once its event is safely stored --
+appended to the spool or inserted -- never when it is merely buffered,
+so a retry of an event whose flush failed is accepted again. It is only
+a fast path: the unique index on triage_events.event_id
+(migrations/002_triage_events_event_id.sql) is what guarantees a row is
+stored once, across workers and restarts -- which is also what makes it
+safe for flushes and spool replays to be retried.
+
+Buffered rows (queue depth), rows per flush and flush latency are
+reported at GET /metrics.
+
+Optional environment variables (e.g. in Railway):
+    EVENT_WRITER_BATCH_SIZE   (default 100 rows)
+    EVENT_WRITER_FLUSH_MS     (default 500)
+    EVENT_WRITER_MAX_QUEUE    (default 10000 rows)
+    EVENT_DEDUP_MAX_IDS       (default 50000)
+    EVENT_DEDUP_TTL_SECONDS   (default 3600)
+    EVENT_SPOOL_DIR etc.      (see event_spool.py)
+"""
+
+import asyncio
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import metrics
+import triage_db
+from event_spool import SpoolReplayer, create_spool_replayer
+from session_patient import insert_attributed_events
+from ttl_cache import TTLCache
+
+_FLUSH_SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class EventWriter:
+    def __init__(
+        self,
+        batch_size: int = 100,
+        flush_interval_seconds: float = 0.5,
+        max_queue: int = 10000,
+        insert: Callable[[List[Dict[str, Any]]], dict] = insert_attributed_events,
+        open_replayer: Optional[Callable[[], Optional[SpoolReplayer]]] = None,
+        dedup_max_ids: int = 50000,
+        dedup_ttl_seconds: float = 3600,
+    ):
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_queue = max(self.batch_size, int(max_queue))
+        self._insert = insert
+        self._open_replayer = open_replayer
+        self._replayer: Optional[SpoolReplayer] = None
+        self._recent_ids = TTLCache(dedup_max_ids, dedup_ttl_seconds)
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.rejected = 0
+
+        self._rows_written = metrics.counter("event_writer_rows_written")
+        self._rows_failed = metrics.counter("event_writer_rows_failed")
+        self._rows_spooled = metrics.counter("event_writer_rows_spooled")
+        self._duplicates = metrics.counter("event_writer_duplicates_rejected")
+        self._flush_size = metrics.histogram("event_writer_flush_rows", _FLUSH_SIZE_BUCKETS)
+        self._flush_latency = metrics.histogram("event_writer_flush_seconds")
+        self._queue_depth = metrics.histogram("event_writer_queue_depth", _FLUSH_SIZE_BUCKETS)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._stopping
+
+    async def start(self):
+        """Opens the spool (if any) and starts the flush task on the running
+        event loop (app startup)."""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        if self._open_replayer is not None and self._replayer is None:
+            self._replayer = await asyncio.to_thread(self._open_replayer)
+        if self._replayer is not None:
+            await self._replayer.start()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, drain_seconds: float = 10.0):
+        """Flushes whatever is buffered, then lets the replayer drain the
+        spool -- both within drain_seconds -- and stops, closing the spool."""
+        if self._task is None:
+            return
+        deadline = self._loop.time() + drain_seconds
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), drain_seconds)
+        except asyncio.TimeoutError:
+            print(f"[event_writer] shutdown with {len(self._buffer)} event(s) unwritten")
+            self._task.cancel()
+        if self._replayer is not None:
+            await self._replayer.stop(max(deadline - self._loop.time(), 0.5))
+            self._replayer = None
+        self._task = None
+        self._loop = None
+
+    def submit(self, row: Dict[str, Any]) -> Optional[dict]:
+        """
+        Buffers one triage_events row (triage_db.event_row()) and returns
+        {"status": "queued"} at once. Safe to call from any thread. Returns
+        None if the writer isn't running or the buffer is full -- the caller
+        should then write the event itself (log_event()).
+        """
+        return self.submit_many([row])
+
+    def submit_many(self, rows: List[Dict[str, Any]]) -> Optional[dict]:
+        """submit() for several rows at once (/log-events): all of them are
+        buffered, or -- None -- none are."""
+        if not self.running:
+            return None
+        with self._lock:
+            if len(self._buffer) + len(rows) > self.max_queue:
+                self.rejected += len(rows)
+                return None
+            self._buffer.extend(rows)
+            depth = len(self._buffer)
+        if depth >= self.batch_size:
+            self._wake()
+        return {"status": "queued"}
+
+    def seen_event_id(self, event_id: str) -> bool:
+        """True if an event with this event_id was stored recently (a retry)."""
+        if self._recent_ids.get(event_id) is None:
+            return False
+        self._duplicates.inc()
+        return True
+
+    def remember_event_ids(self, event_ids: Iterable[str]):
+        """Records event ids whose events are now stored (spooled or inserted),
+        so later retries of them are answered "duplicate"."""
+        for event_id in event_ids:
+            self._recent_ids.set(event_id, True)
+
+    def _wake(self):
+        try:
+            if _running_loop() is self._loop:
+                self._wakeup.set()
+            else:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            pass  # loop closing -- stop() flushes what's left
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._flush_pending()
+            if self._stopping:
+                return
+
+    async def _flush_pending(self):
+        with self._lock:
+            self._queue_depth.observe(len(self._buffer))
+        while True:
+            with self._lock:
+                batch = self._buffer[:self.batch_size]
+                del self._buffer[:self.batch_size]
+            if not batch:
+                return
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        started = self._loop.time()
+        if self._replayer is not None and await asyncio.to_thread(self._replayer.spool.append, batch):
+            self._flush_latency.observe(self._loop.time() - started)
+            self._flush_size.observe(len(batch))
+            self._rows_spooled.inc(len(batch))
+            self.remember_event_ids(row["event_id"] for row in batch)
+            self._replayer.wake()
+            return
+        try:
+            result = await asyncio.to_thread(self._insert, batch)
+        except Exception as e:
+            # the insert never raises, so this is a bug -- but it must
+            # never kill the flush task.
+            result = {"status": "error", "reason": str(e)}
+        self._flush_latency.observe(self._loop.time() - started)
+        self._flush_size.observe(len(batch))
+        if result.get("status") == "logged":
+            self._rows_written.inc(len(batch))
+            self.remember_event_ids(row["event_id"] for row in batch)
+        else:
+            self._rows_failed.inc(len(batch))
+            print(f"[event_writer] flush of {len(batch)} event(s) failed: {result.get('reason')}")
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queue_depth": len(self._buffer),
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.flush_interval_seconds,
+            "rejected": self.rejected,
+            "recent_event_ids": len(self._recent_ids),
+            "spool": self._replayer.stats() if self._replayer is not None else None,
+        }
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _open_spool_replayer() -> Optional[SpoolReplayer]:
+    if not triage_db.is_configured():
+        print("[event_writer] Supabase not configured -- event spool not opened")
+        return None
+    return create_spool_replayer(insert_attributed_events)
+
+
+def create_event_writer() -> EventWriter:
+    return EventWriter(
+        batch_size=int(os.environ.get("EVENT_WRITER_BATCH_SIZE", "100")),
+        flush_interval_seconds=float(os.environ.get("EVENT_WRITER_FLUSH_MS", "500")) / 1000,
+        max_queue=int(os.environ.get("EVENT_WRITER_MAX_QUEUE", "10000")),
+        open_replayer=_open_spool_replayer,
+        dedup_max_ids=int(os.environ.get("EVENT_DEDUP_MAX_IDS", "50000")),
+        dedup_ttl_seconds=float(os.environ.get("EVENT_DEDUP_TTL_SECONDS", "3600")),
+    )
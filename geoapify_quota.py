@@ -0,0 +1,206 @@
+"""
+BRISK Geoapify Quota Module
+----------------------------
+Keeps us inside Geoapify's free tier (3,000 requests/day, shared by
+clinic search and reverse geocoding) on purpose, instead of finding out
+we're over quota when calls start failing -- and makes sure that when
+the budget runs short, it's walk-in clinic search that gives way, never
+the address spoken in an emergency call.
+
+Every Geoapify request asks acquire(kind) first:
+  - "emergency" (reverse geocoding for the emergency call): allowed until
+    the full daily limit is used. The last GEOAPIFY_EMERGENCY_RESERVE
+    requests of the day are theirs alone.
+  - "clinic" (per-patient clinic search): allowed only below
+    limit - reserve, AND paced by a token bucket so a burst of searches
+    can't burn the day's budget in an hour. The bucket holds up to
+    GEOAPIFY_CLINIC_BURST tokens and refills at whatever rate would
+    spread the remaining non-emergency budget evenly over the rest of the
+    (UTC) day -- a quiet morning leaves more for the afternoon.
+  - "bulk" (the daily clinic snapshot, clinic_index.py): counted against
+    the non-emergency budget but not paced (it's one burst a day), and
+    refused once clinic search is degraded.
+
+DEGRADE MODE: once non-emergency use passes GEOAPIFY_DEGRADE_AT (a
+fraction of limit - reserve), clinic_search_degraded() is True and clinic
+search stops calling Geoapify: it answers from cached tiles (even stale
+ones) or the local clinic snapshot, whatever its age.
+
+The daily count is persisted in a small SQLite file, so a restart doesn't
+forget the day's usage and every worker on the machine shares it. It is
+NOT shared across Railway replicas -- with numReplicas > 1, divide
+GEOAPIFY_DAILY_LIMIT between them. The token bucket is per worker.
+
+Optional environment variables (e.g. in Railway):
+    GEOAPIFY_DAILY_LIMIT          (default 3000)
+    GEOAPIFY_EMERGENCY_RESERVE    (default 300)
+    GEOAPIFY_DEGRADE_AT           (default 0.8)
+    GEOAPIFY_CLINIC_BURST         (default 30)
+    GEOAPIFY_QUOTA_DB_PATH        (default geoapify_usage.db)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import metrics
+
+EMERGENCY = "emergency"
+CLINIC = "clinic"
+BULK = "bulk"
+
+
+class UsageCounter:
+    """Per-(UTC day, kind) request counts in SQLite, or in memory if the file can't be opened."""
+
+    def __init__(self, path: Optional[str]):
+        self._lock = threading.Lock()
+        self._memory: Dict[tuple, int] = {}
+        self._conn = None
+        if path:
+            try:
+                self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0, isolation_level=None)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS geoapify_usage ("
+                    " day TEXT NOT NULL, kind TEXT NOT NULL, count INTEGER NOT NULL,"
+                    " PRIMARY KEY (day, kind))"
+                )
+            except Exception as e:
+                print(f"[geoapify_quota] could not open usage db {path}: {e} -- counting in memory")
+                self._conn = None
+
+    def add(self, day: str, kind: str):
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT INTO geoapify_usage (day, kind, count) VALUES (?, ?, 1) "
+                        "ON CONFLICT(day, kind) DO UPDATE SET count = count + 1",
+                        (day, kind),
+                    )
+                    return
+                except Exception as e:
+                    print(f"[geoapify_quota] usage write failed: {e}")
+            self._memory[(day, kind)] = self._memory.get((day, kind), 0) + 1
+
+    def counts(self, day: str) -> Dict[str, int]:
+        with self._lock:
+            counts = {kind: n for (d, kind), n in self._memory.items() if d == day}
+            if self._conn is not None:
+                try:
+                    for kind, n in self._conn.execute(
+                        "SELECT kind, count FROM geoapify_usage WHERE day = ?", (day,)
+                    ):
+                        counts[kind] = counts.get(kind, 0) + n
+                except Exception as e:
+                    print(f"[geoapify_quota] usage read failed: {e}")
+            return counts
+
+
+class QuotaGovernor:
+    def __init__(self, daily_limit: int, emergency_reserve: int, degrade_at: float,
+                 clinic_burst: int, counter: UsageCounter):
+        self.daily_limit = daily_limit
+        self.emergency_reserve = min(emergency_reserve, daily_limit)
+        self.degrade_at = degrade_at
+        self.clinic_burst = max(1, clinic_burst)
+        self._counter = counter
+        self._lock = threading.Lock()
+        self._tokens = float(self.clinic_burst)
+        self._refilled_at = time.monotonic()
+        self.refused: Dict[str, int] = {}
+
+    @property
+    def non_emergency_limit(self) -> int:
+        return self.daily_limit - self.emergency_reserve
+
+    def _usage(self, day: str):
+        counts = self._counter.counts(day)
+        total = sum(counts.values())
+        return total, total - counts.get(EMERGENCY, 0)
+
+    def acquire(self, kind: str) -> bool:
+        """True (and the request is counted) if a request of this kind may go out now."""
+        now = datetime.now(timezone.utc)
+        day = now.strftime("%Y-%m-%d")
+        with self._lock:
+            total, non_emergency = self._usage(day)
+            if kind == EMERGENCY:
+                allowed = total < self.daily_limit
+            elif kind == BULK:
+                allowed = non_emergency < self.non_emergency_limit * self.degrade_at
+            else:
+                allowed = non_emergency < self.non_emergency_limit and self._take_token(now, non_emergency)
+            if allowed:
+                self._counter.add(day, kind)
+                metrics.counter(f"geoapify_quota_granted_{kind}").inc()
+            else:
+                self.refused[kind] = self.refused.get(kind, 0) + 1
+                metrics.counter(f"geoapify_quota_refused_{kind}").inc()
+            return allowed
+
+    def _take_token(self, now: datetime, non_emergency_used: int) -> bool:
+        seconds_left = max(86400 - (now.hour * 3600 + now.minute * 60 + now.second), 60)
+        rate = max(self.non_emergency_limit - non_emergency_used, 0) / seconds_left
+        clock = time.monotonic()
+        self._tokens = min(self.clinic_burst, self._tokens + (clock - self._refilled_at) * rate)
+        self._refilled_at = clock
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def clinic_search_degraded(self) -> bool:
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        _, non_emergency = self._usage(day)
+        return non_emergency >= self.non_emergency_limit * self.degrade_at
+
+    def stats(self) -> dict:
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        counts = self._counter.counts(day)
+        total = sum(counts.values())
+        return {
+            "day": day,
+            "used": counts,
+            "used_total": total,
+            "daily_limit": self.daily_limit,
+            "emergency_reserve": self.emergency_reserve,
+            "clinic_search_degraded": total - counts.get(EMERGENCY, 0) >= self.non_emergency_limit * self.degrade_at,
+            "clinic_tokens": round(self._tokens, 2),
+            "refused": dict(self.refused),
+        }
+
+
+_governor: Optional[QuotaGovernor] = None
+_governor_lock = threading.Lock()
+
+
+def get_governor() -> QuotaGovernor:
+    """Built on first use, so the env vars are read lazily."""
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                _governor = QuotaGovernor(
+                    daily_limit=int(os.environ.get("GEOAPIFY_DAILY_LIMIT", "3000")),
+                    emergency_reserve=int(os.environ.get("GEOAPIFY_EMERGENCY_RESERVE", "300")),
+                    degrade_at=float(os.environ.get("GEOAPIFY_DEGRADE_AT", "0.8")),
+                    clinic_burst=int(os.environ.get("GEOAPIFY_CLINIC_BURST", "30")),
+                    counter=UsageCounter(os.environ.get("GEOAPIFY_QUOTA_DB_PATH", "geoapify_usage.db")),
+                )
+    return _governor
+
+
+def acquire(kind: str) -> bool:
+    return get_governor().acquire(kind)
+
+
+def clinic_search_degraded() -> bool:
+    return get_governor().clinic_search_degraded()
+
+
+metrics.register_stats("geoapify_quota", lambda: get_governor().stats())
@@ -0,0 +1,93 @@
+"""
+BRISK Geohash Module
+---------------------
+Standard geohash encoding, used to bucket nearby coordinates into one
+cache key (reverse-geocode cache, clinic search tiles). Points in the
+same cell share a key, so "the same place, a few metres off" is a cache
+hit instead of another API call.
+
+Approximate cell size at Saskatchewan latitudes (~50-55 N; east-west
+width shrinks with latitude, north-south height doesn't):
+    precision 5    ~2.8 km x 4.9 km
+    precision 6    ~0.7 km x 0.6 km
+    precision 7    ~90 m  x 150 m
+    precision 8    ~22 m  x 19 m
+    precision 9    ~3 m   x 5 m
+"""
+
+import math
+from typing import Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {ch: i for i, ch in enumerate(_BASE32)}
+
+
+def encode(lat: float, lng: float, precision: int = 8) -> str:
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                value = (value << 1) | 1
+                lng_lo = mid
+            else:
+                value <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = (value << 1) | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def bounds(cell: str) -> Tuple[float, float, float, float]:
+    """(lat_min, lat_max, lng_min, lng_max) of a geohash cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for ch in cell:
+        value = _DECODE[ch]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if bit:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lat_hi, lng_lo, lng_hi
+
+
+def center(cell: str) -> Tuple[float, float]:
+    lat_lo, lat_hi, lng_lo, lng_hi = bounds(cell)
+    return (lat_lo + lat_hi) / 2, (lng_lo + lng_hi) / 2
+
+
+def cell_size_m(cell: str) -> Tuple[float, float]:
+    """(height, width) of a cell in metres, measured at its centre."""
+    lat_lo, lat_hi, lng_lo, lng_hi = bounds(cell)
+    metres_per_degree = 111_320.0
+    mid_lat = math.radians((lat_lo + lat_hi) / 2)
+    return (lat_hi - lat_lo) * metres_per_degree, (lng_hi - lng_lo) * metres_per_degree * math.cos(mid_lat)
@@ -0,0 +1,164 @@
+"""
+BRISK Outbound HTTP Module
+---------------------------
+One process-wide HTTP layer for outbound API calls (Geoapify today).
+walkin_clinics.py and reverse_geocode.py used to open and close a fresh
+httpx.Client for every lookup, so every lookup paid DNS + TCP + TLS setup
+to api.geoapify.com -- often more than the API call itself. Now they
+share one long-lived client whose connections are kept alive and reused.
+
+  - get() goes through the shared client (every caller is a sync endpoint
+    or a worker thread). It is created at app startup (startup()) and
+    closed at shutdown (shutdown()), and also on first use, so scripts
+    and the background threads work without the app running.
+  - Connection pool: HTTP_CLIENT_MAX_CONNECTIONS total, of which up to
+    HTTP_CLIENT_MAX_KEEPALIVE idle ones are kept for
+    HTTP_CLIENT_KEEPALIVE_EXPIRY_SECONDS.
+  - Per-host limit: at most HTTP_CLIENT_PER_HOST_LIMIT requests in flight
+    to one host at a time, so one slow upstream can't take every pooled
+    connection. Waiting for a slot counts against the request's timeout.
+  - HTTP/2 (HTTP_CLIENT_HTTP2=true, needs the h2 package): many requests
+    multiplexed over one connection.
+
+Requests in flight (per host), time spent waiting for a per-host slot,
+and open/idle pooled connections are reported at GET /metrics.
+
+Optional environment variables (e.g. in Railway):
+    HTTP_CLIENT_MAX_CONNECTIONS           (default 20)
+    HTTP_CLIENT_MAX_KEEPALIVE             (default 10)
+    HTTP_CLIENT_KEEPALIVE_EXPIRY_SECONDS  (default 30)
+    HTTP_CLIENT_PER_HOST_LIMIT            (default 10)
+    HTTP_CLIENT_HTTP2                     ("true" to enable; default off)
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import httpx
+
+import metrics
+
+_sync_client: Optional[httpx.Client] = None
+_lock = threading.Lock()
+
+_host_slots: Dict[str, threading.BoundedSemaphore] = {}
+_in_flight: Dict[str, int] = {}
+_peak_in_flight: Dict[str, int] = {}
+_requests = metrics.counter("http_client_requests")
+_slot_wait = metrics.histogram("http_client_slot_wait_seconds")
+
+
+def _client_options() -> dict:
+    http2 = os.environ.get("HTTP_CLIENT_HTTP2", "").lower() == "true"
+    if http2:
+        try:
+            import h2  # noqa: F401 -- httpx needs it for http2=True
+        except ImportError:
+            print("[http_client] HTTP_CLIENT_HTTP2=true but the h2 package isn't installed -- using HTTP/1.1")
+            http2 = False
+    return {
+        "http2": http2,
+        "limits": httpx.Limits(
+            max_connections=int(os.environ.get("HTTP_CLIENT_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.environ.get("HTTP_CLIENT_MAX_KEEPALIVE", "10")),
+            keepalive_expiry=float(os.environ.get("HTTP_CLIENT_KEEPALIVE_EXPIRY_SECONDS", "30")),
+        ),
+        "timeout": 10.0,
+    }
+
+
+def _per_host_limit() -> int:
+    return max(1, int(os.environ.get("HTTP_CLIENT_PER_HOST_LIMIT", "10")))
+
+
+def get_sync_client() -> httpx.Client:
+    global _sync_client
+    if _sync_client is None:
+        with _lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(**_client_options())
+    return _sync_client
+
+
+async def startup():
+    get_sync_client()
+
+
+async def shutdown():
+    global _sync_client
+    with _lock:
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
+
+
+@contextmanager
+def _tracked(host: str):
+    with _lock:
+        _in_flight[host] = _in_flight.get(host, 0) + 1
+        _peak_in_flight[host] = max(_peak_in_flight.get(host, 0), _in_flight[host])
+    _requests.inc()
+    try:
+        yield
+    finally:
+        with _lock:
+            _in_flight[host] -= 1
+
+
+def get(url: str, params: Optional[Dict[str, Any]] = None, timeout: float = 10.0) -> httpx.Response:
+    """
+    GET through the shared sync client. Raises like httpx does (callers
+    already catch httpx errors); a request that can't get a per-host slot
+    within its timeout raises httpx.PoolTimeout.
+    """
+    host = httpx.URL(url).host
+    with _lock:
+        slots = _host_slots.get(host)
+        if slots is None:
+            slots = _host_slots[host] = threading.BoundedSemaphore(_per_host_limit())
+    started = time.perf_counter()
+    if not slots.acquire(timeout=timeout):
+        raise httpx.PoolTimeout(f"no free connection slot for {host} within {timeout}s")
+    waited = time.perf_counter() - started
+    _slot_wait.observe(waited)
+    try:
+        with _tracked(host):
+            return get_sync_client().get(url, params=params, timeout=max(timeout - waited, 0.001))
+    finally:
+        slots.release()
+
+
+def _pool_stats(client) -> Optional[dict]:
+    """Open/idle connection counts. Reads httpcore's pool directly (no public
+    API for this), so it degrades to None rather than break /metrics."""
+    if client is None:
+        return None
+    try:
+        connections = list(client._transport._pool.connections)
+        return {
+            "open": len(connections),
+            "idle": sum(1 for c in connections if c.is_idle()),
+        }
+    except Exception:
+        return None
+
+
+def stats() -> dict:
+    with _lock:
+        in_flight = dict(_in_flight)
+        peak = dict(_peak_in_flight)
+    options = _client_options()
+    return {
+        "http2": options["http2"],
+        "max_connections": options["limits"].max_connections,
+        "per_host_limit": _per_host_limit(),
+        "in_flight": in_flight,
+        "peak_in_flight": peak,
+        "pool": _pool_stats(_sync_client),
+    }
+
+
+metrics.register_stats("http_client", stats)
@@ -0,0 +1,157 @@
+"""
+BRISK Keyword Matcher Module
+-----------------------------
+Compiles a {label: [phrases]} table (e.g. SYMPTOM_KEYWORDS in main.py)
+ONCE into a single matcher, so a patient's message is scanned by one
+compiled regex instead of one `kw in text` search per phrase per label.
+labels() gives the matched labels; spans() also gives where each match
+is, as (label, start, end).
+
+HOW IT WORKS: all phrases are folded into a prefix trie, and the trie is
+emitted as one regular expression (shared prefixes become nested groups,
+so at any position the regex engine only follows the branches that can
+still match -- the same idea as an Aho-Corasick goto function). After
+each hit the search resumes one character past the hit's START, not its
+end, so overlapping phrases are all reported ("head injury" still also
+yields "injury"), while the gaps between hits are skipped inside the C
+regex engine. At each start position the regex reports the LONGEST
+phrase; shorter phrases that are prefixes of it are added from a table
+computed at build time (the equivalent of Aho-Corasick output links).
+
+COST: this is NOT a strictly linear scan. Without Aho-Corasick failure
+links, every position of the text is tried as a match start once, and
+each try can follow the trie as deep as the longest phrase -- so the
+worst case is O(len(text) x longest phrase) character steps, plus one
+Python-level search() call per hit. In practice misses fail on the first
+character or two (inside the C regex engine), so the cost is close to
+one pass over the text plus a few microseconds per hit.
+
+WORD STARTS: with word_start=True (the default) a phrase only matches at
+the start of a word -- "fit" no longer fires inside "benefit". The END of
+a phrase is deliberately not checked: the keyword lists name the base
+form ("seizure", "headache", "cough") and rely on plain substring
+matching to also catch "seizures", "headaches", "coughs". With
+word_start=False it keeps the original plain-substring behaviour
+throughout, which is what the red-flag and differential scoring rules
+were written against, so their scores don't silently change.
+
+Matching is done against text.lower(), exactly like the inline loops
+this replaces; phrases themselves are NOT lowercased, so a phrase with
+capitals in it behaves the same as before (it can never match).
+"""
+
+import re
+from typing import Dict, Hashable, Iterable, List, Set, Tuple
+
+# Regex alternation on a node is ordered so that longer continuations are
+# tried first; this key marks "a phrase ends here" in the trie.
+_END = ""
+
+
+def _build_trie(phrases: Iterable[str]) -> dict:
+    trie: dict = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[_END] = True
+    return trie
+
+
+def _trie_to_regex(node: dict) -> str:
+    """
+    Emits the trie below `node` as a regex fragment. Children are tried
+    before the (empty) "phrase ends here" alternative, so the engine
+    reports the longest phrase and only falls back to a shorter one if
+    the longer one doesn't match.
+    """
+    branches = []
+    for ch in sorted(k for k in node if k != _END):
+        branches.append(re.escape(ch) + _trie_to_regex(node[ch]))
+    if _END in node:
+        branches.append("")
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")"
+
+
+class KeywordMatcher:
+    """
+    A compiled multi-phrase matcher. Build it once at import time and
+    reuse it for every request -- construction is the only expensive step.
+    """
+
+    def __init__(self, table: Dict[Hashable, List[str]], word_start: bool = True):
+        self.word_start = word_start
+        self._labels_by_phrase: Dict[str, Tuple[Hashable, ...]] = {}
+        for label, phrases in table.items():
+            for phrase in phrases:
+                if not phrase:
+                    continue
+                existing = self._labels_by_phrase.get(phrase, ())
+                if label not in existing:
+                    self._labels_by_phrase[phrase] = existing + (label,)
+
+        phrases = list(self._labels_by_phrase)
+        self._pattern = None
+        if phrases:
+            # The word-start check is done in _hits() rather than in the
+            # regex, so the pattern starts with a literal and the regex
+            # engine can skip ahead to positions that could possibly match.
+            self._pattern = re.compile(_trie_to_regex(_build_trie(phrases)))
+
+        # For every phrase, the other phrases that are a prefix of it and so
+        # also match at the same start position -- the regex only reports
+        # the longest one. Shortest first, so spans() come out in order.
+        self._prefix_phrases: Dict[str, Tuple[str, ...]] = {
+            phrase: tuple(sorted((other for other in phrases if other != phrase and phrase.startswith(other)), key=len))
+            for phrase in phrases
+        }
+
+    def _hits(self, text_lower: str):
+        """Yields (start, longest phrase) for every start position that matches."""
+        search = self._pattern.search
+        check_start = self.word_start
+        pos = 0
+        while True:
+            m = search(text_lower, pos)
+            if m is None:
+                return
+            start = m.start()
+            pos = start + 1
+            if check_start and start and _is_word_char(text_lower[start - 1]):
+                continue
+            yield start, m.group()
+
+    def spans(self, text: str) -> List[Tuple[Hashable, int, int]]:
+        """
+        Every match as (label, start, end), ordered by start position, then
+        shortest phrase first. Offsets index into text.lower(), which is the
+        same string as text except for the rare characters whose lowercase
+        form has a different length (e.g. "İ").
+        """
+        if self._pattern is None:
+            return []
+        matches: List[Tuple[Hashable, int, int]] = []
+        labels_by_phrase = self._labels_by_phrase
+        for start, longest in self._hits(text.lower()):
+            for phrase in self._prefix_phrases[longest] + (longest,):
+                for label in labels_by_phrase[phrase]:
+                    matches.append((label, start, start + len(phrase)))
+        return matches
+
+    def labels(self, text: str) -> Set[Hashable]:
+        """The set of labels with at least one match in text."""
+        if self._pattern is None:
+            return set()
+        found: Set[Hashable] = set()
+        labels_by_phrase = self._labels_by_phrase
+        for _, longest in self._hits(text.lower()):
+            found.update(labels_by_phrase[longest])
+            for phrase in self._prefix_phrases[longest]:
+                found.update(labels_by_phrase[phrase])
+        return found
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
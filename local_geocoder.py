@@ -0,0 +1,188 @@
+"""
+BRISK Local Reverse Geocoder Module
+------------------------------------
+Offline nearest-address lookup, so the emergency call can speak a civic
+address even when Geoapify is slow, over quota or down (instead of
+"coordinates 52.1332, -106.6700"). No network involved: a query is a
+dictionary lookup plus a distance check over a handful of points, well
+under a millisecond.
+
+DATA: a CSV of address points for the province, e.g. a Saskatchewan
+extract from OpenAddresses or the provincial civic-address layer. The
+header must name the coordinate columns (lat/latitude/y and
+lon/lng/longitude/x, any case) and either an "address" column or the
+OpenAddresses-style parts (number, street, unit, city, postcode). Rows
+with unparseable coordinates are skipped.
+
+The file is memory-mapped, NOT parsed into Python strings: loading only
+records each row's coordinates and byte offset into a grid index (cells
+of GRID_DEGREES on a side), and the address text of the single winning
+row is decoded at query time. The OS pages the file in and out as
+needed, and every uvicorn worker shares the same page cache.
+
+Loading a province-sized file takes a few seconds, so it happens in a
+background thread started with the app (start_background_load); until it
+finishes, lookups simply return None and reverse_geocode carries on as
+if there were no local data.
+
+Only a point within LOCAL_GEOCODER_MAX_DISTANCE_M counts. Anything
+further than EXACT_DISTANCE_M is spoken as "near <address>", so a
+rural patient between farms isn't placed at the wrong door.
+
+Optional environment variables (e.g. in Railway):
+    LOCAL_GEOCODER_PATH              CSV path (unset: feature off)
+    LOCAL_GEOCODER_MAX_DISTANCE_M    (default 100)
+"""
+
+import csv
+import math
+import mmap
+import os
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+GRID_DEGREES = 0.001  # ~110 m north-south, ~70 m east-west at 52 N
+EXACT_DISTANCE_M = 30.0
+_METRES_PER_DEGREE = 111_320.0
+
+_LAT_COLUMNS = ("lat", "latitude", "y")
+_LNG_COLUMNS = ("lon", "lng", "long", "longitude", "x")
+
+
+def _cell(lat: float, lng: float) -> Tuple[int, int]:
+    return int(math.floor(lat / GRID_DEGREES)), int(math.floor(lng / GRID_DEGREES))
+
+
+class LocalGeocoder:
+    def __init__(self, path: str, max_distance_m: float = 100.0):
+        self.path = path
+        self.max_distance_m = max_distance_m
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._lats = array("d")
+        self._lngs = array("d")
+        self._offsets = array("Q")
+        self._grid: Dict[Tuple[int, int], array] = {}
+        self._load()
+
+    def _load(self):
+        started = time.perf_counter()
+        mm = self._mmap
+        header = next(csv.reader([mm.readline().decode("utf-8-sig")]))
+        columns = {name.strip().lower(): i for i, name in enumerate(header)}
+        lat_col = next((columns[c] for c in _LAT_COLUMNS if c in columns), None)
+        lng_col = next((columns[c] for c in _LNG_COLUMNS if c in columns), None)
+        if lat_col is None or lng_col is None:
+            raise ValueError(f"{self.path}: no latitude/longitude columns in header {header}")
+        self._address_col = columns.get("address")
+        self._street_cols = [columns[p] for p in ("number", "street", "unit") if p in columns]
+        self._place_cols = [columns[p] for p in ("city", "postcode") if p in columns]
+        if self._address_col is None and not self._street_cols:
+            raise ValueError(f"{self.path}: no address column(s) in header {header}")
+
+        grid: Dict[Tuple[int, int], List[int]] = {}
+        while True:
+            offset = mm.tell()
+            line = mm.readline()
+            if not line:
+                break
+            try:
+                row = next(csv.reader([line.decode("utf-8")]))
+                lat, lng = float(row[lat_col]), float(row[lng_col])
+            except (ValueError, IndexError, StopIteration, UnicodeDecodeError):
+                continue
+            grid.setdefault(_cell(lat, lng), []).append(len(self._offsets))
+            self._lats.append(lat)
+            self._lngs.append(lng)
+            self._offsets.append(offset)
+        self._grid = {cell: array("I", rows) for cell, rows in grid.items()}
+        print(f"[local_geocoder] loaded {len(self._offsets)} address points from {self.path} "
+              f"in {time.perf_counter() - started:.1f}s")
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def nearest(self, lat: float, lng: float) -> Optional[Tuple[str, float]]:
+        """(address, distance in metres) of the closest point within
+        max_distance_m, or None."""
+        cos_lat = math.cos(math.radians(lat))
+        cell_lat, cell_lng = _cell(lat, lng)
+        ring_lat = int(math.ceil(self.max_distance_m / (GRID_DEGREES * _METRES_PER_DEGREE)))
+        ring_lng = int(math.ceil(self.max_distance_m / (GRID_DEGREES * _METRES_PER_DEGREE * max(cos_lat, 0.01))))
+
+        best_row, best_sq = -1, float("inf")
+        lats, lngs = self._lats, self._lngs
+        for d_lat in range(-ring_lat, ring_lat + 1):
+            for d_lng in range(-ring_lng, ring_lng + 1):
+                rows = self._grid.get((cell_lat + d_lat, cell_lng + d_lng))
+                if rows is None:
+                    continue
+                for row in rows:
+                    dy = lats[row] - lat
+                    dx = (lngs[row] - lng) * cos_lat
+                    sq = dx * dx + dy * dy
+                    if sq < best_sq:
+                        best_row, best_sq = row, sq
+        if best_row < 0:
+            return None
+        distance_m = math.sqrt(best_sq) * _METRES_PER_DEGREE
+        if distance_m > self.max_distance_m:
+            return None
+        return self._address(best_row), distance_m
+
+    def lookup(self, lat: float, lng: float) -> Optional[str]:
+        """The nearest address as a phrase to speak, or None."""
+        found = self.nearest(lat, lng)
+        if found is None:
+            return None
+        address, distance_m = found
+        if not address:
+            return None
+        return address if distance_m <= EXACT_DISTANCE_M else f"near {address}"
+
+    def _address(self, row: int) -> str:
+        mm = self._mmap
+        start = self._offsets[row]
+        end = mm.find(b"\n", start)
+        line = mm[start:end if end >= 0 else len(mm)].decode("utf-8")
+        fields = next(csv.reader([line]))
+        if self._address_col is not None:
+            return fields[self._address_col].strip()
+        # OpenAddresses-style parts: "103 Hospital Drive, Saskatoon, S7N 0W8"
+        part = lambda i: fields[i].strip() if i < len(fields) else ""
+        street = " ".join(p for p in map(part, self._street_cols) if p)
+        return ", ".join(p for p in [street] + [part(i) for i in self._place_cols] if p)
+
+
+_geocoder: Optional[LocalGeocoder] = None
+_load_started = False
+_load_lock = threading.Lock()
+
+
+def get_local_geocoder() -> Optional[LocalGeocoder]:
+    """The loaded geocoder, or None if not configured / not loaded (yet)."""
+    return _geocoder
+
+
+def start_background_load():
+    """Loads LOCAL_GEOCODER_PATH in a daemon thread (once). Never raises."""
+    global _load_started
+    path = os.environ.get("LOCAL_GEOCODER_PATH")
+    if not path:
+        return
+    with _load_lock:
+        if _load_started:
+            return
+        _load_started = True
+    threading.Thread(target=_load, args=(path,), name="local-geocoder-load", daemon=True).start()
+
+
+def _load(path: str):
+    global _geocoder
+    try:
+        max_distance = float(os.environ.get("LOCAL_GEOCODER_MAX_DISTANCE_M", "100"))
+        _geocoder = LocalGeocoder(path, max_distance)
+    except Exception as e:
+        print(f"[local_geocoder] could not load {path}: {e}")
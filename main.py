@@ -1,19 +1,58 @@
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import Response
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, field_validator
+from typing import Optional, List, Dict, Any, NamedTuple, Tuple
+from contextlib import asynccontextmanager, nullcontext
+import asyncio
+import json
 import os
-from emergency_call import trigger_emergency_call, build_emergency_twiml, build_911_twiml
+import threading
+import zlib
+from emergency_call import trigger_emergency_call, build_emergency_twiml, build_911_twiml, emergency_dedup_stats
+from emergency_dispatch import create_emergency_dispatcher
+from event_writer import create_event_writer
 from triage_db import (
-    log_event, create_registration, get_registration, update_registration,
-    find_or_create_by_health_card, get_events_by_session_prefix, link_session_to_patient,
+    log_event, event_row, create_registration, get_registration, update_registration,
+    find_or_create_by_health_card, get_events_by_session_prefix,
 )
+import session_patient
 from patient_login import send_otp, check_otp
 from walkin_clinics import find_nearby_walkin_clinics
-from reverse_geocode import reverse_geocode
-
-app = FastAPI()
+from clinic_index import get_clinic_index, in_saskatchewan, run_snapshot_job
+from geoapify_quota import clinic_search_degraded
+from reverse_geocode import reverse_geocode_within
+from local_geocoder import start_background_load as load_local_geocoder
+import http_client
+from keyword_matcher import KeywordMatcher
+from session_store import create_session_store
+from state_token import create_state_codec
+import metrics
+
+emergency_dispatcher = create_emergency_dispatcher()
+metrics.register_stats("emergency_dispatch", emergency_dispatcher.stats)
+metrics.register_stats("emergency_dedup", emergency_dedup_stats)
+# Creating the writer touches no files: its spool is opened by start() in
+# the lifespan below, and closed again by stop().
+event_writer = create_event_writer()
+metrics.register_stats("event_writer", event_writer.stats)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await http_client.startup()
+    await emergency_dispatcher.start()
+    await event_writer.start()
+    load_local_geocoder()
+    snapshot_job = asyncio.create_task(run_snapshot_job())
+    yield
+    snapshot_job.cancel()
+    await emergency_dispatcher.stop()
+    await event_writer.stop()
+    await http_client.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",
@@ -45,6 +84,35 @@ class SymptomInput(BaseModel):
     risk_score: Optional[int] = 0
     current_pathway: Optional[str] = None
     session_id: Optional[str] = None
+    # Opt-in incremental mode: the server keeps this session's answer history
+    # and running scores (keyed by session_id), so the client may stop
+    # re-posting all_answers. answer_count is required in this mode: 0 on the
+    # first turn, then the value from the previous response -- it lets a
+    # retried turn roll the server's copy back instead of recording the same
+    # answer twice.
+    incremental: bool = False
+    answer_count: Optional[int] = None
+    # Compact alternative to all_answers: [[question_id, answer], ...], using
+    # the ids from QUESTION_IDS (each response carries the question_id of its
+    # next_question). Takes precedence over all_answers when both are sent.
+    history: Optional[List[Tuple[int, str]]] = None
+
+    @field_validator("history")
+    @classmethod
+    def _known_question_ids(cls, history):
+        for qid, _ in history or []:
+            if qid not in QUESTIONS_BY_ID:
+                raise ValueError(f"unknown question id {qid}")
+        return history
+
+    # Signed state token (see state_token.py). A client that sends
+    # use_state_token=true gets a state_token back; echoing it replaces
+    # every field above except message (and session_id).
+    use_state_token: bool = False
+    state_token: Optional[str] = None
+
+    def posted_answer_count(self) -> int:
+        return len(self.history) if self.history is not None else len(self.all_answers or [])
 
 SYMPTOM_KEYWORDS = {
     "headache": ["headache", "head pain", "head hurts", "head ache", "pain in my head", "head is pounding", "head is killing me", "worst headache"],
@@ -217,6 +285,9 @@ completion_messages = {
     "low": "✅ Thank you for the information. Your responses have been recorded. Please contact your GP or a healthcare professional for further assessment."
 }
 
+ADDITIONAL_PROMPT = "Is there anything else you would like to add, or any other symptoms you would like to mention?"
+ADDITIONAL_FOLLOW_UP_PROMPT = "Thank you for sharing that. Is there anything else you would like to add?"
+
 DIFFERENTIAL_CANDIDATES = {
     "headache_sah": [("Subarachnoid Haemorrhage (SAH)", ["worst headache", "thunderclap", "sudden", "explosive", "10 out of 10"], 3), ("Meningitis / Meningoencephalitis", ["neck stiffness", "fever", "photophobia", "confusion", "rash"], 3), ("Hypertensive Emergency", ["severe headache", "history of hypertension", "high blood pressure"], 2), ("Migraine", ["nausea", "light sensitivity", "previous headaches"], 1), ("COVID-19", ["fever", "recent illness", "around someone unwell"], 1)],
     "headache_migraine": [("Migraine with or without Aura", ["one side", "aura", "flashing lights", "nausea", "light sensitivity", "previous"], 3), ("Tension-Type Headache", ["both sides", "stress", "no aura", "dull", "pressure"], 2), ("COVID-19", ["fever", "recent illness", "around someone unwell", "loss of smell"], 2), ("Cluster Headache", ["one eye", "tearing", "one sided", "severe"], 2), ("Medication Overuse Headache", ["took medication", "regular painkillers"], 1)],
@@ -246,14 +317,31 @@ DIFFERENTIAL_CANDIDATES = {
     "low blood sugar": [("Hypoglycaemia", ["diabetic", "insulin", "missed meal", "low reading", "shaking"], 3), ("Insulinoma", ["recurrent", "non-diabetic", "fasting hypoglycaemia"], 1), ("Adrenal Insufficiency", ["fatigue", "weight loss", "dizziness", "non-diabetic"], 1)],
 }
 
+# Every candidate keyword of a pathway compiled into one substring matcher;
+# the labels are the keywords themselves, so a scan returns the set of
+# keywords present in the answers.
+DIFFERENTIAL_MATCHERS = {
+    pathway: KeywordMatcher({kw: [kw] for _, keywords, _ in candidates for kw in keywords}, word_start=False)
+    for pathway, candidates in DIFFERENTIAL_CANDIDATES.items()
+}
+DIFFERENTIAL_MAX_KEYWORD_LEN = {
+    pathway: max(len(kw) for _, keywords, _ in candidates for kw in keywords)
+    for pathway, candidates in DIFFERENTIAL_CANDIDATES.items()
+}
+
 def generate_differentials(pathway: str, all_answers: List[AnswerEntry]) -> List[str]:
+    if pathway not in DIFFERENTIAL_CANDIDATES:
+        return []
+    combined_text = " ".join(entry.answer.lower() for entry in all_answers)
+    return rank_differentials(pathway, DIFFERENTIAL_MATCHERS[pathway].labels(combined_text))
+
+def rank_differentials(pathway: str, keyword_hits) -> List[str]:
     candidates = DIFFERENTIAL_CANDIDATES.get(pathway, [])
     if not candidates:
         return []
-    combined_text = " ".join(entry.answer.lower() for entry in all_answers)
     scored = []
     for diagnosis, keywords, base_weight in candidates:
-        score = sum(base_weight for kw in keywords if kw in combined_text)
+        score = sum(base_weight for kw in keywords if kw in keyword_hits)
         scored.append((diagnosis, score))
     scored.sort(key=lambda x: x[1], reverse=True)
     top = [d for d, s in scored if s > 0][:3]
@@ -263,9 +351,14 @@ def generate_differentials(pathway: str, all_answers: List[AnswerEntry]) -> List
 
 SYMPTOM_PRIORITY = ["suicidal thoughts", "overdose", "chest pain", "shortness of breath", "headache", "seizure", "head injury", "trauma", "blackout", "rectal bleed", "low blood sugar", "diarrhea", "abdominal pain", "vomiting", "migraine", "dysuria", "urinary frequency", "genital discharge", "genital sore", "dyspareunia", "cough", "sore throat", "joint pain", "other"]
 
+# Compiled once at import: one regex scan of the message instead of a
+# substring search per phrase (see keyword_matcher.py). Phrases must start
+# a word ("fit" not in "benefit") but may be inflected ("seizures").
+SYMPTOM_MATCHER = KeywordMatcher(SYMPTOM_KEYWORDS)
+
 def detect_all_symptoms(text: str) -> List[str]:
-    text_lower = text.lower()
-    return [symptom for symptom, keywords in SYMPTOM_KEYWORDS.items() if any(kw in text_lower for kw in keywords)]
+    found = SYMPTOM_MATCHER.labels(text)
+    return [symptom for symptom in SYMPTOM_KEYWORDS if symptom in found]
 
 def prioritize_symptoms(symptoms: List[str]) -> List[str]:
     return sorted(symptoms, key=lambda s: SYMPTOM_PRIORITY.index(s) if s in SYMPTOM_PRIORITY else len(SYMPTOM_PRIORITY))
@@ -276,10 +369,12 @@ def get_next_symptom_to_triage(detected: List[str], triaged: List[str]) -> Optio
             return s
     return None
 
+DEFAULT_PATHWAYS = {"headache": "headache_sah", "chest pain": "chest pain_cardiac", "blackout": "blackout_cardiac", "dysuria": "dysuria_uti"}
+
 def resolve_pathway(symptom_key: str, current_pathway: Optional[str]) -> str:
     if current_pathway:
         return current_pathway
-    return {"headache": "headache_sah", "chest pain": "chest pain_cardiac", "blackout": "blackout_cardiac", "dysuria": "dysuria_uti"}.get(symptom_key, symptom_key)
+    return DEFAULT_PATHWAYS.get(symptom_key, symptom_key)
 
 def determine_branch(symptom_key: str, answer: str, question: str) -> Optional[str]:
     answer_lower = answer.lower()
@@ -293,21 +388,154 @@ def determine_branch(symptom_key: str, answer: str, question: str) -> Optional[s
         return "dysuria_uti" if (is_affirmative(answer) or any(w in answer_lower for w in ["frequency", "urgency", "lower abdomen", "bladder", "keep going toilet"])) else "dysuria_sti"
     return None
 
+BRANCH_QUESTIONS = {"headache": HEADACHE_BRANCH_Q, "chest pain": CHEST_BRANCH_Q, "blackout": BLACKOUT_BRANCH_Q, "dysuria": DYSURIA_BRANCH_Q}
+
 def get_branch_question(symptom_key: str) -> Optional[str]:
-    return {"headache": HEADACHE_BRANCH_Q, "chest pain": CHEST_BRANCH_Q, "blackout": BLACKOUT_BRANCH_Q, "dysuria": DYSURIA_BRANCH_Q}.get(symptom_key)
+    return BRANCH_QUESTIONS.get(symptom_key)
+
+INITIAL_QUESTIONS = {"headache": HEADACHE_INITIAL, "chest pain": CHEST_PAIN_INITIAL, "dysuria": DYSURIA_INITIAL}
 
 def get_initial_question(symptom_key: str) -> Optional[str]:
-    return {"headache": HEADACHE_INITIAL, "chest pain": CHEST_PAIN_INITIAL, "dysuria": DYSURIA_INITIAL}.get(symptom_key)
+    return INITIAL_QUESTIONS.get(symptom_key)
+
+# ── QUESTION IDS ─────────────────────────────────────────────────────────
+# Every question or prompt /triage can send, interned to a small integer
+# so the client can send history back as [[question_id, answer], ...]
+# instead of repeating each full question string. Ids are derived from the question
+# text itself (24-bit CRC), not from declaration order, so they stay the
+# same across deploys unless a question's wording actually changes. 0 is
+# the empty "question" of the opening free-text complaint.
+def _question_id(question: str) -> int:
+    return zlib.crc32(question.encode("utf-8")) & 0xFFFFFF if question else 0
+
+QUESTIONS_BY_ID: Dict[int, str] = {0: ""}
+for _question in [
+    *UNIVERSAL_INTAKE, *INITIAL_QUESTIONS.values(), *BRANCH_QUESTIONS.values(), *(q for qs in QUESTION_MAP.values() for q in qs),
+    ADDITIONAL_PROMPT, ADDITIONAL_FOLLOW_UP_PROMPT, *completion_messages.values(), *red_flag_messages.values(),
+]:
+    _qid = _question_id(_question)
+    if QUESTIONS_BY_ID.setdefault(_qid, _question) != _question:
+        raise RuntimeError(f"question id collision: {_question!r} vs {QUESTIONS_BY_ID[_qid]!r}")
+QUESTION_IDS: Dict[str, int] = {question: qid for qid, question in QUESTIONS_BY_ID.items()}
+
+def _matching_branch_questions(question: str) -> Tuple[str, ...]:
+    # Same (deliberately loose, two-way) containment test the original
+    # branch lookup used over all_answers.
+    return tuple(branch_q for branch_q in BRANCH_QUESTIONS.values() if branch_q in question or question in branch_q)
+
+# Branch questions each known question counts as answering, so recording
+# an answer is a dict lookup rather than substring tests.
+BRANCH_MATCHES_BY_QID = {qid: _matching_branch_questions(question) for qid, question in QUESTIONS_BY_ID.items()}
+
+
+# ── TRIAGE PROTOCOL TABLE ────────────────────────────────────────────────
+# The whole question graph, compiled once at import. For every
+# (symptom_key, pathway) pair a TriageProtocol holds one ProtocolStep per
+# question_index: which question the incoming message answers, what stage
+# of the protocol that is, and what to ask next. _triage_logic just looks
+# the step up and does the scoring, instead of re-deriving initial/branch
+# offsets and question positions on every request.
+#
+# Question order for a symptom: [initial] [branch] universal intake x3,
+# then the pathway's own questions. Stages, by question_index:
+STAGE_INTAKE = "intake"          # 0: free-text complaint, ask the first question
+STAGE_INITIAL = "initial"        # 1 when there is an initial AND a branch question: ask the branch question
+STAGE_LEAD_IN = "lead_in"        # answered the initial/branch question(s): start universal intake
+STAGE_UNIVERSAL = "universal"    # mid universal intake: ask the next intake question
+STAGE_PATHWAY = "pathway"        # ask the next pathway-specific question
+STAGE_COMPLETE = "complete"      # pathway questions exhausted: next symptom, or "anything else?"
+
+
+class ProtocolStep(NamedTuple):
+    stage: str
+    question: str                 # the question this index's answer responds to ("" if none)
+    next_question: Optional[str]  # None once the protocol is complete
+    next_index: int
+
+
+class TriageProtocol(NamedTuple):
+    symptom_key: str
+    resolved_pathway: str         # resolve_pathway() result: scores the intake/branch/universal stages
+    pathway: str                  # pathway whose questions are asked: scores the pathway stages
+    initial_question: Optional[str]
+    branch_question: Optional[str]
+    offset: int
+    steps: Tuple[ProtocolStep, ...]
+
+    def step(self, idx: int) -> ProtocolStep:
+        if 0 <= idx < len(self.steps):
+            return self.steps[idx]
+        if idx < 0:
+            return ProtocolStep(STAGE_LEAD_IN, "", UNIVERSAL_INTAKE[0], self.offset + 1)
+        return _COMPLETE_STEP
+
+
+_COMPLETE_STEP = ProtocolStep(STAGE_COMPLETE, "", None, 0)
+
+
+def _compile_protocol(symptom_key: str, resolved_pathway: str) -> TriageProtocol:
+    initial_q = INITIAL_QUESTIONS.get(symptom_key)
+    branch_q = BRANCH_QUESTIONS.get(symptom_key)
+    pathway = resolved_pathway if QUESTION_MAP.get(resolved_pathway) else symptom_key
+    pathway_questions = QUESTION_MAP.get(pathway, [])
+    lead = [q for q in (initial_q, branch_q) if q]
+    offset = len(lead)
+    sequence = lead + UNIVERSAL_INTAKE + pathway_questions
+
+    steps = [ProtocolStep(STAGE_INTAKE, "", sequence[0], 1)]
+    for idx in range(1, len(sequence) + 1):
+        question = sequence[idx - 1]
+        if initial_q and branch_q and idx == 1:
+            steps.append(ProtocolStep(STAGE_INITIAL, question, branch_q, 2))
+        elif idx <= offset:
+            steps.append(ProtocolStep(STAGE_LEAD_IN, question, UNIVERSAL_INTAKE[0], offset + 1))
+        elif idx < offset + NUM_UNIVERSAL:
+            steps.append(ProtocolStep(STAGE_UNIVERSAL, question, sequence[idx], idx + 1))
+        elif idx < len(sequence):
+            steps.append(ProtocolStep(STAGE_PATHWAY, question, sequence[idx], idx + 1))
+        else:
+            steps.append(ProtocolStep(STAGE_COMPLETE, question, None, idx))
+    return TriageProtocol(symptom_key, resolved_pathway, pathway, initial_q, branch_q, offset, tuple(steps))
 
-def calculate_red_flag_score(all_answers: List[AnswerEntry], pathway: str) -> int:
+
+PROTOCOL_SYMPTOMS = list(SYMPTOM_KEYWORDS) + ["other"]
+TRIAGE_PROTOCOLS: Dict[Tuple[str, str], TriageProtocol] = {
+    (symptom_key, resolved): _compile_protocol(symptom_key, resolved)
+    for symptom_key in PROTOCOL_SYMPTOMS
+    for resolved in dict.fromkeys(list(QUESTION_MAP) + PROTOCOL_SYMPTOMS)
+}
+FIRST_QUESTIONS = {symptom_key: TRIAGE_PROTOCOLS[(symptom_key, resolve_pathway(symptom_key, None))].steps[0].next_question for symptom_key in PROTOCOL_SYMPTOMS}
+
+
+def get_protocol(symptom_key: str, current_pathway: Optional[str]) -> TriageProtocol:
+    resolved = resolve_pathway(symptom_key, current_pathway)
+    protocol = TRIAGE_PROTOCOLS.get((symptom_key, resolved))
+    if protocol is None:
+        # A symptom or pathway name the table doesn't know (only possible if
+        # the client posts one) -- compiled on the fly, deliberately NOT
+        # cached, so arbitrary client strings can't grow the table.
+        protocol = _compile_protocol(symptom_key, resolved)
+    return protocol
+
+
+def get_first_question(symptom_key: str) -> str:
+    first = FIRST_QUESTIONS.get(symptom_key)
+    return first if first is not None else get_protocol(symptom_key, None).steps[0].next_question
+
+def answer_red_flag_weight(answer: str, pathway: str) -> int:
+    """Weight of the first trigger tier the answer hits (0 if none). The
+    tiers are short keyword lists; a compiled per-pathway matcher is no
+    faster on short answers and about half as fast on long ones
+    (bench_red_flags.py times both)."""
     rules = red_flag_rules.get(pathway, red_flag_rules["other"])
-    score = 0
-    for entry in all_answers:
-        answer_lower = entry.answer.lower()
-        for weight, keywords in rules["triggers"]:
-            if any(kw in answer_lower for kw in keywords):
-                score += weight
-                break
+    answer_lower = answer.lower()
+    for weight, keywords in rules["triggers"]:
+        if any(kw in answer_lower for kw in keywords):
+            return weight
+    return 0
+
+def calculate_red_flag_score(all_answers: List[AnswerEntry], pathway: str) -> int:
+    score = sum(answer_red_flag_weight(entry.answer, pathway) for entry in all_answers)
     return max(score, 0)
 
 def determine_risk_level(score: int, pathway: str) -> str:
@@ -320,15 +548,230 @@ def determine_risk_level(score: int, pathway: str) -> str:
     return "low"
 
 def check_red_flags(all_answers: List[AnswerEntry], pathway: str) -> tuple:
-    score = calculate_red_flag_score(all_answers, pathway)
+    return red_flag_status(calculate_red_flag_score(all_answers, pathway), pathway)
+
+def red_flag_status(score: int, pathway: str) -> tuple:
     rules = red_flag_rules.get(pathway, red_flag_rules["other"])
     return score >= rules["threshold"], determine_risk_level(score, pathway)
 
+
+class TriageHistory:
+    """
+    The answer history of one triage session, plus running totals of
+    everything _triage_logic derives from it: the red-flag score per
+    pathway, the differential keyword hits per pathway, and the answer to
+    each branch question. Totals are brought up to date lazily, the first
+    time a pathway is asked for, and only over answers appended since --
+    so a session kept across turns (incremental mode) scores each answer
+    once instead of re-scoring the whole history on every turn.
+
+    Results are identical to check_red_flags/generate_differentials over
+    the same list of AnswerEntry objects.
+    """
+
+    def __init__(self):
+        self.questions: List[str] = []
+        self.answers: List[str] = []
+        self._red_flag: Dict[str, List[int]] = {}  # pathway -> [score, answers scored]
+        self._differentials: Dict[str, tuple] = {}  # pathway -> (keyword hits, answers scanned)
+        self._branch_answers: Dict[str, str] = {}  # branch question -> first matching answer
+
+    @classmethod
+    def from_entries(cls, entries: List[AnswerEntry]) -> "TriageHistory":
+        history = cls()
+        for entry in entries:
+            history.append(entry.question, entry.answer)
+        return history
+
+    @classmethod
+    def from_compact(cls, pairs: List[Tuple[int, str]]) -> "TriageHistory":
+        history = cls()
+        for qid, answer in pairs:
+            history.append(QUESTIONS_BY_ID[qid], answer)
+        return history
+
+    @classmethod
+    def from_input(cls, symptom: "SymptomInput") -> "TriageHistory":
+        if symptom.history is not None:
+            return cls.from_compact(symptom.history)
+        return cls.from_entries(symptom.all_answers or [])
+
+    def __len__(self) -> int:
+        return len(self.answers)
+
+    def to_dict(self) -> dict:
+        return {
+            "questions": self.questions,
+            "answers": self.answers,
+            "red_flag": self._red_flag,
+            "differentials": {p: [sorted(hits), n] for p, (hits, n) in self._differentials.items()},
+            "branch_answers": self._branch_answers,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TriageHistory":
+        history = cls()
+        history.questions = list(data["questions"])
+        history.answers = list(data["answers"])
+        history._red_flag = {p: list(totals) for p, totals in data["red_flag"].items()}
+        history._differentials = {p: (frozenset(hits), n) for p, (hits, n) in data["differentials"].items()}
+        history._branch_answers = dict(data["branch_answers"])
+        return history
+
+    def append(self, question: str, answer: str):
+        self.questions.append(question)
+        self.answers.append(answer)
+        qid = QUESTION_IDS.get(question)
+        branch_matches = BRANCH_MATCHES_BY_QID[qid] if qid is not None else _matching_branch_questions(question)
+        for branch_q in branch_matches:
+            self._branch_answers.setdefault(branch_q, answer)
+
+    def truncate(self, length: int):
+        """Drops answers past `length` -- used when a client retries a turn."""
+        if length >= len(self.answers):
+            return
+        entries = [AnswerEntry(question=q, answer=a) for q, a in zip(self.questions[:length], self.answers[:length])]
+        self.__dict__.update(TriageHistory.from_entries(entries).__dict__)
+
+    def branch_answer(self, branch_q: str) -> Optional[str]:
+        return self._branch_answers.get(branch_q)
+
+    def red_flag_score(self, pathway: str) -> int:
+        totals = self._red_flag.setdefault(pathway, [0, 0])
+        for answer in self.answers[totals[1]:]:
+            totals[0] += answer_red_flag_weight(answer, pathway)
+        totals[1] = len(self.answers)
+        return max(totals[0], 0)
+
+    def red_flags(self, pathway: str) -> tuple:
+        return red_flag_status(self.red_flag_score(pathway), pathway)
+
+    def differentials(self, pathway: str) -> List[str]:
+        if pathway not in DIFFERENTIAL_CANDIDATES:
+            return []
+        hits, scanned = self._differentials.get(pathway, (frozenset(), 0))
+        if scanned < len(self.answers):
+            # generate_differentials matches against all answers joined with
+            # spaces, so a keyword can straddle two answers. Carrying the last
+            # (longest keyword - 1) characters of what was already scanned
+            # catches exactly those matches without rescanning the rest.
+            new_text = " ".join(a.lower() for a in self.answers[scanned:])
+            if scanned:
+                new_text = self._tail(scanned, DIFFERENTIAL_MAX_KEYWORD_LEN[pathway] - 1) + " " + new_text
+            hits = hits | DIFFERENTIAL_MATCHERS[pathway].labels(new_text)
+            self._differentials[pathway] = (hits, len(self.answers))
+        return rank_differentials(pathway, hits)
+
+    def _tail(self, end: int, size: int) -> str:
+        """Last `size` characters of the first `end` answers, lowercased and space-joined."""
+        parts = []
+        length = 0
+        for answer in reversed(self.answers[:end]):
+            parts.append(answer.lower())
+            length += len(answer) + 1
+            if length > size:
+                break
+        return " ".join(reversed(parts))[-size:] if size > 0 else ""
+
+
+# Server-side histories for sessions that opted into incremental mode,
+# keyed by session_id. Bounded and TTL-evicted -- see session_store.py for
+# the backend options (encode/decode are only used by the SQLite backend).
+_triage_sessions = create_session_store(
+    encode=lambda history: json.dumps(history.to_dict()),
+    decode=lambda state: TriageHistory.from_dict(json.loads(state)),
+)
+metrics.register_stats("triage_sessions", _triage_sessions.stats)
+
+
+def _session_history(symptom: "SymptomInput") -> TriageHistory:
+    """
+    Picks up the stored history for an incremental-mode request; call it
+    holding _session_lock(session_id). answer_count must be the stored
+    count (the next turn) or one less (a retry of the last turn, which is
+    rolled back first). Otherwise -- no server copy, or the client has
+    moved on without it -- the history is rebuilt from the posted
+    all_answers/history, which must then hold answer_count answers.
+    Anything else is a 409, never a guess that could count an answer twice.
+    """
+    expected = symptom.answer_count
+    if expected is None:
+        raise HTTPException(status_code=422, detail="answer_count is required with incremental=true")
+    history = _triage_sessions.get(symptom.session_id)
+    if history is not None and expected in (len(history), len(history) - 1):
+        history.truncate(expected)
+        return history
+    if symptom.posted_answer_count() == expected:
+        return TriageHistory.from_input(symptom)
+    stored = len(history) if history is not None else 0
+    raise HTTPException(
+        status_code=409,
+        detail=f"answer_count {expected} does not follow the {stored} answer(s) stored for this session; "
+               f"re-post all_answers to resync",
+    )
+
+
+# Incremental turns of one session are serialised: the memory backend hands
+# out its live TriageHistory, so a double-tapped request must not read or
+# mutate it while another turn of the same session is in flight. A fixed
+# set of striped locks keeps the table bounded whatever the session count.
+_SESSION_LOCKS = [threading.Lock() for _ in range(64)]
+
+
+def _session_lock(session_id: str) -> threading.Lock:
+    return _SESSION_LOCKS[hash(session_id) % len(_SESSION_LOCKS)]
+
+# Symptom, pathway and phase names, in a fixed order -- state tokens
+# store each as a one-byte index into this list.
+STATE_TOKEN_NAMES = list(dict.fromkeys(PROTOCOL_SYMPTOMS + list(QUESTION_MAP) + ["triage", "additional", "done"]))
+_state_codec = create_state_codec(STATE_TOKEN_NAMES, QUESTION_IDS, QUESTIONS_BY_ID)
+
+
+def _restore_from_state_token(symptom: SymptomInput) -> tuple:
+    """
+    Decodes symptom.state_token into a SymptomInput (built WITHOUT
+    re-validation -- the signature already vouches for every field) and the
+    TriageHistory it carried. 422 for a token this server can't verify.
+    """
+    decoded = _state_codec.decode(symptom.state_token) if _state_codec else None
+    if decoded is None:
+        raise HTTPException(status_code=422, detail="Invalid or expired state_token")
+    state, pairs = decoded
+    restored = SymptomInput.model_construct(
+        message=symptom.message, session_id=symptom.session_id, use_state_token=True, **state
+    )
+    history = TriageHistory()
+    for question, answer in pairs:
+        history.append(question, answer)
+    return restored, history
+
+
+def _issue_state_token(result: dict, history: TriageHistory) -> Optional[str]:
+    try:
+        return _state_codec.encode(result, list(zip(history.questions, history.answers)))
+    except Exception as e:
+        # Only reachable with client-supplied values that don't fit the
+        # packed format (e.g. hundreds of "detected" symptoms) -- the
+        # response is still valid, the client just keeps using JSON.
+        print(f"[state_token] could not issue token: {e}")
+        return None
+
+
 @app.get("/")
 def root():
     return {"message": "Triage AI Backend Running"}
 
-def _triage_logic(symptom: SymptomInput) -> dict:
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Counters, latency histograms and cache/queue stats for THIS worker
+    process (see metrics.py) -- e.g. reverse-geocode cache hit rate and
+    latency saved, session store size, emergency dispatch queue depth.
+    """
+    return metrics.snapshot()
+
+def _triage_logic(symptom: SymptomInput, history: Optional[TriageHistory] = None) -> dict:
     detected_symptoms = list(symptom.detected_symptoms or [])
     triaged_symptoms = list(symptom.triaged_symptoms or [])
     current_pathway = symptom.current_pathway
@@ -346,93 +789,45 @@ def _triage_logic(symptom: SymptomInput) -> dict:
             symptom_key = "other"
 
     idx = symptom.question_index
-    all_answers = list(symptom.all_answers or [])
-
-    has_initial = get_initial_question(symptom_key) is not None
-    has_branch = get_branch_question(symptom_key) is not None
-
-    offset = 0
-    if has_initial:
-        offset += 1
-    if has_branch:
-        offset += 1
-
-    current_question = ""
-    if has_initial and idx == 1:
-        current_question = get_initial_question(symptom_key) or ""
-    elif has_branch and idx == (2 if has_initial else 1):
-        current_question = get_branch_question(symptom_key) or ""
-    elif offset < idx <= offset + NUM_UNIVERSAL:
-        u_idx = idx - offset - 1
-        if 0 <= u_idx < NUM_UNIVERSAL:
-            current_question = UNIVERSAL_INTAKE[u_idx]
-    else:
-        pathway = resolve_pathway(symptom_key, current_pathway)
-        questions = QUESTION_MAP.get(pathway, QUESTION_MAP.get(symptom_key, []))
-        q_idx = idx - offset - NUM_UNIVERSAL - 1
-        if 0 <= q_idx < len(questions):
-            current_question = questions[q_idx]
-
-    all_answers.append(AnswerEntry(question=current_question, answer=symptom.message))
-
-    if idx == 0:
-        early_pathway = resolve_pathway(symptom_key, current_pathway)
-        early_rf, early_rl = check_red_flags(all_answers, early_pathway)
-        early_rfm = red_flag_messages.get(early_pathway) if early_rf else None
-        if has_initial:
-            return {"symptom_type": symptom_key, "question_index": 1, "phase": "triage", "next_question": get_initial_question(symptom_key), "red_flag": early_rf, "red_flag_message": early_rfm, "risk_level": early_rl, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": []}
-        elif has_branch:
-            return {"symptom_type": symptom_key, "question_index": 1, "phase": "triage", "next_question": get_branch_question(symptom_key), "red_flag": early_rf, "red_flag_message": early_rfm, "risk_level": early_rl, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": []}
-        else:
-            return {"symptom_type": symptom_key, "question_index": 1, "phase": "triage", "next_question": UNIVERSAL_INTAKE[0], "red_flag": early_rf, "red_flag_message": early_rfm, "risk_level": early_rl, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": []}
-
-    if has_initial and has_branch and idx == 1:
-        b_pathway = resolve_pathway(symptom_key, current_pathway)
-        b_rf, b_rl = check_red_flags(all_answers, b_pathway)
-        b_rfm = red_flag_messages.get(b_pathway) if b_rf else None
-        return {"symptom_type": symptom_key, "question_index": 2, "phase": "triage", "next_question": get_branch_question(symptom_key), "red_flag": b_rf, "red_flag_message": b_rfm, "risk_level": b_rl, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": []}
-
-    if not current_pathway and has_branch:
-        branch_q = get_branch_question(symptom_key)
-        branch_answer = None
-        for entry in all_answers:
-            if branch_q and (branch_q in entry.question or entry.question in branch_q):
-                branch_answer = entry.answer
-                break
+    if history is None:
+        history = TriageHistory.from_input(symptom)
+
+    protocol = get_protocol(symptom_key, current_pathway)
+    step = protocol.step(idx)
+    history.append(step.question, symptom.message)
+
+    if step.stage in (STAGE_INTAKE, STAGE_INITIAL):
+        early_rf, early_rl = history.red_flags(protocol.resolved_pathway)
+        early_rfm = red_flag_messages.get(protocol.resolved_pathway) if early_rf else None
+        return {"symptom_type": symptom_key, "question_index": step.next_index, "phase": "triage", "next_question": step.next_question, "red_flag": early_rf, "red_flag_message": early_rfm, "risk_level": early_rl, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": []}
+
+    if not current_pathway and protocol.branch_question:
+        branch_q = protocol.branch_question
+        branch_answer = history.branch_answer(branch_q)
         if branch_answer is None:
-            return {"symptom_type": symptom_key, "question_index": idx + 1, "phase": "triage", "next_question": get_branch_question(symptom_key), "red_flag": False, "red_flag_message": None, "risk_level": "low", "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": None, "transition_message": None, "differential_diagnoses": []}
+            return {"symptom_type": symptom_key, "question_index": idx + 1, "phase": "triage", "next_question": branch_q, "red_flag": False, "red_flag_message": None, "risk_level": "low", "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": None, "transition_message": None, "differential_diagnoses": []}
         new_pathway = determine_branch(symptom_key, branch_answer, branch_q)
         if new_pathway:
             current_pathway = new_pathway
+            protocol = get_protocol(symptom_key, current_pathway)
+            step = protocol.step(idx)
 
-    if idx <= offset or (offset < idx <= offset + NUM_UNIVERSAL):
-        early_pathway = resolve_pathway(symptom_key, current_pathway)
-        early_rf, early_rl = check_red_flags(all_answers, early_pathway)
-        early_rfm = red_flag_messages.get(early_pathway) if early_rf else None
+    if step.stage in (STAGE_LEAD_IN, STAGE_UNIVERSAL):
+        early_rf, early_rl = history.red_flags(protocol.resolved_pathway)
+        early_rfm = red_flag_messages.get(protocol.resolved_pathway) if early_rf else None
 
         if current_pathway in INSTANT_RED_FLAG_PATHWAYS and not early_rf:
             early_rf = True
             early_rl = "high"
             early_rfm = red_flag_messages.get(current_pathway)
 
-        if idx <= offset:
-            return {"symptom_type": symptom_key, "question_index": offset + 1, "phase": "triage", "next_question": UNIVERSAL_INTAKE[0], "red_flag": early_rf, "red_flag_message": early_rfm, "risk_level": early_rl, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": []}
-
-        u_idx = idx - offset
-        if u_idx < NUM_UNIVERSAL:
-            return {"symptom_type": symptom_key, "question_index": idx + 1, "phase": "triage", "next_question": UNIVERSAL_INTAKE[u_idx], "red_flag": early_rf, "red_flag_message": early_rfm, "risk_level": early_rl, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": []}
+        return {"symptom_type": symptom_key, "question_index": step.next_index, "phase": "triage", "next_question": step.next_question, "red_flag": early_rf, "red_flag_message": early_rfm, "risk_level": early_rl, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": []}
 
-    pathway = resolve_pathway(symptom_key, current_pathway)
-    questions = QUESTION_MAP.get(pathway, [])
-    if not questions:
-        questions = QUESTION_MAP.get(symptom_key, [])
-        pathway = symptom_key
+    pathway = protocol.pathway
 
-    pathway_q_idx = idx - offset - NUM_UNIVERSAL
-
-    red_flag, risk_level = check_red_flags(all_answers, pathway)
+    red_flag, risk_level = history.red_flags(pathway)
     red_flag_message = red_flag_messages.get(pathway) if red_flag else None
-    differentials = generate_differentials(pathway, all_answers)
+    differentials = history.differentials(pathway)
 
     if red_flag and pathway in ("suicidal thoughts", "overdose") and idx <= 2:
         return {"symptom_type": symptom_key, "question_index": idx, "phase": "done", "next_question": red_flag_messages[pathway], "red_flag": True, "red_flag_message": red_flag_messages[pathway], "risk_level": "high", "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": differentials}
@@ -446,28 +841,21 @@ def _triage_logic(symptom: SymptomInput) -> dict:
             if remaining:
                 next_sym = get_next_symptom_to_triage(detected_symptoms, triaged_symptoms_updated)
                 if next_sym:
-                    next_initial = get_initial_question(next_sym)
-                    next_branch = get_branch_question(next_sym)
-                    first_q = next_initial or next_branch or UNIVERSAL_INTAKE[0]
-                    return {"symptom_type": next_sym, "question_index": 1, "phase": "triage", "next_question": first_q, "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms_updated, "current_pathway": None, "transition_message": f"Thank you. Now let me ask you about your {next_sym}.", "differential_diagnoses": differentials}
+                    return {"symptom_type": next_sym, "question_index": 1, "phase": "triage", "next_question": get_first_question(next_sym), "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms_updated, "current_pathway": None, "transition_message": f"Thank you. Now let me ask you about your {next_sym}.", "differential_diagnoses": differentials}
             return {"symptom_type": symptom_key, "question_index": idx, "phase": "done", "next_question": completion_messages[risk_level], "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": differentials}
         else:
-            return {"symptom_type": symptom_key, "question_index": idx, "phase": "additional", "next_question": "Thank you for sharing that. Is there anything else you would like to add?", "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": differentials}
+            return {"symptom_type": symptom_key, "question_index": idx, "phase": "additional", "next_question": ADDITIONAL_FOLLOW_UP_PROMPT, "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": differentials}
 
-    if pathway_q_idx >= len(questions):
+    if step.stage == STAGE_COMPLETE:
         triaged_symptoms_updated = triaged_symptoms + [symptom_key]
         remaining = [s for s in detected_symptoms if s not in triaged_symptoms_updated]
         if remaining:
             next_sym = get_next_symptom_to_triage(detected_symptoms, triaged_symptoms_updated)
-            next_initial = get_initial_question(next_sym)
-            next_branch = get_branch_question(next_sym)
-            first_q = next_initial or next_branch or UNIVERSAL_INTAKE[0]
-            return {"symptom_type": next_sym, "question_index": 1, "phase": "triage", "next_question": first_q, "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms_updated, "current_pathway": None, "transition_message": f"Thank you. Now let me ask you about your {next_sym}.", "differential_diagnoses": differentials}
+            return {"symptom_type": next_sym, "question_index": 1, "phase": "triage", "next_question": get_first_question(next_sym), "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms_updated, "current_pathway": None, "transition_message": f"Thank you. Now let me ask you about your {next_sym}.", "differential_diagnoses": differentials}
         else:
-            return {"symptom_type": symptom_key, "question_index": idx, "phase": "additional", "next_question": "Is there anything else you would like to add, or any other symptoms you would like to mention?", "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": differentials}
+            return {"symptom_type": symptom_key, "question_index": idx, "phase": "additional", "next_question": ADDITIONAL_PROMPT, "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": differentials}
 
-    next_question = questions[pathway_q_idx]
-    return {"symptom_type": symptom_key, "question_index": idx + 1, "phase": "triage", "next_question": next_question, "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": differentials}
+    return {"symptom_type": symptom_key, "question_index": step.next_index, "phase": "triage", "next_question": step.next_question, "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": differentials}
 
 
 @app.post("/triage")
@@ -478,8 +866,47 @@ def triage(symptom: SymptomInput):
     red flag and — if found — automatically triggers a Twilio voice call
     to the clinical contact number. This wrapper approach means none of
     the original branching logic above had to be touched.
+
+    Sessions that send incremental=true (with answer_count, 0 to begin
+    with) have their answer history kept server-side (see TriageHistory),
+    and get an answer_count back to echo on the next call instead of
+    re-posting all_answers. Turns of one such session run one at a time.
+
+    Every response carries question_id, the QUESTION_IDS id of
+    next_question, so the client can post history as
+    [[question_id, answer], ...].
+
+    With TRIAGE_STATE_SECRET set, a client can instead opt into signed
+    state tokens (use_state_token=true): each response then carries a
+    state_token, and the next call only needs message + state_token. The
+    token carries the answer history itself, so incremental mode isn't
+    used alongside it.
+
+    The emergency calls themselves are queued on emergency_dispatcher
+    rather than placed inline, so a high-risk patient gets their response
+    straight away; emergency_call carries a dispatch_id to poll at
+    GET /emergency-dispatch/{dispatch_id}.
     """
-    result = _triage_logic(symptom)
+    history = None
+    incremental = False
+    if symptom.state_token:
+        symptom, history = _restore_from_state_token(symptom)
+    else:
+        incremental = bool(symptom.incremental and symptom.session_id)
+    with _session_lock(symptom.session_id) if incremental else nullcontext():
+        if incremental:
+            history = _session_history(symptom)
+        elif symptom.use_state_token and _state_codec and history is None:
+            history = TriageHistory.from_input(symptom)
+
+        result = _triage_logic(symptom, history)
+        result["question_id"] = QUESTION_IDS.get(result.get("next_question"))
+
+        if symptom.use_state_token and _state_codec:
+            result["state_token"] = _issue_state_token(result, history)
+        elif incremental:
+            _triage_sessions.put(symptom.session_id, history)
+            result["answer_count"] = len(history)
 
     if result.get("red_flag") and result.get("risk_level") == "high":
         session_id = symptom.session_id or "anonymous-session"
@@ -488,17 +915,37 @@ def triage(symptom: SymptomInput):
         # detection wired in yet — TriageChat.js doesn't run the GPS/IP
         # detection logic that SystemSelector.js now has. Known gap, not
         # forgotten — TriageChat.js isn't currently in the live patient flow.
-        call_result = trigger_emergency_call(
+        call_kwargs = dict(
             session_id=session_id,
             severity=10,
             symptom=result.get("symptom_type", "unspecified"),
             location="location unavailable — TriageChat.js has no location detection built yet",
         )
+        call_result = emergency_dispatcher.submit(**call_kwargs)
+        if call_result is None:
+            # Dispatcher not running (e.g. app served without its lifespan
+            # events) -- place the calls inline, as before, rather than not at all.
+            call_result = trigger_emergency_call(**call_kwargs)
         result["emergency_call"] = call_result
 
     return result
 
 
+@app.get("/emergency-dispatch/{dispatch_id}")
+def emergency_dispatch_status(dispatch_id: str):
+    """
+    Polls a call dispatch queued by /triage. status moves queued ->
+    calling -> call_placed (or error, or skipped if another replica had
+    already placed the calls), and once finished the record has
+    the same clinical_contact_call / call_911 results that
+    trigger_emergency_call() returns, each with the attempts it took.
+    """
+    record = emergency_dispatcher.status(dispatch_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired dispatch_id")
+    return record
+
+
 class EmergencyCallRequest(BaseModel):
     session_id: str
     symptom: str
@@ -524,13 +971,15 @@ def trigger_emergency_call_endpoint(payload: EmergencyCallRequest):
     same accuracy Google Maps would show), they're reverse-geocoded into a
     real street address and spoken in the call, rather than just naming a
     city. Falls back to the vague text description only if coordinates
-    aren't available or the geocode lookup fails.
+    aren't available or the geocode lookup fails. The lookup is bounded by
+    REVERSE_GEOCODE_BUDGET_MS (see reverse_geocode_within), so a slow
+    Geoapify delays the call by at most that much.
     """
     if payload.severity < 9:
         return {"status": "skipped", "reason": "severity below threshold"}
 
     if payload.lat is not None and payload.lng is not None:
-        spoken_location = reverse_geocode(payload.lat, payload.lng)
+        spoken_location = reverse_geocode_within(payload.lat, payload.lng)
     else:
         spoken_location = payload.location or "location unavailable — patient's browser could not determine it"
 
@@ -584,6 +1033,9 @@ def emergency_call_911_twiml(
 # Per requirements doc Step 1: "The system should be able to keep track of
 # events - DATABASE." Writes to triage_events (see triage_schema.sql).
 class EventLogRequest(BaseModel):
+    # Optional client-generated id (e.g. a UUID), the same on every retry of
+    # one event -- retries are then stored once. See event_writer.py.
+    event_id: Optional[str] = Field(default=None, max_length=128)
     session_id: str
     event_type: str
     patient_id: Optional[str] = None
@@ -595,18 +1047,26 @@ class EventLogRequest(BaseModel):
 
 
 @app.post("/log-event")
-def log_event_endpoint(payload: EventLogRequest):
+async def log_event_endpoint(payload: EventLogRequest):
     """
     Fire-and-forget event logging, called from the frontend at
     meaningful moments (card picked, symptom rated, routed to
     ER/walk-in/911, Twilio call result, location detected/confirmed).
 
-    Never blocks or fails the patient's actual flow — log_event()
-    itself catches all errors internally and returns a status dict
-    rather than raising, so even a Supabase outage can't break
-    anything the patient is doing.
+    Never blocks or fails the patient's actual flow — the row is handed
+    to the background event writer (event_writer.py), which batches it
+    into a multi-row insert, and this returns {"status": "queued"} at
+    once. Only if the writer can't take it (not running, or its buffer is
+    full) is it written inline with log_event(), which catches all errors
+    internally, so even a Supabase outage can't break anything the
+    patient is doing.
+
+    A retry carrying the event_id of an event already stored is answered
+    "duplicate" without writing anything.
     """
-    result = log_event(
+    if payload.event_id and event_writer.seen_event_id(payload.event_id):
+        return {"status": "duplicate", "event_id": payload.event_id}
+    row = event_row(
         session_id=payload.session_id,
         event_type=payload.event_type,
         patient_id=payload.patient_id,
@@ -615,10 +1075,102 @@ def log_event_endpoint(payload: EventLogRequest):
         severity=payload.severity,
         location_region=payload.location_region,
         metadata=payload.metadata,
+        event_id=payload.event_id,
     )
+    queued = event_writer.submit(row)
+    if queued is not None:
+        return dict(queued, event_id=row["event_id"])
+    result = await asyncio.to_thread(_log_event_inline, row)
+    if payload.event_id and result.get("status") in ("logged", "duplicate"):
+        event_writer.remember_event_ids([payload.event_id])
     return result
 
 
+def _log_event_inline(row: Dict[str, Any]) -> dict:
+    session_patient.stamp([row])
+    return log_event(**row)
+
+
+_event_batch = TypeAdapter(List[EventLogRequest])
+
+
+def _parse_event_batch(body: bytes) -> Any:
+    """A JSON array of events, or NDJSON (one event per line)."""
+    text = body.decode("utf-8").strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _validation_reason(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'event'}: {err['msg']}" for err in error.errors()
+    )
+
+
+@app.post("/log-events")
+async def log_events_endpoint(request: Request):
+    """
+    Many events in one request -- what the frontend flushes on page unload
+    with navigator.sendBeacon (which can't wait for one fetch per event).
+    The body is a JSON array of /log-event payloads, or NDJSON; any
+    content type is accepted, since sendBeacon sends strings as text/plain
+    (which also spares it a CORS preflight).
+
+    The batch is validated in one pass; if anything in it is invalid, the
+    valid events are still logged and the rest listed under "rejected" by
+    index. Retries already seen (by event_id) are counted as duplicates.
+    The rest go to the event writer together -- one buffered append, one
+    insert -- or, if it can't take them, straight to one inline insert.
+
+    Optional environment variables (e.g. in Railway):
+        LOG_EVENTS_MAX_EVENTS   (default 500 per request)
+        LOG_EVENTS_MAX_BYTES    (default 1000000)
+    """
+    body = await request.body()
+    if len(body) > int(os.environ.get("LOG_EVENTS_MAX_BYTES", "1000000")):
+        raise HTTPException(status_code=413, detail="Event batch too large")
+    try:
+        items = _parse_event_batch(body)
+    except ValueError:  # bad JSON or bad UTF-8
+        raise HTTPException(status_code=400, detail="Body must be a JSON array of events or NDJSON")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array of events or NDJSON")
+    if len(items) > int(os.environ.get("LOG_EVENTS_MAX_EVENTS", "500")):
+        raise HTTPException(status_code=413, detail="Too many events in one batch")
+
+    rejected = []
+    try:
+        events = _event_batch.validate_python(items)
+    except ValidationError:
+        events = []
+        for index, item in enumerate(items):
+            try:
+                events.append(EventLogRequest.model_validate(item))
+            except ValidationError as e:
+                rejected.append({"index": index, "reason": _validation_reason(e)})
+
+    rows, client_ids, duplicates = [], set(), 0
+    for event in events:
+        if event.event_id:
+            if event.event_id in client_ids or event_writer.seen_event_id(event.event_id):
+                duplicates += 1
+                continue
+            client_ids.add(event.event_id)
+        rows.append(event_row(**event.model_dump()))
+
+    counts = {"accepted": len(rows), "duplicates": duplicates, "rejected": rejected}
+    if not rows:
+        return {"status": "no_events", **counts}
+    queued = event_writer.submit_many(rows)
+    if queued is not None:
+        return {**queued, **counts}
+    result = await asyncio.to_thread(session_patient.insert_attributed_events, rows)
+    if result.get("status") == "logged":
+        event_writer.remember_event_ids(client_ids)
+    return {**result, **counts}
+
+
 # ── PATIENT REGISTRATION ──────────────────────────────────────────────────
 # Per requirements doc Section 3. Registration is optional and does NOT
 # require any login/auth — this just stores whichever fields the patient
@@ -694,6 +1246,9 @@ class VerifyOtpRequest(BaseModel):
     phone_number: str
     code: str
     health_card_number: str
+    # The triage session the patient is logging in from, if any -- its
+    # events (past and future) are then attributed to them.
+    session_id: Optional[str] = None
 
 
 @app.post("/patient-login/verify-otp")
@@ -702,7 +1257,9 @@ def verify_otp_endpoint(payload: VerifyOtpRequest):
     Verifies the OTP, then finds or creates the triage_registration
     matching this health card number. Returns patient_id on success —
     the frontend saves this (savePatientId) so future events on this
-    device are linked, same as a normal registration.
+    device are linked, same as a normal registration. With session_id,
+    the session is also linked server-side (session_patient.py), so its
+    events get the patient_id even when the frontend doesn't send it.
     """
     otp_result = check_otp(payload.phone_number, payload.code)
     if otp_result.get("status") != "approved":
@@ -712,6 +1269,8 @@ def verify_otp_endpoint(payload: VerifyOtpRequest):
         payload.health_card_number,
         extra_fields={"phone_number": payload.phone_number},
     )
+    if payload.session_id and result.get("status") in ("found", "created"):
+        result = {**result, "session_link": session_patient.link(payload.session_id, result["id"])["status"]}
     return result
 
 
@@ -752,14 +1311,15 @@ def staff_link_patient(payload: LinkPatientRequest):
     """
     Nurse enters a health card number for a patient who used the app
     anonymously, then showed up in person. Finds or creates that
-    patient's triage_registration, then retroactively attaches their
-    patient_id to every event from that session.
+    patient's triage_registration, then links the session to them: one
+    upsert, plus a chunked backfill attaching the session's existing
+    events (session_patient.py), whose count is returned as rows_updated.
     """
     _check_staff_access(payload.access_code)
     found = find_or_create_by_health_card(payload.health_card_number)
     if found.get("status") == "error":
         return found
-    link_result = link_session_to_patient(payload.full_session_id, found["id"])
+    link_result = session_patient.link(payload.full_session_id, found["id"], backfill_now=True)
     return {**link_result, "patient_id": found["id"]}
 
 
@@ -770,4 +1330,14 @@ def staff_link_patient(payload: LinkPatientRequest):
 # Overpass itself.
 @app.get("/find-walkin-clinics")
 def find_walkin_clinics_endpoint(lat: float = Query(...), lng: float = Query(...)):
-    return find_nearby_walkin_clinics(lat, lng)
\ No newline at end of file
+    """
+    Widening ring search (walkin_clinics.py), answered from the in-memory
+    clinic snapshot (clinic_index.py) for every ring it covers when one is
+    loaded and fresh and the patient is in Saskatchewan, and from Geoapify
+    via the tile cache otherwise. Once the Geoapify quota is running short
+    (geoapify_quota.py), any snapshot is better than none.
+    """
+    index = None
+    if in_saskatchewan(lat, lng):
+        index = get_clinic_index(any_age=clinic_search_degraded())
+    return find_nearby_walkin_clinics(lat, lng, index=index)
\ No newline at end of file
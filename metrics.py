@@ -0,0 +1,152 @@
+"""
+BRISK Metrics Module
+---------------------
+A tiny in-process metrics registry, served as JSON by GET /metrics, so
+we can see whether the caches and background queues are earning their
+keep (hit rates, latency saved, queue depth) without adding a metrics
+dependency.
+
+Three kinds of entry:
+  - counters   -- monotonically increasing numbers (ints or seconds);
+  - histograms -- latency distributions over fixed buckets, with
+                  count/sum/mean and bucket-estimated percentiles;
+  - stats      -- callables registered by a component (e.g. a cache's
+                  stats() method) and evaluated at read time.
+
+Like everything else in process memory, each uvicorn worker/replica
+reports only its own numbers.
+"""
+
+import bisect
+import threading
+from typing import Callable, Dict, Optional, Sequence
+
+# Seconds; tuned for network calls from ~1 ms (cache/local) up to the 6-10 s
+# upstream timeouts.
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    def __init__(self, name: str):
+        self.name = name
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    def __init__(self, name: str, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot: above the top bucket
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[slot] += 1
+            self.count += 1
+            self.sum += value
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th percentile (None if empty
+        or above the top bucket)."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for slot, n in enumerate(counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[slot] if slot < len(self.buckets) else None
+        return None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            count = self.count
+            total = self.sum
+        cumulative = {}
+        running = 0
+        for bound, n in zip(self.buckets, counts):
+            running += n
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = count
+        return {
+            "count": count,
+            "sum": round(total, 6),
+            "mean": round(total / count, 6) if count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "buckets": cumulative,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._counters: Dict[str, Counter] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._stats: Dict[str, Callable[[], dict]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str) -> Counter:
+        with self._lock:
+            if name not in self._counters:
+                self._counters[name] = Counter(name)
+            return self._counters[name]
+
+    def histogram(self, name: str, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(name, buckets)
+            return self._histograms[name]
+
+    def register_stats(self, name: str, provider: Callable[[], dict]):
+        with self._lock:
+            self._stats[name] = provider
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict(self._histograms)
+            stats = dict(self._stats)
+        result = {
+            "counters": {name: c.value for name, c in sorted(counters.items())},
+            "histograms": {name: h.snapshot() for name, h in sorted(histograms.items())},
+            "stats": {},
+        }
+        for name, provider in sorted(stats.items()):
+            try:
+                result["stats"][name] = provider()
+            except Exception as e:
+                # A broken stats provider shouldn't take /metrics down.
+                result["stats"][name] = {"status": "error", "reason": str(e)}
+        return result
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(name: str) -> Counter:
+    return REGISTRY.counter(name)
+
+
+def histogram(name: str, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.histogram(name, buckets)
+
+
+def register_stats(name: str, provider: Callable[[], dict]):
+    REGISTRY.register_stats(name, provider)
+
+
+def snapshot() -> dict:
+    return REGISTRY.snapshot()
@@ -0,0 +1,18 @@
+-- Cross-replica dedup claims for emergency calls
+-- (triage_db.claim_emergency_call_key, EMERGENCY_DEDUP_BACKEND=supabase).
+-- The primary key is what makes a claim atomic: of several concurrent
+-- inserts for the same key, exactly one succeeds.
+--
+-- Like triage_registration and triage_events, only the backend's
+-- service_role key touches this table: RLS is on with no policies.
+
+create table if not exists emergency_call_claims (
+    dedup_key  text primary key,
+    claimed_at timestamptz not null default now(),
+    expires_at timestamptz not null
+);
+
+create index if not exists emergency_call_claims_expires_at
+    on emergency_call_claims (expires_at);
+
+alter table emergency_call_claims enable row level security;
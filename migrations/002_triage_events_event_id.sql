@@ -0,0 +1,14 @@
+-- Idempotent event writes (triage_db.event_row / insert_events).
+-- Every triage_events row carries an event_id, and inserts use
+-- ON CONFLICT (event_id) DO NOTHING, so a client retry, a re-flushed
+-- batch or a replayed spool segment never stores an event twice.
+-- Rows written before this migration keep a NULL event_id; NULLs never
+-- conflict with each other, so they are unaffected.
+--
+-- The upserts need this index to exist: apply it BEFORE deploying the
+-- backend that sends event_id.
+
+alter table triage_events add column if not exists event_id text;
+
+create unique index if not exists triage_events_event_id_key
+    on triage_events (event_id);
@@ -0,0 +1,15 @@
+-- Session -> patient links (triage_db.link_session_to_patient), read by
+-- session_patient.stamp() to attribute events as they are inserted.
+-- One row per linked session, however many events it has.
+--
+-- Like the other tables, only the backend's service_role key touches
+-- this one: RLS is on with no policies.
+
+create table if not exists session_patient (
+    session_id text primary key,
+    patient_id uuid not null,  -- triage_registration.id
+    linked_at  timestamptz not null default now()
+);
+
+alter table session_patient enable row level security;
+
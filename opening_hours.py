@@ -0,0 +1,197 @@
+"""
+BRISK Opening Hours Module
+---------------------------
+Open-now / closes-soon flags for walk-in clinic results, from the OSM
+opening_hours string Geoapify passes through (e.g. "Mo-Fr 08:00-20:00;
+Sa 10:00-16:00; Su off"). Sending a patient across town to a clinic that
+closed at 8 pm wastes the one thing they can't get back.
+
+Each string is compiled ONCE into a weekly table: sorted, merged
+(start, end) intervals in minutes since Monday 00:00. Compiled tables are
+cached by place_id, so answering "open at minute m?" per request is one
+bisect, not a re-parse.
+
+Handles the common subset of the syntax: weekday ranges and lists
+(Mo-Fr, Sa,Su), several time spans per day, spans past midnight
+(22:00-02:00, or 18:00-26:00), "off"/"closed", "24/7", and later rules
+overriding earlier ones for the days they name. Public/school holiday
+selectors (PH, SH) are skipped -- we don't know the holiday calendar.
+Anything else (months, week numbers, "sunrise", open-ended "18:00+",
+comments) makes the whole string "unknown": open_now is None rather
+than a guess.
+
+Clinic times are read in CLINIC_TIMEZONE (Saskatchewan doesn't observe
+DST, so America/Regina is UTC-6 all year).
+
+Optional environment variables (e.g. in Railway):
+    CLINIC_TIMEZONE              (default America/Regina)
+    CLINIC_CLOSES_SOON_MINUTES   (default 60)
+"""
+
+import os
+import re
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Dict, List, Optional, Tuple
+
+from ttl_cache import TTLCache
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+DAYS = ("Mo", "Tu", "We", "Th", "Fr", "Sa", "Su")
+MINUTES_PER_DAY = 1440
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+_DAY = r"(?:Mo|Tu|We|Th|Fr|Sa|Su|PH|SH)"
+_DAY_SELECTOR = re.compile(rf"^({_DAY}(?:\s*-\s*{_DAY})?(?:\s*,\s*{_DAY}(?:\s*-\s*{_DAY})?)*)(?:\s+|$)")
+_TIME_SPAN = re.compile(r"^(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})$")
+
+# (raw string, compiled table or None) per place_id; keyed on the id but
+# recompiled if the string changed under it.
+_compiled = TTLCache(max_entries=5000, ttl_seconds=86400)
+
+Schedule = Tuple[Tuple[int, ...], Tuple[int, ...]]  # (starts, ends), sorted
+
+
+def parse(expression: str) -> Optional[Schedule]:
+    """Compiles an opening_hours string; None if any part of it isn't understood."""
+    days: Dict[int, List[Tuple[int, int]]] = {}
+    for rule in expression.split(";"):
+        rule = rule.strip()
+        if not rule:
+            continue
+        if rule == "24/7":
+            days = {d: [(0, MINUTES_PER_DAY)] for d in range(7)}
+            continue
+
+        selected = list(range(7))
+        match = _DAY_SELECTOR.match(rule)
+        if match:
+            selected = _parse_days(match.group(1))
+            rule = rule[match.end():].strip()
+            if selected is None:
+                return None
+            if not selected:
+                continue  # a holiday-only rule
+
+        if rule in ("off", "closed"):
+            spans = []
+        elif not rule:
+            spans = [(0, MINUTES_PER_DAY)]  # "Sa" alone: open all day
+        else:
+            spans = []
+            for part in rule.split(","):
+                span = _TIME_SPAN.match(part.strip())
+                if span is None:
+                    return None
+                h1, m1, h2, m2 = (int(g) for g in span.groups())
+                start, end = h1 * 60 + m1, h2 * 60 + m2
+                if start >= MINUTES_PER_DAY or end > 2 * MINUTES_PER_DAY or m1 > 59 or m2 > 59:
+                    return None
+                if end <= start:
+                    end += MINUTES_PER_DAY  # past midnight
+                spans.append((start, end))
+        for d in selected:
+            days[d] = spans
+
+    intervals = []
+    for d, spans in days.items():
+        for start, end in spans:
+            start, end = d * MINUTES_PER_DAY + start, d * MINUTES_PER_DAY + end
+            if end > MINUTES_PER_WEEK:  # Sunday night into Monday morning
+                intervals.append((0, end - MINUTES_PER_WEEK))
+                end = MINUTES_PER_WEEK
+            intervals.append((start, end))
+    intervals.sort()
+    merged: List[List[int]] = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return tuple(s for s, _ in merged), tuple(e for _, e in merged)
+
+
+def _parse_days(selector: str) -> Optional[List[int]]:
+    selected = []
+    for part in selector.split(","):
+        bounds = [p.strip() for p in part.split("-")]
+        if any(b in ("PH", "SH") for b in bounds):
+            if len(bounds) > 1:
+                return None
+            continue
+        first, last = DAYS.index(bounds[0]), DAYS.index(bounds[-1])
+        day = first
+        while True:  # ranges may wrap: Sa-Mo
+            selected.append(day)
+            if day == last:
+                break
+            day = (day + 1) % 7
+    return selected
+
+
+def compiled(place_id, expression: str) -> Optional[Schedule]:
+    """parse(), cached by place_id."""
+    cached = _compiled.get(place_id) if place_id is not None else None
+    if cached is not None and cached[0] == expression:
+        return cached[1]
+    try:
+        schedule = parse(expression)
+    except Exception as e:
+        print(f"[opening_hours] could not parse {expression!r}: {e}")
+        schedule = None
+    if place_id is not None:
+        _compiled.set(place_id, (expression, schedule))
+    return schedule
+
+
+def _clinic_tz() -> tzinfo:
+    name = os.environ.get("CLINIC_TIMEZONE", "America/Regina")
+    if ZoneInfo is not None:
+        try:
+            return ZoneInfo(name)
+        except Exception as e:
+            print(f"[opening_hours] unknown CLINIC_TIMEZONE {name!r}: {e}")
+    return timezone(timedelta(hours=-6))
+
+
+def minute_of_week(now: Optional[datetime] = None) -> int:
+    local = (now or datetime.now(timezone.utc)).astimezone(_clinic_tz())
+    return local.weekday() * MINUTES_PER_DAY + local.hour * 60 + local.minute
+
+
+def status(schedule: Schedule, minute: int) -> Tuple[bool, Optional[int]]:
+    """(open, minutes until it closes) at minute-of-week `minute`."""
+    starts, ends = schedule
+    i = bisect_right(starts, minute) - 1
+    if i < 0 or minute >= ends[i]:
+        return False, None
+    closes = ends[i]
+    if closes == MINUTES_PER_WEEK and starts and starts[0] == 0:
+        closes += ends[0]  # open straight through Sunday midnight
+    return True, closes - minute
+
+
+def annotate(place: dict, minute: Optional[int] = None) -> dict:
+    """{"open_now", "closes_soon", "opening_hours"} for one clinic; the flags
+    are None when its hours are missing or not understood."""
+    expression = place.get("opening_hours")
+    schedule = compiled(place.get("id"), expression) if expression else None
+    if schedule is None:
+        return {"open_now": None, "closes_soon": None, "opening_hours": expression}
+    is_open, minutes_left = status(schedule, minute_of_week() if minute is None else minute)
+    closes_soon = is_open and minutes_left <= int(os.environ.get("CLINIC_CLOSES_SOON_MINUTES", "60"))
+    return {"open_now": is_open, "closes_soon": closes_soon, "opening_hours": expression}
+
+
+def rank_key(clinic: dict) -> int:
+    """Sort key: open, then closing soon, then unknown hours, then closed.
+    Python's sort is stable, so distance order holds within each group."""
+    if clinic.get("open_now") is None:
+        return 2
+    if not clinic["open_now"]:
+        return 3
+    return 1 if clinic.get("closes_soon") else 0
@@ -17,15 +17,92 @@ for live GPS data the way a patient's own phone/carrier does — this
 reverse-geocoded address is spoken aloud in the call, read by whoever
 answers, not transmitted as structured dispatch data.
 
+CACHING: successful lookups are cached by geohash cell (see geohash.py),
+so repeated severity-10 taps from the same patient -- or from the same
+building, e.g. a care home -- resolve instantly instead of waiting on
+Geoapify again. The default precision 8 is a cell of roughly 20 m x 20 m
+in Saskatchewan: the spoken address is that of the first lookup in the
+cell, which is at worst the house next door -- the same "may be off by a
+house or two" the call script already warns about. Fallback coordinate
+strings are never cached, so an outage isn't remembered.
+
+Cache hits/misses, the latency saved by hits (estimated from the running
+average of real Geoapify lookups) and the Geoapify latency histogram are
+reported at GET /metrics.
+
+OFFLINE FALLBACK: with LOCAL_GEOCODER_PATH set, a local address-point
+index (local_geocoder.py) answers when Geoapify can't -- or, with
+REVERSE_GEOCODE_LOCAL_MODE=primary, answers FIRST wherever the local data
+has an address close enough, and Geoapify is only asked for points
+outside it.
+
+OUTAGES: Geoapify calls go through a circuit breaker (circuit_breaker.py)
+that opens after repeated failures or slow (> 3 s) answers, so during an
+outage a lookup fails over instantly instead of after the full 6 s. And
+cached addresses outlive their TTL by REVERSE_GEOCODE_CACHE_STALE_SECONDS:
+a stale one is returned at once while a background lookup refreshes it.
+
+QUOTA: lookups count against the shared Geoapify daily budget as
+"emergency" requests (geoapify_quota.py), which get a reserve that clinic
+search can't touch. Past the full daily limit, lookups fall back to local
+data or coordinates like any other failure.
+
 Requires this environment variable (e.g. in Railway):
     GEOAPIFY_API_KEY
+Optional:
+    REVERSE_GEOCODE_BUDGET_MS            (default 700; how long
+                                          /trigger-emergency-call waits for
+                                          an address before dialling with
+                                          the best one in hand; 0 = wait
+                                          for Geoapify as before)
+    REVERSE_GEOCODE_LOCAL_MODE           ("fallback" (default) or "primary")
+    REVERSE_GEOCODE_GEOHASH_PRECISION    (default 8, ~20 m cells; 9 is ~4 m)
+    REVERSE_GEOCODE_CACHE_MAX_ENTRIES    (default 5000)
+    REVERSE_GEOCODE_CACHE_TTL_SECONDS    (default 86400, i.e. 24 hours)
+    REVERSE_GEOCODE_CACHE_STALE_SECONDS  (default 604800, i.e. 7 days)
+    GEOAPIFY_BREAKER_FAILURES / GEOAPIFY_BREAKER_RESET_SECONDS
+                                         (see circuit_breaker.py)
+    GEOAPIFY_DAILY_LIMIT etc.            (see geoapify_quota.py)
 """
 
 import os
-import httpx
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional, Tuple
+
+import circuit_breaker
+import geoapify_quota
+import geohash
+import http_client
+import metrics
+from local_geocoder import get_local_geocoder
+from singleflight import singleflight
+from ttl_cache import TTLCache
 
 REVERSE_GEOCODE_URL = "https://api.geoapify.com/v1/geocode/reverse"
 
+GEOHASH_PRECISION = int(os.environ.get("REVERSE_GEOCODE_GEOHASH_PRECISION", "8"))
+_cache = TTLCache(
+    int(os.environ.get("REVERSE_GEOCODE_CACHE_MAX_ENTRIES", "5000")),
+    float(os.environ.get("REVERSE_GEOCODE_CACHE_TTL_SECONDS", "86400")),
+    stale_seconds=float(os.environ.get("REVERSE_GEOCODE_CACHE_STALE_SECONDS", "604800")),
+)
+_breaker = circuit_breaker.from_env("geoapify_reverse", "GEOAPIFY_BREAKER", slow_call_seconds=3.0)
+metrics.register_stats("reverse_geocode_cache", _cache.stats)
+
+_cache_hits = metrics.counter("reverse_geocode_cache_hits")
+_cache_misses = metrics.counter("reverse_geocode_cache_misses")
+_saved_seconds = metrics.counter("reverse_geocode_cache_saved_seconds")
+_remote_latency = metrics.histogram("reverse_geocode_remote_seconds")
+_local_hits = metrics.counter("reverse_geocode_local_hits")
+_local_latency = metrics.histogram("reverse_geocode_local_seconds")
+_budget_expired = metrics.counter("reverse_geocode_budget_expired")
+_stale_served = metrics.counter("reverse_geocode_stale_served")
+
+# Runs Geoapify lookups for reverse_geocode_within(), so a lookup can
+# outlive the caller's budget without blocking it.
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="reverse-geocode")
+
 
 def reverse_geocode(lat: float, lng: float) -> str:
     """
@@ -35,29 +112,135 @@ def reverse_geocode(lat: float, lng: float) -> str:
     itself from going out; it just falls back to raw coordinates, which
     are still genuinely useful spoken aloud, just less specific.
     """
-    api_key = os.environ.get("GEOAPIFY_API_KEY")
-    fallback = f"coordinates {lat:.4f}, {lng:.4f}"
+    return _resolve(lat, lng, None)[0]
+
+
+def reverse_geocode_within(lat: float, lng: float, budget_seconds: Optional[float] = None) -> str:
+    """
+    Hedged reverse_geocode() for the emergency path: the same sources in
+    the same order of preference (cache, then Geoapify, then the local
+    index, then raw coordinates), but never waits on Geoapify for longer
+    than budget_seconds in total (default: REVERSE_GEOCODE_BUDGET_MS;
+    a budget of 0 means no budget). When the budget runs out the best answer
+    in hand is returned at once -- the local address if there is one --
+    and the Geoapify request is left to finish in the background, so its
+    answer still lands in the cache for the patient's next tap.
+
+    Which source answered, and how long it took, is recorded per source
+    in /metrics (reverse_geocode_hedged_seconds_<source>).
+    """
+    if budget_seconds is None:
+        budget_seconds = float(os.environ.get("REVERSE_GEOCODE_BUDGET_MS", "700")) / 1000
+    started = time.perf_counter()
+    address, source = _resolve(lat, lng, budget_seconds if budget_seconds > 0 else None)
+    metrics.counter(f"reverse_geocode_hedged_wins_{source}").inc()
+    metrics.histogram(f"reverse_geocode_hedged_seconds_{source}").observe(time.perf_counter() - started)
+    return address
 
+
+def _resolve(lat: float, lng: float, budget_seconds: Optional[float]) -> Tuple[str, str]:
+    """(address, source) -- source is "cache", "stale", "remote", "local"
+    or "coordinates". budget_seconds=None waits for Geoapify as long as it takes."""
+    started = time.perf_counter()
+    cell = geohash.encode(lat, lng, GEOHASH_PRECISION)
+    cached, fresh = _cache.get_stale(cell)
+    if cached is not None:
+        if _remote_latency.count:
+            _saved_seconds.inc(_remote_latency.sum / _remote_latency.count)
+        if fresh:
+            _cache_hits.inc()
+            return cached, "cache"
+        # Past its TTL: answer now, refresh in the background.
+        _stale_served.inc()
+        _executor.submit(_lookup_remote_and_cache, cell, lat, lng)
+        return cached, "stale"
+    _cache_misses.inc()
+
+    local_first = os.environ.get("REVERSE_GEOCODE_LOCAL_MODE", "fallback").lower() == "primary"
+    if local_first:
+        local = _lookup_local(lat, lng)
+        if local:
+            return local, "local"
+
+    if budget_seconds is None:
+        formatted = _lookup_remote_and_cache(cell, lat, lng)
+    else:
+        future = _executor.submit(_lookup_remote_and_cache, cell, lat, lng)
+        try:
+            formatted = future.result(timeout=max(budget_seconds - (time.perf_counter() - started), 0))
+        except FutureTimeout:
+            _budget_expired.inc()
+            formatted = None
+    if formatted:
+        return formatted, "remote"
+
+    if not local_first:
+        local = _lookup_local(lat, lng)
+        if local:
+            return local, "local"
+    return f"coordinates {lat:.4f}, {lng:.4f}", "coordinates"
+
+
+@singleflight("reverse_geocode", key=lambda cell, lat, lng: cell)
+def _lookup_remote_and_cache(cell: str, lat: float, lng: float) -> Optional[str]:
+    """Geoapify lookup + cache fill. Concurrent lookups for the same cell
+    (the cache key) share one request -- see singleflight.py."""
+    formatted = _lookup_remote(lat, lng)
+    if formatted:
+        _cache.set(cell, formatted)
+    return formatted
+
+
+def _lookup_local(lat: float, lng: float) -> Optional[str]:
+    """Nearest address from the local index, or None (never raises) if
+    there's no index loaded or no address close enough. Not cached --
+    it's already faster than a cache miss would be to notice."""
+    geocoder = get_local_geocoder()
+    if geocoder is None:
+        return None
+    started = time.perf_counter()
+    try:
+        address = geocoder.lookup(lat, lng)
+    except Exception as e:
+        print(f"[reverse_geocode] local lookup failed: {e}")
+        address = None
+    _local_latency.observe(time.perf_counter() - started)
+    if address:
+        _local_hits.inc()
+    return address
+
+
+def _lookup_remote(lat: float, lng: float) -> Optional[str]:
+    """One Geoapify reverse lookup. Returns None (never raises) on any failure."""
+    api_key = os.environ.get("GEOAPIFY_API_KEY")
     if not api_key:
-        return fallback
+        return None
+    if not _breaker.allow():
+        return None
+    if not geoapify_quota.acquire(geoapify_quota.EMERGENCY):
+        _breaker.release()
+        return None
 
+    started = time.perf_counter()
     try:
-        with httpx.Client(timeout=6.0) as client:
-            res = client.get(REVERSE_GEOCODE_URL, params={
-                "lat": lat,
-                "lon": lng,
-                "apiKey": api_key,
-            })
-            res.raise_for_status()
-            data = res.json()
+        res = http_client.get(REVERSE_GEOCODE_URL, params={
+            "lat": lat,
+            "lon": lng,
+            "apiKey": api_key,
+        }, timeout=6.0)
+        res.raise_for_status()
+        data = res.json()
+        elapsed = time.perf_counter() - started
+        _remote_latency.observe(elapsed)
+        _breaker.record_success(elapsed)
 
         features = data.get("features", [])
         if not features:
-            return fallback
-
-        formatted = features[0].get("properties", {}).get("formatted")
-        return formatted if formatted else fallback
+            return None
+        return features[0].get("properties", {}).get("formatted") or None
 
     except Exception as e:
+        _remote_latency.observe(time.perf_counter() - started)
+        _breaker.record_failure()
         print(f"[reverse_geocode] failed: {e}")
-        return fallback
\ No newline at end of file
+        return None
@@ -0,0 +1,150 @@
+"""
+BRISK Session-Patient Module
+-----------------------------
+Attributes triage events to a patient at WRITE time. Before this, an
+event only got a patient_id if the frontend remembered to send one, and
+linking a session (staff link, or a patient logging in mid-session)
+meant one UPDATE rewriting -- and returning -- every triage_events row
+the session had.
+
+Now a link is one row in the session_patient table
+(triage_db.link_session_to_patient), and:
+
+  - stamp(rows) fills in patient_id on rows that don't carry one, from
+    that table. It runs inside insert_attributed_events(), the insert
+    the event writer and the spool replayer use (event_writer.py), so
+    events are attributed as they're stored. Lookups are cached in
+    process: linked sessions for SESSION_PATIENT_CACHE_TTL_SECONDS, and
+    sessions known NOT to be linked for SESSION_PATIENT_NEGATIVE_TTL_SECONDS
+    -- so a batch of anonymous events costs at most one query, usually
+    none. A lookup that FAILED is not cached either way: "couldn't ask"
+    is not "not linked", and the next batch asks again.
+  - link() upserts the mapping; the events already written are attached
+    by a chunked backfill (triage_db.backfill_session_events), whose row
+    counts go to /metrics. It runs twice: now, and again once any other
+    worker's "not linked" cache entry for the session has expired, to
+    catch events stamped in between. The first pass runs in a background
+    thread (a patient logging in mid-session doesn't wait for it) or,
+    with backfill_now=True, before link() returns, so the staff link
+    screen can show how many events were attached.
+
+Optional environment variables (e.g. in Railway):
+    SESSION_PATIENT_CACHE_MAX_ENTRIES      (default 10000)
+    SESSION_PATIENT_CACHE_TTL_SECONDS      (default 3600)
+    SESSION_PATIENT_NEGATIVE_TTL_SECONDS   (default 30)
+    SESSION_PATIENT_BACKFILL_CHUNK         (default 500 rows per update)
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import metrics
+from triage_db import backfill_session_events, get_session_patients, insert_events, link_session_to_patient
+from ttl_cache import TTLCache
+
+_linked = TTLCache(
+    int(os.environ.get("SESSION_PATIENT_CACHE_MAX_ENTRIES", "10000")),
+    float(os.environ.get("SESSION_PATIENT_CACHE_TTL_SECONDS", "3600")),
+)
+_unlinked = TTLCache(
+    int(os.environ.get("SESSION_PATIENT_CACHE_MAX_ENTRIES", "10000")),
+    float(os.environ.get("SESSION_PATIENT_NEGATIVE_TTL_SECONDS", "30")),
+)
+# Background backfills of already-written events.
+_backfiller = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-backfill")
+
+_stamped = metrics.counter("session_patient_rows_stamped")
+_lookups = metrics.counter("session_patient_lookups")
+_backfilled = metrics.counter("session_patient_rows_backfilled")
+_backfill_failures = metrics.counter("session_patient_backfill_failures")
+
+
+def stamp(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Sets patient_id (in place) on rows without one whose session is linked."""
+    sessions = {row["session_id"] for row in rows if not row.get("patient_id") and row.get("session_id")}
+    if not sessions:
+        return rows
+
+    patients = {}
+    unknown = []
+    for session_id in sessions:
+        patient_id = _linked.get(session_id)
+        if patient_id is not None:
+            patients[session_id] = patient_id
+        elif _unlinked.get(session_id) is None:
+            unknown.append(session_id)
+
+    if unknown:
+        _lookups.inc()
+        found = get_session_patients(unknown)
+        if found["status"] == "found":
+            linked = found["patients"]
+            for session_id in unknown:
+                if session_id in linked:
+                    patients[session_id] = linked[session_id]
+                    _linked.set(session_id, linked[session_id])
+                else:
+                    _unlinked.set(session_id, True)
+
+    for row in rows:
+        if not row.get("patient_id") and row.get("session_id") in patients:
+            row["patient_id"] = patients[row["session_id"]]
+            _stamped.inc()
+    return rows
+
+
+def insert_attributed_events(rows: List[Dict[str, Any]]) -> dict:
+    """triage_db.insert_events(), with patient_id stamped on first. Never raises."""
+    try:
+        stamp(rows)
+    except Exception as e:
+        # Attribution is an extra -- never a reason to lose the events.
+        print(f"[session_patient] stamp failed: {e}")
+    return insert_events(rows)
+
+
+def link(session_id: str, patient_id: str, backfill_now: bool = False) -> dict:
+    """
+    Maps the session to the patient (one upsert) and backfills the events
+    already written -- in the background, or with backfill_now=True before
+    returning, with the count as rows_updated. Returns statuses and
+    counts, never rows.
+    """
+    result = link_session_to_patient(session_id, patient_id)
+    if result["status"] != "linked":
+        return result
+    _linked.set(session_id, patient_id)
+    _unlinked.pop(session_id)
+    if backfill_now:
+        backfill = _backfill(session_id, patient_id)
+        result = {"status": "linked", "rows_updated": backfill.get("rows_updated", 0),
+                  "backfill": "done" if backfill["status"] == "backfilled" else backfill["status"]}
+    else:
+        _backfiller.submit(_backfill, session_id, patient_id)
+        result = {"status": "linked", "backfill": "scheduled"}
+    # Second pass, for events another worker wrote while it still had the
+    # session cached as not linked (plus a flush interval's grace).
+    delay = float(os.environ.get("SESSION_PATIENT_NEGATIVE_TTL_SECONDS", "30")) + 5
+    timer = threading.Timer(delay, _backfiller.submit, args=(_backfill, session_id, patient_id))
+    timer.daemon = True
+    timer.start()
+    return result
+
+
+def _backfill(session_id: str, patient_id: str) -> dict:
+    result = backfill_session_events(
+        session_id, patient_id, int(os.environ.get("SESSION_PATIENT_BACKFILL_CHUNK", "500"))
+    )
+    _backfilled.inc(result.get("rows_updated", 0))
+    if result["status"] != "backfilled":
+        _backfill_failures.inc()
+    return result
+
+
+def stats() -> dict:
+    return {"linked_cached": len(_linked), "unlinked_cached": len(_unlinked)}
+
+
+metrics.register_stats("session_patient", stats)
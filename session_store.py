@@ -0,0 +1,181 @@
+"""
+BRISK Session Store Module
+---------------------------
+Where server-side triage session state lives (e.g. the incremental
+TriageHistory kept per session_id by /triage), with predictable memory
+use: a hard cap on the number of sessions, least-recently-used eviction
+when the cap is hit, and an idle TTL so abandoned sessions disappear on
+their own.
+
+Two interchangeable backends:
+  - "memory" (default): a TTLCache in this process. Fastest, and values
+    are stored as live objects -- but each uvicorn worker has its own
+    copy, and a restart loses everything.
+  - "sqlite": a local SQLite file in WAL mode. Values are serialised with
+    the encode/decode functions given, so state survives a worker restart
+    and is shared by every worker on the same machine (NOT across Railway
+    replicas -- each replica has its own disk).
+
+Either way the store only ever holds an optimisation: a client that
+still has its own copy of the conversation can always rebuild from it.
+
+Optional environment variables (e.g. in Railway):
+    TRIAGE_SESSION_BACKEND        "memory" (default) or "sqlite"
+    TRIAGE_SESSION_DB_PATH        SQLite file path (default triage_sessions.db)
+    TRIAGE_SESSION_MAX_ENTRIES    hard cap on stored sessions (default 5000)
+    TRIAGE_SESSION_TTL_SECONDS    idle time before a session expires
+                                  (default 7200, i.e. 2 hours)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from ttl_cache import TTLCache
+
+
+class MemorySessionBackend:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self._cache = TTLCache(max_entries, ttl_seconds, refresh_on_get=True)
+
+    def get(self, session_id: str) -> Optional[Any]:
+        return self._cache.get(session_id)
+
+    def put(self, session_id: str, value: Any):
+        self._cache.set(session_id, value)
+
+    def delete(self, session_id: str):
+        self._cache.pop(session_id)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self._cache.stats()}
+
+
+class SQLiteSessionBackend:
+    """
+    Same eviction policy as the memory backend, enforced in SQL: rows carry
+    a last_access timestamp (wall clock, so it means the same thing to
+    every worker), expired rows are dropped when read, and after each write
+    the oldest rows beyond max_entries are deleted.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int,
+        ttl_seconds: float,
+        encode: Callable[[Any], str] = json.dumps,
+        decode: Callable[[str], Any] = json.loads,
+    ):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self._encode = encode
+        self._decode = decode
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS triage_sessions ("
+            " session_id TEXT PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS triage_sessions_last_access ON triage_sessions (last_access)"
+        )
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, session_id: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, last_access FROM triage_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if row[1] + self.ttl_seconds <= now:
+                self._conn.execute("DELETE FROM triage_sessions WHERE session_id = ?", (session_id,))
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE triage_sessions SET last_access = ? WHERE session_id = ?", (now, session_id)
+            )
+            self.hits += 1
+        return self._decode(row[0])
+
+    def put(self, session_id: str, value: Any):
+        encoded = self._encode(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO triage_sessions (session_id, state, last_access) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, last_access = excluded.last_access",
+                (session_id, encoded, now),
+            )
+            expired = self._conn.execute(
+                "DELETE FROM triage_sessions WHERE last_access <= ?", (now - self.ttl_seconds,)
+            ).rowcount
+            self.expirations += max(expired, 0)
+            evicted = self._conn.execute(
+                "DELETE FROM triage_sessions WHERE session_id IN ("
+                " SELECT session_id FROM triage_sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self.evictions += max(evicted, 0)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM triage_sessions WHERE session_id = ?", (session_id,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM triage_sessions").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def create_session_store(
+    encode: Callable[[Any], str] = json.dumps,
+    decode: Callable[[str], Any] = json.loads,
+):
+    """
+    Builds the backend selected by TRIAGE_SESSION_BACKEND. Never raises --
+    an unknown backend name, or a SQLite file that can't be opened, falls
+    back to the in-memory backend (with a log line) rather than stopping
+    the app from starting.
+    """
+    backend = os.environ.get("TRIAGE_SESSION_BACKEND", "memory").lower()
+    max_entries = int(os.environ.get("TRIAGE_SESSION_MAX_ENTRIES", "5000"))
+    ttl_seconds = float(os.environ.get("TRIAGE_SESSION_TTL_SECONDS", "7200"))
+
+    if backend == "sqlite":
+        path = os.environ.get("TRIAGE_SESSION_DB_PATH", "triage_sessions.db")
+        try:
+            return SQLiteSessionBackend(path, max_entries, ttl_seconds, encode=encode, decode=decode)
+        except Exception as e:
+            print(f"[session_store] could not open SQLite session store at {path}: {e} -- using memory")
+    elif backend != "memory":
+        print(f"[session_store] unknown TRIAGE_SESSION_BACKEND {backend!r} -- using memory")
+
+    return MemorySessionBackend(max_entries, ttl_seconds)
@@ -0,0 +1,132 @@
+"""
+BRISK Single-Flight Module
+---------------------------
+Request coalescing: when several callers ask for the SAME upstream lookup
+at the same time (a family's phones all searching for clinics, repeated
+emergency taps reverse-geocoding the same spot), only the first one --
+the "leader" -- actually calls Geoapify. The others wait for that one
+in-flight call and share its result (or its exception). Nothing is
+cached here: once the call finishes its key is forgotten, and the next
+caller starts a fresh one (the caches in front of it handle reuse).
+
+Usage, as a decorator with a function computing the key from the call's
+arguments (normalise it -- round coordinates, use the geohash cell,
+include every parameter that changes the answer):
+
+    @singleflight("reverse_geocode", key=lambda cell, lat, lng: cell)
+    def _lookup_remote_and_cache(cell, lat, lng): ...
+
+Callers are threads (the sync endpoints' threadpool and the background
+workers) -- every Geoapify call in this app is a blocking one. Every
+coalesced call increments singleflight_coalesced_<name> in /metrics.
+
+A caller with a deadline of its own must not inherit the leader's: pass
+wait=, computing from the call's arguments how long a follower may wait
+(e.g. its timeout parameter), and on_timeout=, building the result a
+follower gets when that runs out. The leader's call carries on and still
+serves everyone who is waiting for it.
+
+    @singleflight("clinic_tile", key=..., wait=lambda level_km, cell, timeout: timeout,
+                  on_timeout=lambda: {"status": "error", "reason": "timed out"})
+"""
+
+import functools
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import metrics
+
+_groups: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlightTimeout(TimeoutError):
+    """A follower gave up waiting for the leader's call."""
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.coalesced = metrics.counter(f"singleflight_coalesced_{name}")
+        self.timed_out = metrics.counter(f"singleflight_timed_out_{name}")
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Runs fn() -- or, if a call with this key is already in flight, waits
+        for that one's result instead. A waiter gives up after timeout
+        seconds (None: no limit) with SingleFlightTimeout.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            self.coalesced.inc()
+            if not call.done.wait(None if timeout is None else max(timeout, 0)):
+                self.timed_out.inc()
+                raise SingleFlightTimeout(f"{self.name}: no result within {timeout}s")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+def singleflight(name: str, key: Callable[..., Hashable],
+                 wait: Optional[Callable[..., Optional[float]]] = None,
+                 on_timeout: Optional[Callable[[], Any]] = None):
+    """
+    Decorator: coalesce concurrent calls whose key(*args, **kwargs) is
+    equal. wait(*args, **kwargs), if given, is how long a coalesced call
+    waits for the shared one; past that it returns on_timeout() (or raises
+    SingleFlightTimeout without one).
+    """
+    group = _groups.setdefault(name, SingleFlight(name))
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            timeout = wait(*args, **kwargs) if wait is not None else None
+            try:
+                return group.do(key(*args, **kwargs), functools.partial(fn, *args, **kwargs), timeout)
+            except SingleFlightTimeout:
+                if on_timeout is None:
+                    raise
+                return on_timeout()
+        return wrapper
+
+    return decorate
+
+
+def stats() -> dict:
+    return {
+        name: {"in_flight": group.in_flight(), "coalesced": group.coalesced.value,
+               "timed_out": group.timed_out.value}
+        for name, group in sorted(_groups.items())
+    }
+
+
+metrics.register_stats("singleflight", stats)
@@ -0,0 +1,222 @@
+"""
+BRISK Conversation State Token Module
+--------------------------------------
+Packs a /triage conversation's state -- symptom, question index, phase,
+detected/triaged symptoms, pathway and the answer history -- into one
+compact, HMAC-signed token. The client echoes the token back with the
+next message instead of re-posting every list as JSON, and the server
+trusts what it decodes without re-validating it field by field: the
+signature already proves this server produced it.
+
+WIRE FORMAT (before base64url):
+    payload || HMAC-SHA256(payload)[:16]
+where payload is a 1-byte header (format version + "zlib-compressed"
+flag) followed by the packed fields; names (symptoms, pathways, phases)
+are 1-byte indexes into a fixed table and questions are their 24-bit
+question ids, so only the patient's own answers travel as text.
+
+The names table is fingerprinted into every token. A deploy that changes
+the table (e.g. adds a symptom) makes older tokens fail verification
+instead of decoding to the wrong symptom.
+
+Tokens are NOT encrypted -- anyone holding one can read the answers in
+it, exactly like the JSON they replace. Signing only stops tampering.
+
+Requires this environment variable (e.g. in Railway) to enable tokens:
+    TRIAGE_STATE_SECRET              (any long random string; shared by
+                                      every worker/replica)
+Optional:
+    TRIAGE_STATE_TOKEN_MAX_AGE_SECONDS   (default 86400, i.e. 24 hours)
+
+Read lazily, like the other optional features: with no secret set,
+create_state_codec() returns None and /triage simply never issues tokens.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import struct
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+FORMAT_VERSION = 1
+_COMPRESSED = 0x80
+_SIGNATURE_BYTES = 16
+
+# Name slots: an index into the names table, or one of these markers.
+_NAME_NONE = 0xFF
+_NAME_INLINE = 0xFE  # followed by a length-prefixed UTF-8 string
+# Question slot marker for a question that has no id (legacy free text).
+_QUESTION_INLINE = 0xFFFFFFFF
+
+
+class StateTokenCodec:
+    def __init__(
+        self,
+        secret: bytes,
+        names: Sequence[str],
+        question_ids: Dict[str, int],
+        questions_by_id: Dict[int, str],
+        max_age_seconds: int = 86400,
+    ):
+        if len(names) >= _NAME_INLINE:
+            raise ValueError("too many names for a one-byte index")
+        self._secret = secret
+        self._names = list(names)
+        self._name_index = {name: i for i, name in enumerate(self._names)}
+        self._question_ids = question_ids
+        self._questions_by_id = questions_by_id
+        self.max_age_seconds = max_age_seconds
+        self._fingerprint = zlib.crc32("\x00".join(self._names).encode("utf-8")) & 0xFFFF
+
+    # ── encode ──────────────────────────────────────────────────────────
+    def encode(self, state: dict, history: Sequence[Tuple[str, str]]) -> str:
+        """
+        state: symptom_type, question_index, phase, detected_symptoms,
+        triaged_symptoms, current_pathway. history: (question, answer) pairs.
+        """
+        out = bytearray()
+        out += struct.pack(">HIi", self._fingerprint, int(time.time()), state.get("question_index") or 0)
+        self._pack_name(out, state.get("symptom_type"))
+        self._pack_name(out, state.get("current_pathway"))
+        self._pack_name(out, state.get("phase"))
+        for key in ("detected_symptoms", "triaged_symptoms"):
+            names = state.get(key) or []
+            out.append(len(names))
+            for name in names:
+                self._pack_name(out, name)
+        out += struct.pack(">H", len(history))
+        for question, answer in history:
+            qid = self._question_ids.get(question)
+            if qid is None:
+                out += struct.pack(">I", _QUESTION_INLINE)
+                _pack_text(out, question)
+            else:
+                out += struct.pack(">I", qid)
+            _pack_text(out, answer)
+
+        header = FORMAT_VERSION
+        body = bytes(out)
+        compressed = zlib.compress(body, 6)
+        if len(compressed) < len(body):
+            header |= _COMPRESSED
+            body = compressed
+        payload = bytes([header]) + body
+        signature = hmac.new(self._secret, payload, hashlib.sha256).digest()[:_SIGNATURE_BYTES]
+        return base64.urlsafe_b64encode(payload + signature).rstrip(b"=").decode("ascii")
+
+    def _pack_name(self, out: bytearray, name: Optional[str]):
+        if name is None:
+            out.append(_NAME_NONE)
+        elif name in self._name_index:
+            out.append(self._name_index[name])
+        else:
+            out.append(_NAME_INLINE)
+            _pack_text(out, name)
+
+    # ── decode ──────────────────────────────────────────────────────────
+    def decode(self, token: str) -> Optional[Tuple[dict, List[Tuple[str, str]]]]:
+        """
+        Returns (state, history) for a genuine, unexpired token, or None for
+        anything else (bad signature, wrong table, expired, malformed).
+        """
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        except Exception:
+            return None
+        if len(raw) <= _SIGNATURE_BYTES + 1:
+            return None
+        payload, signature = raw[:-_SIGNATURE_BYTES], raw[-_SIGNATURE_BYTES:]
+        expected = hmac.new(self._secret, payload, hashlib.sha256).digest()[:_SIGNATURE_BYTES]
+        if not hmac.compare_digest(signature, expected):
+            return None
+        header, body = payload[0], payload[1:]
+        if header & ~_COMPRESSED != FORMAT_VERSION:
+            return None
+        try:
+            if header & _COMPRESSED:
+                body = zlib.decompress(body)
+            return self._unpack(body)
+        except Exception as e:
+            # Signed by us but unreadable -- only possible across an
+            # incompatible code change, so worth a log line.
+            print(f"[state_token] could not unpack a signed token: {e}")
+            return None
+
+    def _unpack(self, body: bytes) -> Optional[Tuple[dict, List[Tuple[str, str]]]]:
+        fingerprint, issued_at, question_index = struct.unpack_from(">HIi", body, 0)
+        if fingerprint != self._fingerprint:
+            return None
+        if time.time() - issued_at > self.max_age_seconds:
+            return None
+        pos = 10
+        state = {"question_index": question_index}
+        for key in ("symptom_type", "current_pathway", "phase"):
+            state[key], pos = self._unpack_name(body, pos)
+        for key in ("detected_symptoms", "triaged_symptoms"):
+            count = body[pos]
+            pos += 1
+            names = []
+            for _ in range(count):
+                name, pos = self._unpack_name(body, pos)
+                names.append(name)
+            state[key] = names
+        (count,) = struct.unpack_from(">H", body, pos)
+        pos += 2
+        history = []
+        for _ in range(count):
+            (qid,) = struct.unpack_from(">I", body, pos)
+            pos += 4
+            if qid == _QUESTION_INLINE:
+                question, pos = _unpack_text(body, pos)
+            else:
+                question = self._questions_by_id[qid]
+            answer, pos = _unpack_text(body, pos)
+            history.append((question, answer))
+        return state, history
+
+    def _unpack_name(self, body: bytes, pos: int) -> Tuple[Optional[str], int]:
+        slot = body[pos]
+        pos += 1
+        if slot == _NAME_NONE:
+            return None, pos
+        if slot == _NAME_INLINE:
+            return _unpack_text(body, pos)
+        return self._names[slot], pos
+
+
+def _pack_text(out: bytearray, text: str):
+    data = text.encode("utf-8")
+    # Varint length: answers are almost always under 128 bytes (1 byte).
+    length = len(data)
+    while length >= 0x80:
+        out.append((length & 0x7F) | 0x80)
+        length >>= 7
+    out.append(length)
+    out += data
+
+
+def _unpack_text(body: bytes, pos: int) -> Tuple[str, int]:
+    length = 0
+    shift = 0
+    while True:
+        byte = body[pos]
+        pos += 1
+        length |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    return body[pos:pos + length].decode("utf-8"), pos + length
+
+
+def create_state_codec(
+    names: Sequence[str], question_ids: Dict[str, int], questions_by_id: Dict[int, str]
+) -> Optional[StateTokenCodec]:
+    """Returns a codec, or None (never raises) if TRIAGE_STATE_SECRET isn't set."""
+    secret = os.environ.get("TRIAGE_STATE_SECRET")
+    if not secret:
+        return None
+    max_age = int(os.environ.get("TRIAGE_STATE_TOKEN_MAX_AGE_SECONDS", "86400"))
+    return StateTokenCodec(secret.encode("utf-8"), names, question_ids, questions_by_id, max_age)
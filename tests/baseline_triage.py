@@ -0,0 +1,235 @@
+"""
+The /triage question logic as it was before it was compiled into
+TRIAGE_PROTOCOLS, question ids and TriageHistory -- kept verbatim as the
+reference the tests compare main._triage_logic against. The question
+lists, keywords and rules are imported from main, so only the LOGIC is
+being compared.
+
+Symptom detection is the one deliberate difference (phrases now have to
+start a word, see keyword_matcher.py), so the current
+detect_all_symptoms is used here too.
+"""
+
+from typing import List, Optional
+
+from main import (
+    AnswerEntry, BLACKOUT_BRANCH_Q, CHEST_BRANCH_Q, CHEST_PAIN_INITIAL, DIFFERENTIAL_CANDIDATES,
+    DYSURIA_BRANCH_Q, DYSURIA_INITIAL, HEADACHE_BRANCH_Q, HEADACHE_INITIAL, INSTANT_RED_FLAG_PATHWAYS,
+    NUM_UNIVERSAL, QUESTION_MAP, SYMPTOM_PRIORITY, SymptomInput, UNIVERSAL_INTAKE, completion_messages,
+    detect_all_symptoms, is_affirmative, red_flag_messages, red_flag_rules,
+)
+
+
+def generate_differentials(pathway: str, all_answers: List[AnswerEntry]) -> List[str]:
+    candidates = DIFFERENTIAL_CANDIDATES.get(pathway, [])
+    if not candidates:
+        return []
+    combined_text = " ".join(entry.answer.lower() for entry in all_answers)
+    scored = []
+    for diagnosis, keywords, base_weight in candidates:
+        score = sum(base_weight for kw in keywords if kw in combined_text)
+        scored.append((diagnosis, score))
+    scored.sort(key=lambda x: x[1], reverse=True)
+    top = [d for d, s in scored if s > 0][:3]
+    if not top:
+        top = [c[0] for c in candidates[:3]]
+    return top
+
+def prioritize_symptoms(symptoms: List[str]) -> List[str]:
+    return sorted(symptoms, key=lambda s: SYMPTOM_PRIORITY.index(s) if s in SYMPTOM_PRIORITY else len(SYMPTOM_PRIORITY))
+
+def get_next_symptom_to_triage(detected: List[str], triaged: List[str]) -> Optional[str]:
+    for s in prioritize_symptoms(detected):
+        if s not in triaged:
+            return s
+    return None
+
+def resolve_pathway(symptom_key: str, current_pathway: Optional[str]) -> str:
+    if current_pathway:
+        return current_pathway
+    return {"headache": "headache_sah", "chest pain": "chest pain_cardiac", "blackout": "blackout_cardiac", "dysuria": "dysuria_uti"}.get(symptom_key, symptom_key)
+
+def determine_branch(symptom_key: str, answer: str, question: str) -> Optional[str]:
+    answer_lower = answer.lower()
+    if symptom_key == "headache" and HEADACHE_BRANCH_Q in question:
+        return "headache_sah" if (is_affirmative(answer) or any(w in answer_lower for w in ["worst", "thunderclap", "sudden", "explosion", "never had", "10", "worst ever"])) else "headache_migraine"
+    if symptom_key == "chest pain" and CHEST_BRANCH_Q in question:
+        return "chest pain_cardiac" if (is_affirmative(answer) or any(w in answer_lower for w in ["pressure", "tightness", "squeezing", "heavy", "crushing", "elephant"])) else "chest pain_non_cardiac"
+    if symptom_key == "blackout" and BLACKOUT_BRANCH_Q in question:
+        return "blackout_hypogly" if (is_affirmative(answer) or any(w in answer_lower for w in ["diabetic", "diabetes", "insulin", "low sugar", "hypoglycemia", "glucose"])) else "blackout_cardiac"
+    if symptom_key == "dysuria" and DYSURIA_BRANCH_Q in question:
+        return "dysuria_uti" if (is_affirmative(answer) or any(w in answer_lower for w in ["frequency", "urgency", "lower abdomen", "bladder", "keep going toilet"])) else "dysuria_sti"
+    return None
+
+def get_branch_question(symptom_key: str) -> Optional[str]:
+    return {"headache": HEADACHE_BRANCH_Q, "chest pain": CHEST_BRANCH_Q, "blackout": BLACKOUT_BRANCH_Q, "dysuria": DYSURIA_BRANCH_Q}.get(symptom_key)
+
+def get_initial_question(symptom_key: str) -> Optional[str]:
+    return {"headache": HEADACHE_INITIAL, "chest pain": CHEST_PAIN_INITIAL, "dysuria": DYSURIA_INITIAL}.get(symptom_key)
+
+def calculate_red_flag_score(all_answers: List[AnswerEntry], pathway: str) -> int:
+    rules = red_flag_rules.get(pathway, red_flag_rules["other"])
+    score = 0
+    for entry in all_answers:
+        answer_lower = entry.answer.lower()
+        for weight, keywords in rules["triggers"]:
+            if any(kw in answer_lower for kw in keywords):
+                score += weight
+                break
+    return max(score, 0)
+
+def determine_risk_level(score: int, pathway: str) -> str:
+    rules = red_flag_rules.get(pathway, red_flag_rules["other"])
+    threshold = rules["threshold"]
+    if score >= threshold * 2:
+        return "high"
+    elif score >= threshold:
+        return "medium"
+    return "low"
+
+def check_red_flags(all_answers: List[AnswerEntry], pathway: str) -> tuple:
+    score = calculate_red_flag_score(all_answers, pathway)
+    rules = red_flag_rules.get(pathway, red_flag_rules["other"])
+    return score >= rules["threshold"], determine_risk_level(score, pathway)
+
+def _triage_logic(symptom: SymptomInput) -> dict:
+    detected_symptoms = list(symptom.detected_symptoms or [])
+    triaged_symptoms = list(symptom.triaged_symptoms or [])
+    current_pathway = symptom.current_pathway
+
+    if not detected_symptoms:
+        detected_symptoms = detect_all_symptoms(symptom.message)
+        if not detected_symptoms:
+            detected_symptoms = ["other"]
+
+    if symptom.symptom_type and symptom.symptom_type in detected_symptoms:
+        symptom_key = symptom.symptom_type
+    else:
+        symptom_key = get_next_symptom_to_triage(detected_symptoms, triaged_symptoms)
+        if not symptom_key:
+            symptom_key = "other"
+
+    idx = symptom.question_index
+    all_answers = list(symptom.all_answers or [])
+
+    has_initial = get_initial_question(symptom_key) is not None
+    has_branch = get_branch_question(symptom_key) is not None
+
+    offset = 0
+    if has_initial:
+        offset += 1
+    if has_branch:
+        offset += 1
+
+    current_question = ""
+    if has_initial and idx == 1:
+        current_question = get_initial_question(symptom_key) or ""
+    elif has_branch and idx == (2 if has_initial else 1):
+        current_question = get_branch_question(symptom_key) or ""
+    elif offset < idx <= offset + NUM_UNIVERSAL:
+        u_idx = idx - offset - 1
+        if 0 <= u_idx < NUM_UNIVERSAL:
+            current_question = UNIVERSAL_INTAKE[u_idx]
+    else:
+        pathway = resolve_pathway(symptom_key, current_pathway)
+        questions = QUESTION_MAP.get(pathway, QUESTION_MAP.get(symptom_key, []))
+        q_idx = idx - offset - NUM_UNIVERSAL - 1
+        if 0 <= q_idx < len(questions):
+            current_question = questions[q_idx]
+
+    all_answers.append(AnswerEntry(question=current_question, answer=symptom.message))
+
+    if idx == 0:
+        early_pathway = resolve_pathway(symptom_key, current_pathway)
+        early_rf, early_rl = check_red_flags(all_answers, early_pathway)
+        early_rfm = red_flag_messages.get(early_pathway) if early_rf else None
+        if has_initial:
+            return {"symptom_type": symptom_key, "question_index": 1, "phase": "triage", "next_question": get_initial_question(symptom_key), "red_flag": early_rf, "red_flag_message": early_rfm, "risk_level": early_rl, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": []}
+        elif has_branch:
+            return {"symptom_type": symptom_key, "question_index": 1, "phase": "triage", "next_question": get_branch_question(symptom_key), "red_flag": early_rf, "red_flag_message": early_rfm, "risk_level": early_rl, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": []}
+        else:
+            return {"symptom_type": symptom_key, "question_index": 1, "phase": "triage", "next_question": UNIVERSAL_INTAKE[0], "red_flag": early_rf, "red_flag_message": early_rfm, "risk_level": early_rl, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": []}
+
+    if has_initial and has_branch and idx == 1:
+        b_pathway = resolve_pathway(symptom_key, current_pathway)
+        b_rf, b_rl = check_red_flags(all_answers, b_pathway)
+        b_rfm = red_flag_messages.get(b_pathway) if b_rf else None
+        return {"symptom_type": symptom_key, "question_index": 2, "phase": "triage", "next_question": get_branch_question(symptom_key), "red_flag": b_rf, "red_flag_message": b_rfm, "risk_level": b_rl, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": []}
+
+    if not current_pathway and has_branch:
+        branch_q = get_branch_question(symptom_key)
+        branch_answer = None
+        for entry in all_answers:
+            if branch_q and (branch_q in entry.question or entry.question in branch_q):
+                branch_answer = entry.answer
+                break
+        if branch_answer is None:
+            return {"symptom_type": symptom_key, "question_index": idx + 1, "phase": "triage", "next_question": get_branch_question(symptom_key), "red_flag": False, "red_flag_message": None, "risk_level": "low", "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": None, "transition_message": None, "differential_diagnoses": []}
+        new_pathway = determine_branch(symptom_key, branch_answer, branch_q)
+        if new_pathway:
+            current_pathway = new_pathway
+
+    if idx <= offset or (offset < idx <= offset + NUM_UNIVERSAL):
+        early_pathway = resolve_pathway(symptom_key, current_pathway)
+        early_rf, early_rl = check_red_flags(all_answers, early_pathway)
+        early_rfm = red_flag_messages.get(early_pathway) if early_rf else None
+
+        if current_pathway in INSTANT_RED_FLAG_PATHWAYS and not early_rf:
+            early_rf = True
+            early_rl = "high"
+            early_rfm = red_flag_messages.get(current_pathway)
+
+        if idx <= offset:
+            return {"symptom_type": symptom_key, "question_index": offset + 1, "phase": "triage", "next_question": UNIVERSAL_INTAKE[0], "red_flag": early_rf, "red_flag_message": early_rfm, "risk_level": early_rl, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": []}
+
+        u_idx = idx - offset
+        if u_idx < NUM_UNIVERSAL:
+            return {"symptom_type": symptom_key, "question_index": idx + 1, "phase": "triage", "next_question": UNIVERSAL_INTAKE[u_idx], "red_flag": early_rf, "red_flag_message": early_rfm, "risk_level": early_rl, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": []}
+
+    pathway = resolve_pathway(symptom_key, current_pathway)
+    questions = QUESTION_MAP.get(pathway, [])
+    if not questions:
+        questions = QUESTION_MAP.get(symptom_key, [])
+        pathway = symptom_key
+
+    pathway_q_idx = idx - offset - NUM_UNIVERSAL
+
+    red_flag, risk_level = check_red_flags(all_answers, pathway)
+    red_flag_message = red_flag_messages.get(pathway) if red_flag else None
+    differentials = generate_differentials(pathway, all_answers)
+
+    if red_flag and pathway in ("suicidal thoughts", "overdose") and idx <= 2:
+        return {"symptom_type": symptom_key, "question_index": idx, "phase": "done", "next_question": red_flag_messages[pathway], "red_flag": True, "red_flag_message": red_flag_messages[pathway], "risk_level": "high", "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": differentials}
+
+    if symptom.phase == "additional":
+        message_lower = symptom.message.lower().strip()
+        no_indicators = ["no", "nope", "nothing", "that's all", "thats all", "no thanks", "done", "nothing else", "no more", "all good", "that is all"]
+        if any(message_lower == ind or message_lower.startswith(ind) for ind in no_indicators):
+            triaged_symptoms_updated = triaged_symptoms + [symptom_key]
+            remaining = [s for s in detected_symptoms if s not in triaged_symptoms_updated]
+            if remaining:
+                next_sym = get_next_symptom_to_triage(detected_symptoms, triaged_symptoms_updated)
+                if next_sym:
+                    next_initial = get_initial_question(next_sym)
+                    next_branch = get_branch_question(next_sym)
+                    first_q = next_initial or next_branch or UNIVERSAL_INTAKE[0]
+                    return {"symptom_type": next_sym, "question_index": 1, "phase": "triage", "next_question": first_q, "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms_updated, "current_pathway": None, "transition_message": f"Thank you. Now let me ask you about your {next_sym}.", "differential_diagnoses": differentials}
+            return {"symptom_type": symptom_key, "question_index": idx, "phase": "done", "next_question": completion_messages[risk_level], "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": differentials}
+        else:
+            return {"symptom_type": symptom_key, "question_index": idx, "phase": "additional", "next_question": "Thank you for sharing that. Is there anything else you would like to add?", "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": differentials}
+
+    if pathway_q_idx >= len(questions):
+        triaged_symptoms_updated = triaged_symptoms + [symptom_key]
+        remaining = [s for s in detected_symptoms if s not in triaged_symptoms_updated]
+        if remaining:
+            next_sym = get_next_symptom_to_triage(detected_symptoms, triaged_symptoms_updated)
+            next_initial = get_initial_question(next_sym)
+            next_branch = get_branch_question(next_sym)
+            first_q = next_initial or next_branch or UNIVERSAL_INTAKE[0]
+            return {"symptom_type": next_sym, "question_index": 1, "phase": "triage", "next_question": first_q, "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms_updated, "current_pathway": None, "transition_message": f"Thank you. Now let me ask you about your {next_sym}.", "differential_diagnoses": differentials}
+        else:
+            return {"symptom_type": symptom_key, "question_index": idx, "phase": "additional", "next_question": "Is there anything else you would like to add, or any other symptoms you would like to mention?", "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": differentials}
+
+    next_question = questions[pathway_q_idx]
+    return {"symptom_type": symptom_key, "question_index": idx + 1, "phase": "triage", "next_question": next_question, "red_flag": red_flag, "red_flag_message": red_flag_message, "risk_level": risk_level, "detected_symptoms": detected_symptoms, "triaged_symptoms": triaged_symptoms, "current_pathway": current_pathway, "transition_message": None, "differential_diagnoses": differentials}
+
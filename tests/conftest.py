@@ -0,0 +1,16 @@
+import os
+import sys
+
+# The modules live flat at the repo root (that's how Railway runs them).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# emergency_call.py reads its Twilio settings at import time. Placeholders
+# are enough to import main -- no test places a real call.
+for _name, _value in {
+    "TWILIO_ACCOUNT_SID": "ACtest",
+    "TWILIO_AUTH_TOKEN": "test-token",
+    "TWILIO_PHONE_NUMBER": "+15555550100",
+    "CLINICAL_CONTACT_NUMBER": "+15555550101",
+    "PUBLIC_BASE_URL": "https://example.invalid",
+}.items():
+    os.environ.setdefault(_name, _value)
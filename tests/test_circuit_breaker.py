@@ -0,0 +1,38 @@
+import circuit_breaker
+import reverse_geocode
+import walkin_clinics
+from circuit_breaker import CircuitBreaker
+
+
+def test_release_frees_the_half_open_probe():
+    breaker = CircuitBreaker("test_release", failure_threshold=1, reset_seconds=60)
+    breaker.record_failure()
+    breaker._opened_at -= 61
+    assert breaker.allow()  # the probe
+    assert not breaker.allow()  # one probe at a time
+    breaker.release()
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    assert breaker.allow()
+
+
+def _refuse_quota(monkeypatch, module):
+    breaker = CircuitBreaker(f"test_{module.__name__}", failure_threshold=1, reset_seconds=60)
+    breaker.record_failure()
+    breaker._opened_at -= 61
+    monkeypatch.setattr(module, "_breaker", breaker)
+    monkeypatch.setenv("GEOAPIFY_API_KEY", "test")
+    monkeypatch.setattr(module.geoapify_quota, "acquire", lambda kind: False)
+    return breaker
+
+
+def test_quota_refusal_releases_the_probe_walkin(monkeypatch):
+    breaker = _refuse_quota(monkeypatch, walkin_clinics)
+    result = walkin_clinics._request_places("circle:0,0,1000", 5)
+    assert "quota" in result["reason"]
+    assert breaker.allow()  # the slot wasn't left taken
+
+
+def test_quota_refusal_releases_the_probe_reverse_geocode(monkeypatch):
+    breaker = _refuse_quota(monkeypatch, reverse_geocode)
+    assert reverse_geocode._lookup_remote(50.4, -104.6) is None
+    assert breaker.allow()
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+import clinic_index
+
+
+def test_retry_delay_backs_off_after_failures(monkeypatch):
+    monkeypatch.delenv("CLINIC_SNAPSHOT_RETRY_SECONDS", raising=False)
+    day = 86400
+    assert clinic_index.snapshot_retry_delay(0, day) == 3600
+    assert [clinic_index.snapshot_retry_delay(n, day) for n in range(1, 7)] == [
+        3600, 7200, 14400, 28800, 57600, 86400,
+    ]
+    assert clinic_index.snapshot_retry_delay(20, day) == day
+
+
+def test_snapshot_job_backs_off_and_resets(monkeypatch, tmp_path):
+    outcomes = ["error", "error", "error", "success", "error"]
+    delays = []
+
+    def refresh(path, refresh_seconds):
+        return {"status": outcomes.pop(0)}
+
+    async def sleep(seconds):
+        delays.append(seconds)
+        if not outcomes:
+            raise asyncio.CancelledError
+
+    monkeypatch.setenv("CLINIC_SNAPSHOT_PATH", str(tmp_path / "snapshot.json"))
+    monkeypatch.setenv("CLINIC_SNAPSHOT_RETRY_SECONDS", "10")
+    monkeypatch.setattr(clinic_index, "_refresh_failures", 0)
+    monkeypatch.setattr(clinic_index, "refresh_snapshot", refresh)
+    monkeypatch.setattr(clinic_index.asyncio, "sleep", sleep)
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(clinic_index.run_snapshot_job())
+    assert delays == [10, 20, 40, 3600, 10]
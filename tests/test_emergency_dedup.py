@@ -0,0 +1,40 @@
+import threading
+import time
+
+from emergency_dedup import EmergencyCallDedup
+
+
+class SlowBackend:
+    name = "slow"
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.claimed = set()
+        self.done = threading.Event()
+
+    def claim(self, dedup_key, ttl_seconds):
+        time.sleep(self.delay)
+        won = dedup_key not in self.claimed
+        self.claimed.add(dedup_key)
+        self.done.set()
+        return won
+
+
+def test_slow_shared_claim_fails_open_within_timeout():
+    backend = SlowBackend(delay=1.0)
+    dedup = EmergencyCallDedup(shared=backend, shared_timeout_seconds=0.05)
+    start = time.monotonic()
+    assert dedup.claim("key") is True
+    assert time.monotonic() - start < 0.5
+    assert dedup.stats()["shared_timeouts"] == 1
+    # The abandoned claim still lands, so a later repeat elsewhere is caught.
+    assert backend.done.wait(2)
+    assert "key" in backend.claimed
+
+
+def test_fast_shared_claim_is_still_authoritative():
+    backend = SlowBackend(delay=0)
+    backend.claimed.add("key")
+    dedup = EmergencyCallDedup(shared=backend, shared_timeout_seconds=1.0)
+    assert dedup.claim("key") is False
+    assert dedup.stats()["shared_timeouts"] == 0
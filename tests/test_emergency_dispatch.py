@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from requests.exceptions import ConnectTimeout, ReadTimeout
+from twilio.base.exceptions import TwilioRestException
+
+import emergency_call
+from emergency_dispatch import EmergencyDispatcher
+
+
+class FakeCalls:
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.attempts = 0
+
+    def create(self, **kwargs):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return type("Call", (), {"sid": f"CA{self.attempts}"})()
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    def install(*errors):
+        fake = FakeCalls(*errors)
+        monkeypatch.setattr(emergency_call, "client", type("Client", (), {"calls": fake})())
+        return fake
+    return install
+
+
+def _place(dispatcher):
+    leg = emergency_call.emergency_call_legs(10, "chest pain", "Regina")["clinical_contact_call"]
+    return asyncio.run(dispatcher._place_with_retries(leg))
+
+
+def test_read_timeout_is_not_redialled(calls):
+    fake = calls(ReadTimeout("read timed out"))
+    result = _place(EmergencyDispatcher(max_attempts=3, backoff_seconds=0))
+    assert fake.attempts == 1
+    assert result["status"] == "error" and result["retryable"] is False
+
+
+def test_twilio_rejection_is_retried(calls):
+    fake = calls(TwilioRestException(503, "/Calls", "unavailable"), ConnectTimeout("connect timed out"))
+    result = _place(EmergencyDispatcher(max_attempts=3, backoff_seconds=0))
+    assert fake.attempts == 3
+    assert result["status"] == "placed" and result["attempts"] == 3
+
+
+def test_unknown_failure_is_not_retried(calls):
+    fake = calls(ConnectionResetError("reset by peer"))
+    result = _place(EmergencyDispatcher(max_attempts=3, backoff_seconds=0))
+    assert fake.attempts == 1 and result["retryable"] is False
+
+
+def test_not_running_once_its_loop_is_closed(calls, monkeypatch):
+    fake = calls()
+    dispatcher = EmergencyDispatcher(workers=1)
+    loop = asyncio.new_event_loop()
+    loop.close()
+    monkeypatch.setattr(dispatcher, "_loop", loop)
+    monkeypatch.setattr(dispatcher, "_tasks", [object()])  # started, never stopped
+    assert not dispatcher.running
+    assert dispatcher.submit("closed-loop", 10, "overdose") is None
+    assert emergency_call.trigger_emergency_call("closed-loop", 10, "overdose")["status"] == "call_placed"
+    assert fake.attempts == 1
+
+
+def test_failed_enqueue_releases_the_claim(calls, monkeypatch):
+    fake = calls()
+    dispatcher = EmergencyDispatcher(workers=1)
+
+    class ClosingLoop:
+        def is_closed(self):
+            return False
+
+        def call_soon_threadsafe(self, *args):
+            raise RuntimeError("Event loop is closed")
+
+    monkeypatch.setattr(dispatcher, "_loop", ClosingLoop())
+    monkeypatch.setattr(dispatcher, "_queue", asyncio.Queue())
+    monkeypatch.setattr(dispatcher, "_tasks", [object()])
+    assert dispatcher.submit("enqueue-fails", 10, "seizure") is None
+    assert emergency_call.trigger_emergency_call("enqueue-fails", 10, "seizure")["status"] == "call_placed"
+    assert fake.attempts == 1
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+import main
+from event_writer import EventWriter, create_event_writer
+from event_spool import SpoolReplayer, open_spools
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_main_creates_no_spool(tmp_path):
+    env = dict(os.environ, EVENT_SPOOL_DIR=str(tmp_path / "spool"), PYTHONPATH=REPO)
+    subprocess.run([sys.executable, "-c", "import main"], cwd=tmp_path, env=env, check=True)
+    assert not (tmp_path / "spool").exists()
+
+
+def test_spool_opened_on_start_and_released_on_stop(tmp_path):
+    root = str(tmp_path / "spool")
+    inserted = []
+
+    def insert(rows):
+        inserted.extend(rows)
+        return {"status": "logged"}
+
+    def open_replayer():
+        spool, adopted = open_spools(root)
+        return SpoolReplayer(spool, adopted, insert, idle_seconds=0.05)
+
+    async def run():
+        writer = EventWriter(flush_interval_seconds=0.05, insert=insert, open_replayer=open_replayer)
+        assert not os.path.exists(root)
+        await writer.start()
+        own, _ = open_spools(root)  # worker-0 is held: this process gets worker-1
+        assert own.directory.endswith("worker-1")
+        own.release()
+        assert writer.submit({"event_id": "a"}) == {"status": "queued"}
+        await writer.stop(drain_seconds=2)
+        own, _ = open_spools(root)  # released again
+        assert own.directory.endswith("worker-0")
+        own.release()
+
+    asyncio.run(run())
+    assert [row["event_id"] for row in inserted] == ["a"]
+
+
+def test_not_configured_is_terminal_for_the_replayer(tmp_path):
+    attempts = []
+
+    def insert(rows):
+        attempts.append(len(rows))
+        return {"status": "not_configured", "reason": "Supabase env vars not set"}
+
+    async def run():
+        spool, adopted = open_spools(str(tmp_path / "spool"))
+        replayer = SpoolReplayer(spool, adopted, insert, idle_seconds=0.01, max_backoff_seconds=0.01)
+        assert spool.append([{"event_id": "a"}])
+        await replayer.start()
+        await asyncio.sleep(0.3)
+        assert replayer.stats()["running"] is False
+        await replayer.stop(drain_seconds=1)
+        return spool
+
+    spool = asyncio.run(run())
+    assert attempts == [1]
+    assert spool.pending_bytes() > 0  # kept for a process that can replay it
+
+
+def test_no_spool_without_supabase(tmp_path, monkeypatch):
+    monkeypatch.delenv("SUPABASE_URL", raising=False)
+    monkeypatch.setenv("EVENT_SPOOL_DIR", str(tmp_path / "spool"))
+
+    async def run():
+        writer = create_event_writer()
+        await writer.start()
+        assert writer.stats()["spool"] is None
+        await writer.stop(drain_seconds=1)
+
+    asyncio.run(run())
+    assert not (tmp_path / "spool").exists()
+
+
+def test_event_ids_remembered_only_once_stored():
+    outcomes = [{"status": "error", "reason": "Supabase down"}, {"status": "logged"}]
+
+    def insert(rows):
+        return outcomes.pop(0)
+
+    async def run():
+        writer = EventWriter(flush_interval_seconds=0.01, insert=insert)
+        await writer.start()
+        writer.submit({"event_id": "a"})
+        assert not writer.seen_event_id("a")  # only buffered so far
+        await asyncio.sleep(0.1)
+        assert not writer.seen_event_id("a")  # flush failed: a retry must get through
+        writer.submit({"event_id": "a"})
+        await asyncio.sleep(0.1)
+        assert writer.seen_event_id("a")
+        await writer.stop(drain_seconds=1)
+
+    asyncio.run(run())
+    assert outcomes == []
+
+
+def test_failed_inline_write_does_not_mark_the_event_id(monkeypatch):
+    monkeypatch.setattr(main, "_log_event_inline", lambda row: {"status": "error", "reason": "down"})
+    client = TestClient(main.app)  # no lifespan: the writer isn't running, events go inline
+    event = {"session_id": "s1", "event_type": "card_picked", "event_id": "retry-me"}
+    assert client.post("/log-event", json=event).json()["status"] == "error"
+    assert client.post("/log-event", json=event).json()["status"] == "error"  # not "duplicate"
+
+    monkeypatch.setattr(main, "_log_event_inline", lambda row: {"status": "logged", "id": 1})
+    assert client.post("/log-event", json=event).json()["status"] == "logged"
+    assert client.post("/log-event", json=event).json()["status"] == "duplicate"
@@ -0,0 +1,100 @@
+import random
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+import main
+from main import SymptomInput, triage
+
+OPENINGS = [
+    "I have the worst headache of my life",
+    "chest pain going to my left arm",
+    "I fainted at work and I'm diabetic",
+    "burning when peeing",
+    "I keep having seizures",
+    "coughing and sore throat for a week",
+    "I want to die",
+    "took too many pills",
+    "blood in stool and feeling dizzy",
+    "my knee hurts",
+]
+ANSWERS = [
+    "yes", "no", "not really", "sudden, like a thunderclap", "it is severe and getting worse",
+    "I have a fever and neck stiffness", "pressure radiating to my jaw, sweating",
+    "I'm alone, no one with me", "I have a plan for tonight", "drowsy and slurring",
+    "nausea and vomiting", "nothing else", "that's all", "bright red, small amount",
+    "no discharge, just frequency and urgency", "about two days", "unprotected sex last month",
+]
+STATE_FIELDS = ("symptom_type", "question_index", "phase", "detected_symptoms", "triaged_symptoms", "current_pathway")
+
+
+@pytest.fixture(autouse=True)
+def no_calls(monkeypatch):
+    monkeypatch.setattr(main.emergency_dispatcher, "submit", lambda **kwargs: {"status": "queued"})
+
+
+def _conversation(rng):
+    return [rng.choice(OPENINGS)] + [rng.choice(ANSWERS) for _ in range(rng.randint(3, 25))]
+
+
+def _replay(messages, session_id, rng):
+    """Plays one conversation statelessly (re-posting all_answers) and
+    incrementally (answer_count only, with some turns retried), turn by
+    turn, and checks both get the same response every time."""
+    stateless_state, incremental_state = {}, {}
+    all_answers = []
+    answer_count = 0
+    asked = ""  # the opening complaint answers no question
+    for message in messages:
+        expected = triage(SymptomInput(message=message, all_answers=all_answers, **stateless_state))
+        for _ in range(2 if rng.random() < 0.2 else 1):  # sometimes a retried turn
+            actual = triage(SymptomInput(
+                message=message, session_id=session_id, incremental=True, answer_count=answer_count,
+                **incremental_state,
+            ))
+        assert actual.pop("answer_count") == len(all_answers) + 1
+        assert actual == expected
+        answer_count += 1
+        all_answers = all_answers + [{"question": asked, "answer": message}]
+        asked = expected["next_question"]
+        stateless_state = {k: expected[k] for k in STATE_FIELDS}
+        incremental_state = dict(stateless_state)
+        if expected["phase"] == "done":
+            break
+
+
+def test_incremental_matches_stateless():
+    rng = random.Random(3)
+    for n in range(300):
+        _replay(_conversation(rng), f"equivalence-{n}", rng)
+
+
+def test_answer_count_is_required():
+    with pytest.raises(HTTPException) as e:
+        triage(SymptomInput(message="headache", session_id="no-count", incremental=True))
+    assert e.value.status_code == 422
+
+
+def test_count_that_skips_ahead_is_rejected():
+    first = triage(SymptomInput(message="headache", session_id="skip", incremental=True, answer_count=0))
+    with pytest.raises(HTTPException) as e:
+        triage(SymptomInput(message="yes", session_id="skip", incremental=True, answer_count=first["answer_count"] + 1))
+    assert e.value.status_code == 409
+
+
+def test_double_tap_records_the_answer_once():
+    first = triage(SymptomInput(message="chest pain", session_id="double-tap", incremental=True, answer_count=0))
+    state = {k: first[k] for k in STATE_FIELDS}
+    request = SymptomInput(
+        message="pressure radiating to my jaw, sweating", session_id="double-tap", incremental=True,
+        answer_count=first["answer_count"], **state,
+    )
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(triage(request.model_copy()))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert {r["answer_count"] for r in results} == {2}
+    assert len({repr(sorted(r.items())) for r in results}) == 1
@@ -0,0 +1,75 @@
+import pytest
+
+from keyword_matcher import KeywordMatcher
+from main import SYMPTOM_KEYWORDS, SYMPTOM_MATCHER, detect_all_symptoms
+
+
+@pytest.mark.parametrize("message, symptom", [
+    ("I keep having seizures", "seizure"),
+    ("bad headaches for a week", "headache"),
+    ("my migraines are back", "migraine"),
+    ("coughs all night", "cough"),
+    ("I fainted at work", "blackout"),
+    ("she fell and hit her head", "head injury"),
+])
+def test_inflected_forms_still_detected(message, symptom):
+    assert symptom in detect_all_symptoms(message)
+
+
+def test_phrases_must_start_a_word():
+    assert "seizure" not in detect_all_symptoms("what is the benefit of this")
+    assert "seizure" in detect_all_symptoms("I had a fit this morning")
+
+
+def test_matches_baseline_substring_search_except_mid_word():
+    messages = [
+        "worst headache of my life and chest pain",
+        "head injury after a fall, blacked out",
+        "coughing and shortness of breath, sob",
+        "blood in stool and diarrhoea for 3 days",
+        "I want to die, took too many pills",
+    ]
+    for message in messages:
+        lowered = message.lower()
+        baseline = [s for s, kws in SYMPTOM_KEYWORDS.items() if any(kw in lowered for kw in kws)]
+        assert detect_all_symptoms(message) == baseline
+
+
+def test_overlapping_and_prefix_phrases_all_reported():
+    matcher = KeywordMatcher({"a": ["head"], "b": ["head injury"], "c": ["injury"]})
+    assert matcher.labels("Head injury") == {"a", "b", "c"}
+
+
+def test_substring_mode_matches_mid_word():
+    matcher = KeywordMatcher({"weak": ["weak"]}, word_start=False)
+    assert matcher.labels("feeling fine") == set()
+    assert matcher.labels("felt weakness") == {"weak"}
+    assert KeywordMatcher({"fit": ["fit"]}, word_start=False).labels("benefit") == {"fit"}
+
+
+def test_spans_report_every_match_with_offsets():
+    matcher = KeywordMatcher({"a": ["head"], "b": ["head injury"], "c": ["injury"], "d": ["he"]})
+    text = "Head injury, then headaches"
+    spans = matcher.spans(text)
+    assert spans == [
+        ("d", 0, 2), ("a", 0, 4), ("b", 0, 11), ("c", 5, 11),
+        ("d", 18, 20), ("a", 18, 22),
+    ]
+    assert [text[start:end].lower() for _, start, end in spans] == [
+        "he", "head", "head injury", "injury", "he", "head",
+    ]
+    assert {label for label, _, _ in spans} == matcher.labels(text)
+
+
+def test_spans_respect_word_start():
+    matcher = KeywordMatcher({"fit": ["fit"]})
+    assert matcher.spans("a fit, no benefit") == [("fit", 2, 5)]
+    assert KeywordMatcher({}).spans("anything") == []
+
+
+def test_symptom_spans_agree_with_detect_all_symptoms():
+    message = "Worst headache of my life, then I fainted and had chest pain"
+    spans = SYMPTOM_MATCHER.spans(message)
+    assert sorted({label for label, _, _ in spans}) == sorted(detect_all_symptoms(message))
+    for label, start, end in spans:
+        assert message.lower()[start:end] in SYMPTOM_KEYWORDS[label]
@@ -0,0 +1,92 @@
+import pytest
+
+import opening_hours
+from opening_hours import MINUTES_PER_DAY as DAY, MINUTES_PER_WEEK as WEEK, parse, status
+from ttl_cache import TTLCache
+
+MO, TU, WE, TH, FR, SA, SU = (d * DAY for d in range(7))
+
+
+def _at(day, hhmm):
+    h, m = hhmm.split(":")
+    return day + int(h) * 60 + int(m)
+
+
+def _open(schedule, day, hhmm):
+    return status(schedule, _at(day, hhmm))[0]
+
+
+def test_day_range_and_list():
+    schedule = parse("Mo-Fr 08:00-20:00; Sa,Su 10:00-16:00")
+    assert _open(schedule, MO, "08:00") and _open(schedule, FR, "19:59")
+    assert not _open(schedule, FR, "20:00") and not _open(schedule, TU, "07:59")
+    assert _open(schedule, SA, "12:00") and _open(schedule, SU, "15:00")
+    assert not _open(schedule, SU, "16:30")
+
+
+def test_wrapping_day_range():
+    schedule = parse("Sa-Mo 09:00-17:00")
+    assert _open(schedule, SA, "10:00") and _open(schedule, SU, "10:00") and _open(schedule, MO, "10:00")
+    assert not _open(schedule, TU, "10:00") and not _open(schedule, FR, "10:00")
+
+
+@pytest.mark.parametrize("expression", ["Fr 22:00-02:00", "Fr 22:00-26:00"])
+def test_span_past_midnight(expression):
+    schedule = parse(expression)
+    assert _open(schedule, FR, "23:30") and _open(schedule, SA, "01:59")
+    assert not _open(schedule, SA, "02:00") and not _open(schedule, FR, "21:59")
+
+
+def test_sunday_night_into_monday():
+    schedule = parse("Su 20:00-04:00; Mo 04:00-12:00")
+    assert _open(schedule, SU, "23:00") and _open(schedule, MO, "03:00") and _open(schedule, MO, "11:00")
+    # Closing time counted straight through Sunday midnight and the merged Monday span.
+    assert status(schedule, _at(SU, "23:00")) == (True, 60 + 12 * 60)
+    assert schedule[0][0] == 0 and schedule[1][-1] == WEEK
+
+
+def test_twenty_four_seven():
+    schedule = parse("24/7")
+    assert schedule == ((0,), (WEEK,))
+    assert status(schedule, _at(WE, "03:00"))[0]
+
+
+def test_later_rule_overrides_named_days():
+    schedule = parse("Mo-Su 09:00-17:00; Su off")
+    assert _open(schedule, SA, "10:00") and not _open(schedule, SU, "10:00")
+
+
+def test_holiday_only_rule_is_skipped():
+    assert parse("Mo-Fr 09:00-17:00; PH off") == parse("Mo-Fr 09:00-17:00")
+    assert parse("PH 10:00-14:00") == ((), ())
+
+
+@pytest.mark.parametrize("expression", [
+    "Mo-Fr 08:00+",
+    "Jan-Mar Mo 09:00-17:00",
+    "Mo-Fr sunrise-sunset",
+    'Mo-Fr 09:00-17:00 "by appointment"',
+    "week 1-10 Mo 09:00-12:00",
+    "Mo 25:00-26:00",
+    "Mo 09:60-10:00",
+    "PH-Mo 09:00-17:00",
+])
+def test_unsupported_syntax_is_unknown(expression):
+    assert parse(expression) is None
+
+
+def test_compiled_schedules_are_cached_by_place_id(monkeypatch):
+    monkeypatch.setattr(opening_hours, "_compiled", TTLCache(100, 60))
+    calls = []
+    real_parse = opening_hours.parse
+    monkeypatch.setattr(opening_hours, "parse", lambda e: calls.append(e) or real_parse(e))
+
+    first = opening_hours.compiled("place-1", "Mo-Fr 08:00-20:00")
+    assert opening_hours.compiled("place-1", "Mo-Fr 08:00-20:00") is first
+    assert calls == ["Mo-Fr 08:00-20:00"]
+    opening_hours.compiled("place-1", "24/7")  # the string changed under the id
+    assert calls == ["Mo-Fr 08:00-20:00", "24/7"]
+    # Unparseable strings are cached too, as None.
+    assert opening_hours.compiled("place-2", "sunrise-sunset") is None
+    assert opening_hours.compiled("place-2", "sunrise-sunset") is None
+    assert calls.count("sunrise-sunset") == 1
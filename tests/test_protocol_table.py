@@ -0,0 +1,70 @@
+import random
+
+import baseline_triage
+import main
+from main import QUESTION_MAP, SymptomInput, UNIVERSAL_INTAKE
+
+SYMPTOMS = list(main.SYMPTOM_KEYWORDS) + ["other", "not-a-symptom"]
+PATHWAYS = [None, None, None] + list(QUESTION_MAP) + ["headache_sah", "stale_pathway", ""]
+QUESTIONS = (
+    [""] + UNIVERSAL_INTAKE + list(main.INITIAL_QUESTIONS.values()) + list(main.BRANCH_QUESTIONS.values())
+    + [q for qs in QUESTION_MAP.values() for q in qs] + ["something the client made up"]
+)
+ANSWERS = [
+    "yes", "no", "nope, that's all", "nothing else", "sudden and the worst ever", "pressure and sweating",
+    "I'm diabetic, on insulin", "frequency and urgency", "unconscious and not breathing", "I have a plan tonight",
+    "alone", "bright red, small amount", "high fever and neck stiffness", "drowsy", "about 3 days",
+    "chest pain and shortness of breath", "my head hurts", "I keep having seizures", "",
+]
+
+
+def _random_request(rng: random.Random) -> SymptomInput:
+    detected = rng.sample(SYMPTOMS, rng.randint(0, 3))
+    return SymptomInput(
+        message=rng.choice(ANSWERS + list(main.SYMPTOM_KEYWORDS)),
+        symptom_type=rng.choice([None] + SYMPTOMS),
+        question_index=rng.randint(-2, 16),
+        phase=rng.choice(["triage", "triage", "additional", "done"]),
+        all_answers=[
+            {"question": rng.choice(QUESTIONS), "answer": rng.choice(ANSWERS)} for _ in range(rng.randint(0, 8))
+        ],
+        detected_symptoms=detected,
+        triaged_symptoms=rng.sample(detected, rng.randint(0, len(detected))),
+        current_pathway=rng.choice(PATHWAYS),
+    )
+
+
+def test_fuzzed_requests_match_baseline():
+    rng = random.Random(5)
+    for _ in range(10000):
+        request = _random_request(rng)
+        assert main._triage_logic(request) == baseline_triage._triage_logic(request), request
+
+
+def test_sessions_match_baseline():
+    """Whole conversations, each turn built from the previous response
+    the way the frontend does it."""
+    rng = random.Random(6)
+    for _ in range(600):
+        state = {}
+        all_answers = []
+        asked = ""
+        message = rng.choice(list(main.SYMPTOM_KEYWORDS) + ["I feel unwell", "headache and chest pain"])
+        for _ in range(30):
+            request = SymptomInput(message=message, all_answers=all_answers, **state)
+            expected = baseline_triage._triage_logic(request)
+            assert main._triage_logic(request) == expected, request
+            if expected["phase"] == "done":
+                break
+            all_answers = all_answers + [{"question": asked, "answer": message}]
+            asked = expected["next_question"]
+            state = {k: expected[k] for k in (
+                "symptom_type", "question_index", "phase", "detected_symptoms", "triaged_symptoms", "current_pathway",
+            )}
+            message = rng.choice(ANSWERS)
+
+
+def test_unknown_symptom_compiled_protocols_are_not_cached():
+    before = len(main.TRIAGE_PROTOCOLS)
+    main._triage_logic(SymptomInput(message="hi", symptom_type="made-up", detected_symptoms=["made-up"], question_index=3))
+    assert len(main.TRIAGE_PROTOCOLS) == before
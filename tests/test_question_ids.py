@@ -0,0 +1,56 @@
+import random
+import zlib
+
+import pytest
+from pydantic import ValidationError
+
+import main
+from main import QUESTION_IDS, QUESTIONS_BY_ID, SymptomInput
+from test_protocol_table import ANSWERS, _random_request
+
+
+def test_ids_are_stable_crcs_of_the_question_text():
+    assert QUESTIONS_BY_ID[0] == ""
+    for question, qid in QUESTION_IDS.items():
+        if question:
+            assert qid == zlib.crc32(question.encode("utf-8")) & 0xFFFFFF
+    for question in main.UNIVERSAL_INTAKE + [q for qs in main.QUESTION_MAP.values() for q in qs]:
+        assert question in QUESTION_IDS
+
+
+def test_unknown_question_id_is_rejected():
+    unknown = next(i for i in range(1, 1 << 24) if i not in QUESTIONS_BY_ID)
+    with pytest.raises(ValidationError):
+        SymptomInput(message="yes", history=[[unknown, "yes"]])
+
+
+def test_compact_history_matches_all_answers():
+    """The same requests with history=[[question_id, answer], ...] instead
+    of all_answers (only questions the server knows can be sent this way)."""
+    rng = random.Random(7)
+    compared = 0
+    while compared < 5000:
+        request = _random_request(rng)
+        if any(entry.question not in QUESTION_IDS for entry in request.all_answers):
+            continue
+        compact = request.model_copy(update={
+            "all_answers": [],
+            "history": [(QUESTION_IDS[entry.question], entry.answer) for entry in request.all_answers],
+        })
+        assert main._triage_logic(compact) == main._triage_logic(request), request
+        compared += 1
+
+
+def test_responses_carry_the_next_questions_id(monkeypatch):
+    monkeypatch.setattr(main.emergency_dispatcher, "submit", lambda **kwargs: {"status": "queued"})
+    rng = random.Random(8)
+    history = [(0, "bad headaches")]
+    result = main.triage(SymptomInput(message=history[0][1]))
+    for _ in range(12):
+        assert QUESTIONS_BY_ID[result["question_id"]] == result["next_question"]
+        if result["phase"] == "done":
+            break
+        history.append((result["question_id"], rng.choice(ANSWERS)))
+        state = {k: result[k] for k in ("symptom_type", "question_index", "phase", "detected_symptoms",
+                                        "triaged_symptoms", "current_pathway")}
+        result = main.triage(SymptomInput(message=history[-1][1], history=history[:-1], **state))
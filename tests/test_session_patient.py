@@ -0,0 +1,46 @@
+import session_patient
+from ttl_cache import TTLCache
+
+
+def _fresh_caches(monkeypatch):
+    monkeypatch.setattr(session_patient, "_linked", TTLCache(100, 60))
+    monkeypatch.setattr(session_patient, "_unlinked", TTLCache(100, 60))
+
+
+def test_failed_lookup_is_not_cached_as_unlinked(monkeypatch):
+    _fresh_caches(monkeypatch)
+    answers = [
+        {"status": "error", "reason": "Supabase down"},
+        {"status": "found", "patients": {"s1": "p1"}},
+    ]
+    monkeypatch.setattr(session_patient, "get_session_patients", lambda ids: answers.pop(0))
+
+    first = session_patient.stamp([{"session_id": "s1"}])
+    assert "patient_id" not in first[0]
+    second = session_patient.stamp([{"session_id": "s1"}])
+    assert second[0]["patient_id"] == "p1"
+
+
+def test_unlinked_answer_is_cached(monkeypatch):
+    _fresh_caches(monkeypatch)
+    lookups = []
+
+    def lookup(ids):
+        lookups.append(ids)
+        return {"status": "found", "patients": {}}
+
+    monkeypatch.setattr(session_patient, "get_session_patients", lookup)
+    session_patient.stamp([{"session_id": "s1"}])
+    session_patient.stamp([{"session_id": "s1"}])
+    assert len(lookups) == 1
+
+
+def test_link_with_backfill_now_reports_rows_updated(monkeypatch):
+    _fresh_caches(monkeypatch)
+    monkeypatch.setattr(session_patient, "link_session_to_patient", lambda s, p: {"status": "linked"})
+    monkeypatch.setattr(session_patient, "backfill_session_events",
+                        lambda s, p, chunk: {"status": "backfilled", "rows_updated": 7})
+    monkeypatch.setenv("SESSION_PATIENT_NEGATIVE_TTL_SECONDS", "3600")  # keep the second pass out of the test
+
+    result = session_patient.link("s1", "p1", backfill_now=True)
+    assert result == {"status": "linked", "rows_updated": 7, "backfill": "done"}
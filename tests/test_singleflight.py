@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, SingleFlightTimeout, singleflight
+
+
+def test_followers_share_the_leaders_result():
+    group = SingleFlight("test_share")
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(2)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(group.do("k", slow))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert results == ["result"] * 5
+
+
+def test_follower_gives_up_at_its_own_timeout():
+    group = SingleFlight("test_timeout")
+    release = threading.Event()
+    leader = threading.Thread(target=group.do, args=("k", lambda: release.wait(2)))
+    leader.start()
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    with pytest.raises(SingleFlightTimeout):
+        group.do("k", lambda: pytest.fail("follower ran the call itself"), timeout=0.1)
+    assert time.monotonic() - started < 0.5
+    release.set()
+    leader.join()
+    assert group.in_flight() == 0
+
+
+def test_decorator_returns_on_timeout_result():
+    release = threading.Event()
+
+    @singleflight("test_decorator", key=lambda x, timeout=10.0: x,
+                  wait=lambda x, timeout=10.0: timeout, on_timeout=lambda: "gave up")
+    def lookup(x, timeout=10.0):
+        release.wait(2)
+        return f"looked up {x}"
+
+    leader_result = []
+    leader = threading.Thread(target=lambda: leader_result.append(lookup("a")))
+    leader.start()
+    time.sleep(0.05)
+    assert lookup("a", timeout=0.05) == "gave up"
+    release.set()
+    leader.join()
+    assert leader_result == ["looked up a"]
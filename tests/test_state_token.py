@@ -0,0 +1,114 @@
+import base64
+import time
+
+import pytest
+
+import state_token
+from main import QUESTION_IDS, QUESTIONS_BY_ID, STATE_TOKEN_NAMES
+from state_token import StateTokenCodec, create_state_codec
+
+SECRET = b"test-secret"
+STATE = {
+    "symptom_type": "chest_pain",
+    "question_index": 3,
+    "phase": "triage",
+    "detected_symptoms": ["chest_pain", "shortness_of_breath"],
+    "triaged_symptoms": ["chest_pain"],
+    "current_pathway": "chest_pain",
+}
+
+
+def _codec(secret=SECRET, names=STATE_TOKEN_NAMES, question_ids=QUESTION_IDS,
+           questions_by_id=QUESTIONS_BY_ID, max_age_seconds=86400):
+    return StateTokenCodec(secret, names, question_ids, questions_by_id, max_age_seconds)
+
+
+def _history():
+    known = list(QUESTION_IDS)[:3]
+    return [(known[0], "yes, since this morning"), (known[1], "no"),
+            ("a question with no id", "free text é"), (known[2], "x" * 300)]
+
+
+def _flip(token, index):
+    raw = bytearray(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    raw[index] ^= 0x01
+    return base64.urlsafe_b64encode(bytes(raw)).rstrip(b"=").decode("ascii")
+
+
+def test_round_trip():
+    codec = _codec()
+    state, history = codec.decode(codec.encode(STATE, _history()))
+    assert state == STATE
+    assert history == _history()
+
+
+def test_round_trip_with_names_outside_the_table():
+    codec = _codec()
+    state = dict(STATE, symptom_type="something_new", detected_symptoms=["chest_pain", "something_new"])
+    assert codec.decode(codec.encode(state, []))[0] == state
+
+
+def test_round_trip_with_empty_state():
+    codec = _codec()
+    state, history = codec.decode(codec.encode({}, []))
+    assert state == {"question_index": 0, "symptom_type": None, "current_pathway": None, "phase": None,
+                     "detected_symptoms": [], "triaged_symptoms": []}
+    assert history == []
+
+
+@pytest.mark.parametrize("index", [0, 1, 5, -1, -16])
+def test_flipped_byte_is_rejected(index):
+    codec = _codec()
+    assert codec.decode(_flip(codec.encode(STATE, _history()), index)) is None
+
+
+def test_forged_mac_is_rejected():
+    codec = _codec()
+    raw = base64.urlsafe_b64decode(codec.encode(STATE, _history()) + "==")
+    forged = raw[:-16] + bytes(16)
+    assert codec.decode(base64.urlsafe_b64encode(forged).decode("ascii")) is None
+
+
+@pytest.mark.parametrize("token", ["", "not base64!", "AAAA", "A" * 40])
+def test_garbage_is_rejected(token):
+    assert _codec().decode(token) is None
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    codec = _codec(max_age_seconds=60)
+    token = codec.encode(STATE, _history())
+    now = time.time()
+    monkeypatch.setattr(state_token.time, "time", lambda: now + 61)
+    assert codec.decode(token) is None
+    monkeypatch.setattr(state_token.time, "time", lambda: now + 59)
+    assert codec.decode(token) is not None
+
+
+def test_wrong_secret_is_rejected():
+    token = _codec().encode(STATE, _history())
+    assert _codec(secret=b"another-secret").decode(token) is None
+
+
+def test_names_table_change_is_rejected():
+    # Same secret, but a deploy added a symptom: the fingerprint differs.
+    token = _codec().encode(STATE, _history())
+    assert _codec(names=STATE_TOKEN_NAMES + ["new_symptom"]).decode(token) is None
+
+
+def test_unknown_question_id_is_rejected():
+    token = _codec().encode(STATE, _history())
+    question = _history()[0][0]
+    missing = {qid: q for qid, q in QUESTIONS_BY_ID.items() if q != question}
+    assert _codec(questions_by_id=missing).decode(token) is None
+
+
+def test_create_state_codec_needs_a_secret(monkeypatch):
+    monkeypatch.delenv("TRIAGE_STATE_SECRET", raising=False)
+    assert create_state_codec(STATE_TOKEN_NAMES, QUESTION_IDS, QUESTIONS_BY_ID) is None
+    monkeypatch.setenv("TRIAGE_STATE_SECRET", "")
+    assert create_state_codec(STATE_TOKEN_NAMES, QUESTION_IDS, QUESTIONS_BY_ID) is None
+    monkeypatch.setenv("TRIAGE_STATE_SECRET", "s3cret")
+    monkeypatch.setenv("TRIAGE_STATE_TOKEN_MAX_AGE_SECONDS", "120")
+    codec = create_state_codec(STATE_TOKEN_NAMES, QUESTION_IDS, QUESTIONS_BY_ID)
+    assert codec.max_age_seconds == 120
+    assert codec.decode(codec.encode(STATE, [])) is not None
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+import walkin_clinics
+from ttl_cache import TTLCache
+
+LAT, LNG = 50.4452, -104.6189
+
+
+def _place(lat, lng):
+    return {"id": "p1", "name": "Clinic", "address": "1 Main St", "phone": None,
+            "opening_hours": None, "lat": lat, "lng": lng}
+
+
+def test_ring_search_stops_widening_at_the_deadline(monkeypatch):
+    timeouts = []
+
+    def slow_fetch(lat, lng, radius_km, limit, timeout=10.0):
+        timeouts.append(timeout)
+        time.sleep(min(timeout, 0.15))
+        # One clinic only, so every ring is short of RESULT_LIMIT and the
+        # search would otherwise widen all the way to 200 km.
+        return {"status": "success", "places": [_place(LAT + 0.01, LNG)]}
+
+    monkeypatch.setenv("CLINIC_SEARCH_DEADLINE_SECONDS", "0.4")
+    monkeypatch.setattr(walkin_clinics, "_tile_cache", TTLCache(100, 60))
+    monkeypatch.setattr(walkin_clinics, "_fetch_places", slow_fetch)
+    monkeypatch.setattr(walkin_clinics.geoapify_quota, "clinic_search_degraded", lambda: False)
+
+    start = time.monotonic()
+    result = walkin_clinics.find_nearby_walkin_clinics(LAT, LNG)
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 0.6
+    assert result["status"] == "success"
+    assert len(result["clinics"]) == 1
+    assert result["radius_km"] < walkin_clinics.SEARCH_RINGS_KM[-1]
+    assert all(t <= 0.4 for t in timeouts)
+    assert timeouts == sorted(timeouts, reverse=True)
+
+
+def test_haversine_km():
+    assert walkin_clinics.haversine_km(LAT, LNG, LAT, LNG) == 0
+    # Regina to Saskatoon, ~235 km.
+    assert 230 < walkin_clinics.haversine_km(LAT, LNG, 52.1332, -106.6700) < 240
+
+
+def _degraded(monkeypatch):
+    monkeypatch.setattr(walkin_clinics, "_tile_cache", TTLCache(100, 60))
+    monkeypatch.setattr(walkin_clinics.geoapify_quota, "clinic_search_degraded", lambda: True)
+    monkeypatch.setattr(walkin_clinics, "_fetch_places",
+                        lambda *a, **k: pytest.fail("cache-only search went upstream"))
+
+
+def _cache_tile(level_km, places):
+    precision = dict(walkin_clinics.TILE_LEVELS)[level_km]
+    cell = walkin_clinics.geohash.encode(LAT, LNG, precision)
+    walkin_clinics._tile_cache.set(walkin_clinics._tile_key(level_km, cell), {
+        "status": "success", "center": walkin_clinics.geohash.center(cell),
+        "complete_km": level_km, "places": places,
+    })
+
+
+def test_cache_only_search_widens_past_uncached_rings(monkeypatch):
+    _degraded(monkeypatch)
+    _cache_tile(100, [_place(LAT + 0.5, LNG)])  # ~56 km north; no 25/50 km tile cached
+
+    result = walkin_clinics.find_nearby_walkin_clinics(LAT, LNG)
+    assert result["status"] == "success"
+    assert result["radius_km"] == 100
+    assert result["degraded"] is True
+    assert [c["id"] for c in result["clinics"]] == ["p1"]
+
+
+def test_cache_only_search_fails_only_when_no_ring_is_cached(monkeypatch):
+    _degraded(monkeypatch)
+    result = walkin_clinics.find_nearby_walkin_clinics(LAT, LNG)
+    assert result["status"] == "error"
+    assert "quota" in result["reason"]
+
+    _cache_tile(200, [])  # cached, and genuinely empty
+    assert walkin_clinics.find_nearby_walkin_clinics(LAT, LNG)["status"] == "no_results"
+
+
+def test_open_clinic_beyond_the_nearest_five_is_offered(monkeypatch):
+    _degraded(monkeypatch)
+    closed = [dict(_place(LAT + 0.001 * (i + 1), LNG), id=f"closed{i}", opening_hours="Mo-Su off")
+              for i in range(6)]
+    open_farther = dict(_place(LAT + 0.02, LNG), id="open", opening_hours="24/7")
+    _cache_tile(25, closed + [open_farther])
+
+    result = walkin_clinics.find_nearby_walkin_clinics(LAT, LNG)
+    ids = [c["id"] for c in result["clinics"]]
+    assert len(ids) == walkin_clinics.RESULT_LIMIT
+    assert ids[0] == "open"
+    assert ids[1:] == ["closed0", "closed1", "closed2", "closed3"]
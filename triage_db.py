@@ -27,7 +27,9 @@ here instead of just documented as a setup requirement.
 """
 
 import os
-from typing import Optional, Dict, Any
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List
 from supabase import create_client, Client
 
 _supabase_client: Optional[Client] = None
@@ -54,6 +56,42 @@ def _get_supabase() -> Optional[Client]:
     return _supabase_client
 
 
+def is_configured() -> bool:
+    """True if the Supabase env vars are set. Checks the environment only --
+    no client is created and nothing is sent."""
+    return bool(os.environ.get("SUPABASE_URL") and os.environ.get("SUPABASE_SERVICE_ROLE_KEY"))
+
+
+def event_row(
+    session_id: str,
+    event_type: str,
+    patient_id: Optional[str] = None,
+    body_system: Optional[str] = None,
+    symptom: Optional[str] = None,
+    severity: Optional[int] = None,
+    location_region: Optional[str] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+    event_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    One triage_events row, as inserted by log_event() / insert_events().
+    Every row gets an event_id -- the client's if it sent one, else a
+    fresh one -- so that re-inserting the same row is a no-op (the unique
+    index from migrations/002_triage_events_event_id.sql).
+    """
+    return {
+        "event_id": event_id or uuid.uuid4().hex,
+        "session_id": session_id,
+        "event_type": event_type,
+        "patient_id": patient_id,
+        "body_system": body_system,
+        "symptom": symptom,
+        "severity": severity,
+        "location_region": location_region,
+        "metadata": metadata or {},
+    }
+
+
 def log_event(
     session_id: str,
     event_type: str,
@@ -63,29 +101,31 @@ def log_event(
     severity: Optional[int] = None,
     location_region: Optional[str] = None,
     metadata: Optional[Dict[str, Any]] = None,
+    event_id: Optional[str] = None,
 ) -> dict:
     """
     Insert one row into triage_events. Never raises — a logging
     failure must never break the patient's actual triage flow, so
     any error here is caught and returned as a status dict instead
     of propagating up and interrupting a 911 call, ER routing, etc.
+
+    A row whose event_id is already stored (a client retry) is skipped
+    and reported as {"status": "duplicate"}.
     """
     db = _get_supabase()
     if db is None:
         return {"status": "not_configured", "reason": "Supabase env vars not set"}
     try:
-        row = {
-            "session_id": session_id,
-            "event_type": event_type,
-            "patient_id": patient_id,
-            "body_system": body_system,
-            "symptom": symptom,
-            "severity": severity,
-            "location_region": location_region,
-            "metadata": metadata or {},
-        }
-        result = db.table("triage_events").insert(row).execute()
-        return {"status": "logged", "id": result.data[0]["id"] if result.data else None}
+        row = event_row(session_id, event_type, patient_id, body_system,
+                        symptom, severity, location_region, metadata, event_id)
+        result = (
+            db.table("triage_events")
+            .upsert(row, on_conflict="event_id", ignore_duplicates=True)
+            .execute()
+        )
+        if not result.data:
+            return {"status": "duplicate", "event_id": row["event_id"]}
+        return {"status": "logged", "id": result.data[0]["id"]}
     except Exception as e:
         # Logging is best-effort. A failed log write should never
         # block or crash the actual patient-facing flow.
@@ -93,6 +133,32 @@ def log_event(
         return {"status": "error", "reason": str(e)}
 
 
+def insert_events(rows: List[Dict[str, Any]]) -> dict:
+    """
+    Insert many triage_events rows (built with event_row()) in ONE
+    multi-row request -- used by event_writer.py's batched flushes and
+    the spool replayer. Rows whose event_id is already stored are skipped
+    (ON CONFLICT DO NOTHING), so a batch can be retried or replayed
+    without double-counting. Never raises; the batch succeeds or fails
+    as a whole.
+    """
+    if not rows:
+        return {"status": "logged", "count": 0}
+    db = _get_supabase()
+    if db is None:
+        return {"status": "not_configured", "reason": "Supabase env vars not set"}
+    try:
+        (
+            db.table("triage_events")
+            .upsert(rows, on_conflict="event_id", ignore_duplicates=True, returning="minimal")
+            .execute()
+        )
+        return {"status": "logged", "count": len(rows)}
+    except Exception as e:
+        print(f"[triage_db] insert_events failed: {e}")
+        return {"status": "error", "reason": str(e)}
+
+
 def create_registration(fields: Dict[str, Any]) -> dict:
     """
     Insert one row into triage_registration. All fields are optional
@@ -223,21 +289,141 @@ def get_events_by_session_prefix(session_prefix: str) -> dict:
 
 def link_session_to_patient(full_session_id: str, patient_id: str) -> dict:
     """
-    Retroactively attaches a patient_id to every triage_events row for a
-    given session — called after the nurse enters a health card number
-    for a patient who used the app anonymously, then showed up in person.
+    Records that a session belongs to a patient -- one row upserted into
+    session_patient, however many events the session has. Events written
+    from then on are stamped with the patient_id as they're inserted
+    (session_patient.py); the ones already written are attached by
+    backfill_session_events(). The table is created by
+    migrations/003_session_patient.sql.
     """
     db = _get_supabase()
     if db is None:
         return {"status": "not_configured", "reason": "Supabase env vars not set"}
     try:
-        result = (
-            db.table("triage_events")
-            .update({"patient_id": patient_id})
-            .eq("session_id", full_session_id)
+        (
+            db.table("session_patient")
+            .upsert(
+                {
+                    "session_id": full_session_id,
+                    "patient_id": patient_id,
+                    "linked_at": datetime.now(timezone.utc).isoformat(),
+                },
+                on_conflict="session_id",
+                returning="minimal",
+            )
             .execute()
         )
-        return {"status": "linked", "rows_updated": len(result.data) if result.data else 0}
+        return {"status": "linked"}
     except Exception as e:
         print(f"[triage_db] link_session_to_patient failed: {e}")
-        return {"status": "error", "reason": str(e)}
\ No newline at end of file
+        return {"status": "error", "reason": str(e)}
+
+
+def get_session_patients(session_ids: List[str]) -> dict:
+    """
+    patient_id for each of these sessions that has been linked, in one
+    query: {"status": "found", "patients": {session_id: patient_id}}
+    (sessions not linked are simply absent).
+    """
+    db = _get_supabase()
+    if db is None:
+        return {"status": "not_configured", "reason": "Supabase env vars not set"}
+    try:
+        result = (
+            db.table("session_patient")
+            .select("session_id, patient_id")
+            .in_("session_id", list(session_ids))
+            .execute()
+        )
+        return {"status": "found", "patients": {row["session_id"]: row["patient_id"] for row in result.data or []}}
+    except Exception as e:
+        print(f"[triage_db] get_session_patients failed: {e}")
+        return {"status": "error", "reason": str(e)}
+
+
+def backfill_session_events(full_session_id: str, patient_id: str, chunk_size: int = 500) -> dict:
+    """
+    Attaches patient_id to a session's already-written triage_events rows,
+    chunk_size rows per UPDATE (by id), so no single statement rewrites a
+    huge session at once and nothing is sent back but counts. Rows that
+    already carry this patient_id are left alone.
+    """
+    db = _get_supabase()
+    if db is None:
+        return {"status": "not_configured", "reason": "Supabase env vars not set"}
+    updated = 0
+    try:
+        while True:
+            pending = (
+                db.table("triage_events")
+                .select("id")
+                .eq("session_id", full_session_id)
+                .or_(f"patient_id.is.null,patient_id.neq.{patient_id}")
+                .limit(chunk_size)
+                .execute()
+            )
+            ids = [row["id"] for row in pending.data or []]
+            if not ids:
+                break
+            (
+                db.table("triage_events")
+                .update({"patient_id": patient_id}, returning="minimal")
+                .in_("id", ids)
+                .execute()
+            )
+            updated += len(ids)
+            if len(ids) < chunk_size:
+                break
+        return {"status": "backfilled", "rows_updated": updated}
+    except Exception as e:
+        print(f"[triage_db] backfill_session_events failed: {e}")
+        return {"status": "error", "reason": str(e), "rows_updated": updated}
+
+
+def claim_emergency_call_key(dedup_key: str, ttl_seconds: float) -> dict:
+    """
+    Atomically claims dedup_key in emergency_call_claims, so only one
+    worker/replica places the emergency calls for it. The table's primary
+    key is what makes this atomic: of several concurrent inserts for the
+    same key, Postgres lets exactly one through. The table is created by
+    migrations/001_emergency_call_claims.sql.
+
+    A leftover row past its expires_at doesn't count: it is deleted
+    (only if still expired, so two replicas can't both clear a live
+    claim) and the insert retried once.
+
+    Returns {"status": "claimed"} or {"status": "duplicate"}, or
+    not_configured/error -- never raises.
+    """
+    db = _get_supabase()
+    if db is None:
+        return {"status": "not_configured", "reason": "Supabase env vars not set"}
+    now = datetime.now(timezone.utc)
+    row = {
+        "dedup_key": dedup_key,
+        "claimed_at": now.isoformat(),
+        "expires_at": (now + timedelta(seconds=ttl_seconds)).isoformat(),
+    }
+    try:
+        for attempt in range(2):
+            try:
+                db.table("emergency_call_claims").insert(row).execute()
+                return {"status": "claimed"}
+            except Exception as e:
+                if getattr(e, "code", None) != "23505":  # unique_violation
+                    raise
+            if attempt:
+                break
+            cleared = (
+                db.table("emergency_call_claims")
+                .delete()
+                .eq("dedup_key", dedup_key)
+                .lt("expires_at", now.isoformat())
+                .execute()
+            )
+            if not cleared.data:
+                break
+        return {"status": "duplicate"}
+    except Exception as e:
+        print(f"[triage_db] claim_emergency_call_key failed: {e}")
+        return {"status": "error", "reason": str(e)}
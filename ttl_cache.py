@@ -0,0 +1,148 @@
+"""
+BRISK TTL Cache Module
+-----------------------
+A small thread-safe LRU cache with a time-to-live and a hard entry cap,
+used anywhere the backend keeps state in process memory (triage session
+histories, lookup caches). Everything it holds is bounded: once
+max_entries is reached the least recently used entry is evicted, and an
+entry past its TTL is treated as absent and dropped.
+
+Two TTL styles:
+  - idle TTL (refresh_on_get=True): every read pushes expiry forward, so
+    an entry lives as long as it keeps being used -- right for sessions.
+  - absolute TTL (refresh_on_get=False): expiry is fixed when the value
+    is stored -- right for cached upstream data that goes out of date.
+
+STALE ENTRIES (stale_seconds > 0): an entry past its TTL is kept for
+stale_seconds longer. get() still treats it as absent, but get_stale()
+returns it, flagged as not fresh -- so a caller can answer instantly
+with slightly old data while it refreshes the entry in the background
+(stale-while-revalidate), e.g. during an upstream outage.
+
+Counters (hits, misses, stale hits, evictions, expirations) are kept so
+callers can report how well a cache is actually doing.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    def __init__(self, max_entries: int, ttl_seconds: float, refresh_on_get: bool = False,
+                 stale_seconds: float = 0.0):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self.refresh_on_get = refresh_on_get
+        self.stale_seconds = stale_seconds
+        self._data: "OrderedDict[Hashable, list]" = OrderedDict()  # key -> [value, expires_at]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            if item[1] <= now:
+                if item[1] + self.stale_seconds <= now:
+                    del self._data[key]
+                    self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            if self.refresh_on_get:
+                item[1] = now + self.ttl_seconds
+            self.hits += 1
+            return item[0]
+
+    def get_stale(self, key: Hashable) -> Tuple[Optional[Any], bool]:
+        """
+        (value, True) for a fresh entry, (value, False) for one past its
+        TTL but still inside the stale window, (None, False) otherwise.
+        """
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None, False
+            if item[1] + self.stale_seconds <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None, False
+            self._data.move_to_end(key)
+            if item[1] <= now:
+                self.stale_hits += 1
+                return item[0], False
+            if self.refresh_on_get:
+                item[1] = now + self.ttl_seconds
+            self.hits += 1
+            return item[0], True
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = [value, time.monotonic() + self.ttl_seconds]
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def add(self, key: Hashable, value: Any) -> bool:
+        """
+        Stores value only if key is absent (or expired), atomically: of
+        several threads adding the same key, exactly one gets True.
+        """
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                if item[1] > now:
+                    return False
+                self.expirations += 1
+            self._data[key] = [value, now + self.ttl_seconds]
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def purge_expired(self) -> int:
+        """Drops every expired entry now, rather than waiting for a read to find it."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, item in self._data.items() if item[1] + self.stale_seconds <= now]
+            for key in expired:
+                del self._data[key]
+            self.expirations += len(expired)
+            return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "stale_hits": self.stale_hits,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -12,16 +12,121 @@ source in part, but with actual uptime/reliability, a real free tier
 (3,000 requests/day, no credit card required), and a stable single
 endpoint instead of a patchwork of public mirrors of varying quality.
 
+TILE CACHE: the free tier is 3,000 requests/day, and patients in the same
+town all ask for the same handful of clinics. So Geoapify is queried per
+geohash TILE (precision 5 by default, ~3 x 5 km in Saskatchewan), not per
+patient: one request fetches up to TILE_FETCH_LIMIT clinics around the
+tile's centre, with the search radius widened by the distance from the
+centre to the tile's corner -- so every clinic within SEARCH_RADIUS_KM of
+ANY point in the tile is covered. Each patient's answer is then cut from
+that cached superset and re-ranked by haversine_km from their exact
+position.
+
+If the tile came back full (TILE_FETCH_LIMIT results), it only provably
+holds every clinic out to its farthest result; when that isn't far enough
+to vouch for this patient's nearest RESULT_LIMIT, we fall back to a
+direct per-patient query (as before) rather than return a wrong list.
+Empty tiles are cached too (rural areas); errors are not.
+
+RINGS: a fixed 25 km circle left rural patients with "no_results", so the
+search widens through SEARCH_RINGS_KM (10, 25, 50, 100, 200 km) and stops
+at the first ring holding RESULT_LIMIT clinics -- in town that's the 10 or
+25 km ring, served from the same tile as before. Each wider ring has its
+own, coarser tile level (TILE_LEVELS), so it costs a Geoapify request only
+the first time anyone in that area needs it; when the local clinic
+snapshot (clinic_index.py) covers a ring, it answers without any request.
+The response's radius_km says which ring answered. The whole search,
+however many rings it widens through, gets ONE deadline
+(CLINIC_SEARCH_DEADLINE_SECONDS): each request is given only what is
+left of it, and once it is spent the search stops widening and answers
+with what the inner rings found.
+
+OPENING HOURS: each clinic carries open_now / closes_soon flags computed
+from its OSM opening_hours (opening_hours.py), and the list is ordered
+open clinics first, so a patient searching at 9 pm sees the one still
+open before the nearer ones that closed at 8. The ordering is applied to
+the answering ring's nearest CANDIDATE_LIMIT clinics BEFORE the list is
+cut to RESULT_LIMIT -- otherwise five nearby clinics that are all closed
+would push out an open one just beyond them.
+
+OUTAGES: Places requests go through a circuit breaker (circuit_breaker.py)
+that opens after repeated failures or slow (> 5 s) answers, so during an
+outage a search fails in milliseconds instead of after the full 10 s. A
+tile past its TTL is still served for CLINIC_TILE_STALE_SECONDS longer
+-- instantly, while a background request refreshes it -- so a town that
+was searched recently keeps getting answers through an outage.
+
+QUOTA: every Places request is cleared with geoapify_quota.py first --
+per-patient searches as paced "clinic" requests, snapshot pages as "bulk"
+-- so walk-in lookups can never eat the reserve kept for emergency
+reverse geocoding. Once the day's non-emergency budget is mostly spent,
+searches go CACHE-ONLY: answered from whatever tile is cached, however
+stale, and never sent upstream. A ring whose tile isn't cached is
+skipped and the search keeps widening, so a wider tile someone else
+already fetched still answers; only when no ring had a cached tile does
+the search fail with the quota message.
+
 Requires this environment variable (e.g. in Railway):
     GEOAPIFY_API_KEY
+Optional:
+    CLINIC_TILE_PRECISION           (default 5)
+    CLINIC_TILE_TTL_SECONDS         (default 21600, i.e. 6 hours)
+    CLINIC_TILE_CACHE_MAX_ENTRIES   (default 2000)
+    CLINIC_TILE_STALE_SECONDS       (default 86400, i.e. 24 hours)
+    CLINIC_SEARCH_DEADLINE_SECONDS  (default 10, for all rings together)
+    GEOAPIFY_BREAKER_FAILURES / GEOAPIFY_BREAKER_RESET_SECONDS
+                                    (see circuit_breaker.py)
+    GEOAPIFY_DAILY_LIMIT etc.       (see geoapify_quota.py)
 """
 
 import os
 import math
-from typing import Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 import httpx
 
+import circuit_breaker
+import geoapify_quota
+import geohash
+import http_client
+import metrics
+import opening_hours
+from singleflight import singleflight
+from ttl_cache import TTLCache
+
 PLACES_URL = "https://api.geoapify.com/v2/places"
+SEARCH_RADIUS_KM = 25
+SEARCH_RINGS_KM = (10, 25, 50, 100, 200)
+RESULT_LIMIT = 5
+# How many of a ring's nearest clinics are ranked by opening hours before
+# the answer is cut to RESULT_LIMIT.
+CANDIDATE_LIMIT = 25
+TILE_FETCH_LIMIT = 100
+
+TILE_PRECISION = int(os.environ.get("CLINIC_TILE_PRECISION", "5"))
+# (radius, geohash precision) of each tile level; a ring is answered from
+# the smallest level reaching it. Wider levels use coarser tiles (~20 x 25
+# km at precision 4, ~155 x 95 km at 3 in Saskatchewan) so rural areas
+# share them.
+TILE_LEVELS = ((SEARCH_RADIUS_KM, TILE_PRECISION), (50, 4), (100, 4), (200, 3))
+_tile_cache = TTLCache(
+    int(os.environ.get("CLINIC_TILE_CACHE_MAX_ENTRIES", "2000")),
+    float(os.environ.get("CLINIC_TILE_TTL_SECONDS", "21600")),
+    stale_seconds=float(os.environ.get("CLINIC_TILE_STALE_SECONDS", "86400")),
+)
+_breaker = circuit_breaker.from_env("geoapify_places", "GEOAPIFY_BREAKER", slow_call_seconds=5.0)
+# Background refreshes of stale tiles.
+_refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="clinic-tile-refresh")
+metrics.register_stats("walkin_clinics_tile_cache", _tile_cache.stats)
+_tile_hits = metrics.counter("walkin_clinics_tile_hits")
+_tile_misses = metrics.counter("walkin_clinics_tile_misses")
+_direct_queries = metrics.counter("walkin_clinics_direct_queries")
+_stale_served = metrics.counter("walkin_clinics_tile_stale_served")
+_cache_only = metrics.counter("walkin_clinics_cache_only_searches")
+_index_rings = metrics.counter("walkin_clinics_index_rings")
+_deadline_stops = metrics.counter("walkin_clinics_deadline_stops")
+_upstream_latency = metrics.histogram("walkin_clinics_upstream_seconds")
 
 # healthcare.clinic_or_praxis covers general practice / walk-in clinic type
 # places in Geoapify's category system -- this is the closest match to
@@ -30,7 +135,8 @@ PLACES_URL = "https://api.geoapify.com/v2/places"
 CATEGORY = "healthcare.clinic_or_praxis"
 
 
-def _distance_km(lat1, lng1, lat2, lng2):
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points, in km."""
     R = 6371
     d_lat = math.radians(lat2 - lat1)
     d_lng = math.radians(lng2 - lng1)
@@ -60,59 +166,265 @@ def _extract_phone(properties: dict) -> Optional[str]:
     return None
 
 
-def find_nearby_walkin_clinics(lat: float, lng: float) -> dict:
+def _extract_opening_hours(properties: dict) -> Optional[str]:
+    """The OSM opening_hours string, top-level or (usually) under datasource.raw."""
+    if properties.get("opening_hours"):
+        return properties["opening_hours"]
+    raw = (properties.get("datasource") or {}).get("raw") or {}
+    return raw.get("opening_hours") or None
+
+
+def find_nearby_walkin_clinics(lat: float, lng: float, index=None) -> dict:
+    """
+    Returns {"status": "success", "clinics": [...], "radius_km": r} on
+    success, or a clear error status otherwise. Never raises -- the caller
+    (main.py) always gets a usable dict back, so a missing API key or a
+    Geoapify outage can't crash or hang the request; it returns an error
+    status the frontend already knows how to display gracefully.
+
+    Searches the SEARCH_RINGS_KM rings from the inside out and stops at the
+    first one holding RESULT_LIMIT clinics; radius_km says which ring
+    answered. Its nearest CANDIDATE_LIMIT clinics are ordered open first
+    (opening_hours.rank_key, nearest first within each group) and the first
+    RESULT_LIMIT returned. index, if given, is a clinic_index.ClinicIndex asked
+    first for every ring it fully covers.
+
+    All rings share CLINIC_SEARCH_DEADLINE_SECONDS: no ring is started
+    once it has passed, and each request only gets what is left of it.
+    """
+    degraded = geoapify_quota.clinic_search_degraded()
+    if degraded:
+        _cache_only.inc()
+
+    deadline = time.monotonic() + float(os.environ.get("CLINIC_SEARCH_DEADLINE_SECONDS", "10"))
+    clinics, answered_km = [], None
+    for radius_km in SEARCH_RINGS_KM:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            _deadline_stops.inc()
+            if not clinics:
+                return _timed_out()
+            break
+        ring = _search_ring(lat, lng, radius_km, index, degraded, remaining)
+        if ring["status"] == "not_cached":
+            continue  # cache-only: try the next ring's (coarser) tile
+        if ring["status"] != "success":
+            if not clinics:
+                return ring
+            break  # a wider ring failed -- the clinics already found still stand
+        clinics, answered_km = ring["clinics"], radius_km
+        if len(clinics) >= RESULT_LIMIT:
+            break
+    if answered_km is None:
+        return {"status": "error", "reason": "Clinic search is limited for today (Geoapify quota)", "degraded": True}
+    metrics.counter(f"walkin_clinics_answered_within_{answered_km}km").inc()
+
+    if clinics:
+        clinics.sort(key=opening_hours.rank_key)
+        result = {"status": "success", "clinics": clinics[:RESULT_LIMIT], "radius_km": answered_km}
+    else:
+        result = {"status": "no_results", "radius_km": answered_km}
+    if degraded:
+        result["degraded"] = True
+    return result
+
+
+def _search_ring(lat: float, lng: float, radius_km: float, index, degraded: bool,
+                 timeout: float) -> dict:
+    """The nearest CANDIDATE_LIMIT clinics within radius_km, nearest first:
+    from the local index if it covers the ring, else from the tile level
+    that reaches it, spending at most timeout seconds on Geoapify."""
+    if index is not None and index.covers(lat, lng, radius_km):
+        _index_rings.inc()
+        return {"status": "success", "clinics": index.nearest(lat, lng, radius_km, CANDIDATE_LIMIT)}
+
+    level_km, precision = next(level for level in TILE_LEVELS if level[0] >= radius_km)
+    cell = geohash.encode(lat, lng, precision)
+    if degraded:
+        # Cache-only, for when the Geoapify quota is running short: the cached
+        # tile (fresh or stale) ranked as-is, with no direct query to fill it
+        # out and no refresh. No tile means this ring can't be answered, not
+        # that it is empty -- the caller moves on to the next ring.
+        tile, _ = _tile_cache.get_stale(_tile_key(level_km, cell))
+        if tile is None:
+            return {"status": "not_cached"}
+        return {"status": "success", "clinics": _rank(tile["places"], lat, lng, radius_km)}
+
+    started = time.monotonic()
+    tile = _get_tile(level_km, cell, timeout)
+    if tile["status"] != "success":
+        return tile
+
+    # The tile is complete out to complete_km from its centre, so from the
+    # patient's position it vouches for everything within trusted_km.
+    trusted_km = tile["complete_km"] - haversine_km(lat, lng, *tile["center"])
+    clinics = _rank(tile["places"], lat, lng, min(radius_km, trusted_km))
+    if trusted_km < radius_km and len(clinics) < RESULT_LIMIT:
+        remaining = timeout - (time.monotonic() - started)
+        if remaining <= 0:
+            return _timed_out()
+        _direct_queries.inc()
+        direct = _fetch_places(lat, lng, radius_km, CANDIDATE_LIMIT, remaining)
+        if direct["status"] != "success":
+            return direct
+        clinics = _rank(direct["places"], lat, lng, radius_km)
+    return {"status": "success", "clinics": clinics}
+
+
+def _tile_key(level_km: int, cell: str) -> str:
+    return f"{level_km}:{cell}"
+
+
+def _get_tile(level_km: int, cell: str, timeout: float = 10.0) -> dict:
+    """The cached superset for one geohash tile, fetching it on a miss."""
+    tile, fresh = _tile_cache.get_stale(_tile_key(level_km, cell))
+    if tile is not None:
+        if fresh:
+            _tile_hits.inc()
+        else:
+            _stale_served.inc()
+            _refresher.submit(_fetch_tile, level_km, cell)
+        return tile
+    _tile_misses.inc()
+    return _fetch_tile(level_km, cell, timeout)
+
+
+def _timed_out() -> dict:
+    return {"status": "error", "reason": "Clinic search timed out"}
+
+
+@singleflight("clinic_tile", key=lambda level_km, cell, timeout=10.0: _tile_key(level_km, cell),
+              wait=lambda level_km, cell, timeout=10.0: timeout, on_timeout=_timed_out)
+def _fetch_tile(level_km: int, cell: str, timeout: float = 10.0) -> dict:
+    center = geohash.center(cell)
+    lat_lo, lat_hi, lng_lo, lng_hi = geohash.bounds(cell)
+    half_diagonal_km = haversine_km(lat_lo, lng_lo, lat_hi, lng_hi) / 2
+    radius_km = level_km + half_diagonal_km
+    fetched = _fetch_places(center[0], center[1], radius_km, TILE_FETCH_LIMIT, timeout)
+    if fetched["status"] != "success":
+        return fetched
+
+    places = fetched["places"]
+    if len(places) >= TILE_FETCH_LIMIT:
+        complete_km = max(haversine_km(center[0], center[1], p["lat"], p["lng"]) for p in places)
+    else:
+        complete_km = radius_km
+    tile = {"status": "success", "center": center, "complete_km": complete_km, "places": places}
+    _tile_cache.set(_tile_key(level_km, cell), tile)
+    return tile
+
+
+def _rank(places: List[dict], lat: float, lng: float, max_km: float) -> List[dict]:
+    """Clinics within max_km of (lat, lng), nearest first, at most CANDIDATE_LIMIT."""
+    scored = []
+    for place in places:
+        distance = haversine_km(lat, lng, place["lat"], place["lng"])
+        if distance <= max_km:
+            scored.append((distance, place))
+    scored.sort(key=lambda item: item[0])
+    return [clinic_entry(place, distance) for distance, place in scored[:CANDIDATE_LIMIT]]
+
+
+def clinic_entry(place: dict, distance_km: float) -> dict:
+    """One clinic as returned to the frontend, with its open_now/closes_soon flags."""
+    return {
+        "id": place["id"],
+        "name": place["name"],
+        "address": place["address"],
+        "phone": place["phone"],
+        "distance": round(distance_km, 1),
+        **opening_hours.annotate(place),
+    }
+
+
+def _fetch_places(lat: float, lng: float, radius_km: float, limit: int, timeout: float = 10.0) -> dict:
+    """
+    One Geoapify Places request around a point. Returns {"status":
+    "success", "places": [...]} (possibly empty) with each place's lat/lng
+    kept for re-ranking, or an error status. Never raises.
+    """
+    # Rounded to ~1 m so identical lookups coalesce; the radius gets 2 m
+    # extra to make up for it (_rank() still filters by exact distance).
+    lat, lng = round(lat, 5), round(lng, 5)
+    return _request_places(
+        f"circle:{lng},{lat},{int(math.ceil(radius_km * 1000)) + 2}",
+        limit,
+        bias=f"proximity:{lng},{lat}",
+        timeout=timeout,
+    )
+
+
+def fetch_places_in_rect(lat_min: float, lng_min: float, lat_max: float, lng_max: float,
+                         limit: int, offset: int = 0) -> dict:
+    """One page of clinics inside a lat/lng rectangle (bulk snapshots, see clinic_index.py)."""
+    return _request_places(f"rect:{lng_min},{lat_min},{lng_max},{lat_max}", limit,
+                           offset=offset, kind=geoapify_quota.BULK)
+
+
+@singleflight("geoapify_places", key=lambda place_filter, limit, bias=None, offset=0, kind=None, timeout=10.0:
+              (place_filter, limit, bias, offset),
+              wait=lambda place_filter, limit, bias=None, offset=0, kind=None, timeout=10.0: timeout,
+              on_timeout=_timed_out)
+def _request_places(place_filter: str, limit: int, bias: Optional[str] = None, offset: int = 0,
+                    kind: str = geoapify_quota.CLINIC, timeout: float = 10.0) -> dict:
     """
-    Returns {"status": "success", "clinics": [...]} on success, or a clear
-    error status otherwise. Never raises -- the caller (main.py) always gets
-    a usable dict back, so a missing API key or a Geoapify outage can't
-    crash or hang the request; it returns an error status the frontend
-    already knows how to display gracefully.
+    The one place a Places request is made. Concurrent identical requests
+    (same tile centre, or the same patient position to ~1 m) share one
+    upstream call -- see singleflight.py. kind is the quota class the
+    request is charged to (geoapify_quota.py); timeout caps the request
+    (at most 10 s).
     """
     api_key = os.environ.get("GEOAPIFY_API_KEY")
     if not api_key:
         return {"status": "error", "reason": "GEOAPIFY_API_KEY not set"}
+    if not _breaker.allow():
+        return {"status": "error", "reason": "Geoapify unavailable (circuit open)"}
+    if not geoapify_quota.acquire(kind):
+        _breaker.release()
+        return {"status": "error", "reason": "Clinic search is busy -- Geoapify quota, try again shortly"}
 
     params = {
         "categories": CATEGORY,
-        "filter": f"circle:{lng},{lat},25000",
-        "bias": f"proximity:{lng},{lat}",
-        "limit": 5,
+        "filter": place_filter,
+        "limit": limit,
         "apiKey": api_key,
     }
+    if bias:
+        params["bias"] = bias
+    if offset:
+        params["offset"] = offset
 
+    started = time.perf_counter()
     try:
-        with httpx.Client(timeout=10.0) as client:
-            res = client.get(PLACES_URL, params=params)
-            res.raise_for_status()
-            data = res.json()
+        res = http_client.get(PLACES_URL, params=params, timeout=min(timeout, 10.0))
+        res.raise_for_status()
+        data = res.json()
 
-        features = data.get("features", [])
-        if not features:
-            return {"status": "no_results"}
-
-        clinics = []
-        for feature in features:
+        places = []
+        for feature in data.get("features", []):
             props = feature.get("properties", {})
             clinic_lat = props.get("lat")
             clinic_lng = props.get("lon")
             if clinic_lat is None or clinic_lng is None:
                 continue
-            clinics.append({
+            places.append({
                 "id": props.get("place_id"),
                 "name": props.get("name") or "Walk-in Clinic (name not listed)",
                 "address": props.get("formatted"),
                 "phone": _extract_phone(props),
-                "distance": round(_distance_km(lat, lng, clinic_lat, clinic_lng), 1),
+                "opening_hours": _extract_opening_hours(props),
+                "lat": clinic_lat,
+                "lng": clinic_lng,
             })
-
-        clinics.sort(key=lambda c: c["distance"])
-
-        if not clinics:
-            return {"status": "no_results"}
-        return {"status": "success", "clinics": clinics}
+        _breaker.record_success(time.perf_counter() - started)
+        return {"status": "success", "places": places}
 
     except httpx.TimeoutException:
+        _breaker.record_failure()
         return {"status": "error", "reason": "Geoapify API timed out"}
     except Exception as e:
+        _breaker.record_failure()
         print(f"[walkin_clinics] find_nearby_walkin_clinics failed: {e}")
-        return {"status": "error", "reason": str(e)}
\ No newline at end of file
+        return {"status": "error", "reason": str(e)}
+    finally:
+        _upstream_latency.observe(time.perf_counter() - started)